@@ -0,0 +1,86 @@
+"""
+Per-upload latency: a new boto3 S3 client per upload (old upload_to_s3 /
+FotoResep delete behaviour) versus one shared, pooled client
+(storage_backends.get_s3_client).
+
+Run against a local S3 stand-in, e.g.:
+
+    pip install "moto[server]"
+    moto_server -p 5000 &
+    python benchmarks/bench_s3_client.py --endpoint-url http://127.0.0.1:5000
+
+or MinIO with its own credentials via --access-key/--secret-key.
+"""
+import argparse
+import io
+import statistics
+import time
+import uuid
+
+import boto3
+from botocore.config import Config
+
+
+def make_client(args, pooled):
+    kwargs = dict(
+        aws_access_key_id=args.access_key,
+        aws_secret_access_key=args.secret_key,
+        region_name=args.region,
+        endpoint_url=args.endpoint_url,
+    )
+    if pooled:
+        kwargs['config'] = Config(max_pool_connections=20, tcp_keepalive=True, retries={'mode': 'standard'})
+    return boto3.client('s3', **kwargs)
+
+
+def upload(client, args, payload):
+    client.upload_fileobj(
+        io.BytesIO(payload),
+        args.bucket,
+        f'bench/{uuid.uuid4().hex}.jpg',
+        ExtraArgs={'ContentType': 'image/jpeg'},
+    )
+
+
+def run(label, args, payload, client_factory):
+    # Warm-up outside the measurement
+    upload(client_factory(), args, payload)
+
+    timings = []
+    for _ in range(args.iterations):
+        start = time.perf_counter()
+        upload(client_factory(), args, payload)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    timings.sort()
+    p95 = timings[max(int(len(timings) * 0.95) - 1, 0)]
+    print(f'{label:<28} mean {statistics.mean(timings):7.2f} ms   '
+          f'p50 {statistics.median(timings):7.2f} ms   p95 {p95:7.2f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--endpoint-url', required=True)
+    parser.add_argument('--bucket', default='bench-bucket')
+    parser.add_argument('--region', default='ap-southeast-1')
+    parser.add_argument('--access-key', default='testing')
+    parser.add_argument('--secret-key', default='testing')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--size-kb', type=int, default=200)
+    args = parser.parse_args()
+
+    payload = b'\xff\xd8\xff' + b'\0' * (args.size_kb * 1024 - 3)
+
+    setup = make_client(args, pooled=True)
+    try:
+        setup.create_bucket(Bucket=args.bucket, CreateBucketConfiguration={'LocationConstraint': args.region})
+    except setup.exceptions.BucketAlreadyOwnedByYou:
+        pass
+
+    shared = make_client(args, pooled=True)
+    run('new client per upload', args, payload, lambda: make_client(args, pooled=False))
+    run('shared pooled client', args, payload, lambda: shared)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 from pathlib import Path
 from decouple import config
 import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -22,6 +23,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.gis',  # Untuk GeoDjango
+    'django.contrib.postgres',  # Trigram lookups (pencarian bahan)
     
     # Third party apps
     'rest_framework',
@@ -115,6 +117,16 @@ AWS_SECRET_ACCESS_KEY = config('AWS_SECRET_ACCESS_KEY', default=None)
 AWS_STORAGE_BUCKET_NAME = 'cdn.ruangbumi.com'
 AWS_S3_PREFIX = 'dhaharan.id.ruangbumi.com'
 AWS_S3_REGION_NAME = 'ap-southeast-1'
+# Point at a local S3 stand-in (MinIO, moto) for development/benchmarks
+AWS_S3_ENDPOINT_URL = config('AWS_S3_ENDPOINT_URL', default=None)
+# Size of the shared S3 client's HTTP connection pool (>= gunicorn threads)
+AWS_S3_MAX_POOL_CONNECTIONS = config('AWS_S3_MAX_POOL_CONNECTIONS', default=20, cast=int)
+# Part size for streamed multipart uploads (S3 minimum is 5MB); bounds memory per upload
+AWS_S3_UPLOAD_PART_SIZE = config('AWS_S3_UPLOAD_PART_SIZE', default=5 * 1024 * 1024, cast=int)
+# In-process cache of head_object results behind S3Storage.exists()/size()
+AWS_S3_METADATA_CACHE_MAX_ENTRIES = config('AWS_S3_METADATA_CACHE_MAX_ENTRIES', default=10000, cast=int)
+AWS_S3_METADATA_CACHE_TIMEOUT = config('AWS_S3_METADATA_CACHE_TIMEOUT', default=300, cast=int)
+AWS_S3_METADATA_CACHE_MISSING_TIMEOUT = config('AWS_S3_METADATA_CACHE_MISSING_TIMEOUT', default=30, cast=int)
 AWS_S3_CUSTOM_DOMAIN = f'{AWS_STORAGE_BUCKET_NAME}'
 AWS_S3_OBJECT_PARAMETERS = {
     'CacheControl': 'max-age=86400',
@@ -126,6 +138,71 @@ if AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY:
 else:
     DEFAULT_FILE_STORAGE = 'django.core.files.storage.FileSystemStorage'
 
+# Cache
+# Vector tiles and API responses use file caches by default, so every
+# gunicorn worker and background thread in a container shares the entries
+# and the signal-driven invalidations without a cache server. The default
+# location is the temp dir, which on Cloud Run is an in-memory filesystem:
+# cached bytes count against the instance memory limit (size MAX_ENTRIES
+# accordingly). Invalidations do not reach other containers, where TIMEOUT
+# bounds staleness; point *_CACHE_BACKEND/*_CACHE_LOCATION at Redis or
+# Memcached once several instances serve traffic.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'tiles': {
+        'BACKEND': config(
+            'TILE_CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache',
+        ),
+        'LOCATION': config(
+            'TILE_CACHE_LOCATION',
+            default=os.path.join(tempfile.gettempdir(), 'dhaharan-tile-cache'),
+        ),
+        'TIMEOUT': config('TILE_CACHE_TIMEOUT', default=600, cast=int),
+        'OPTIONS': {
+            'MAX_ENTRIES': config('TILE_CACHE_MAX_ENTRIES', default=5000, cast=int),
+        },
+    },
+    'responses': {
+        'BACKEND': config(
+            'RESPONSE_CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache',
+        ),
+        'LOCATION': config(
+            'RESPONSE_CACHE_LOCATION',
+            default=os.path.join(tempfile.gettempdir(), 'dhaharan-response-cache'),
+        ),
+        'TIMEOUT': config('RESPONSE_CACHE_TIMEOUT', default=300, cast=int),
+        'OPTIONS': {
+            'MAX_ENTRIES': config('RESPONSE_CACHE_MAX_ENTRIES', default=2000, cast=int),
+        },
+    },
+}
+
+KEGIATAN_TILE_MAX_ZOOM = 22
+
+# Run the daily kegiatan status roll-over in a background thread of the web
+# process (started from config/wsgi.py). On by default so single-container
+# deployments (Cloud Run) roll over without extra setup; turn off where
+# `manage.py auto_complete_kegiatan --loop` runs as its own process
+# (docker-compose `scheduler` service).
+KEGIATAN_SCHEDULER_ENABLED = config('KEGIATAN_SCHEDULER_ENABLED', default=True, cast=bool)
+
+# Drain the storage outbox (queued S3 deletes, expired unattached uploads)
+# in a background thread of every web worker, like the scheduler above.
+# Turn off where `manage.py process_storage_outbox --loop` runs as its own
+# process (docker-compose `outbox_worker` service). On Cloud Run, deletes
+# only make progress while the instance has CPU: use "CPU always allocated"
+# or keep the worker command running elsewhere.
+STORAGE_OUTBOX_WORKER_ENABLED = config('STORAGE_OUTBOX_WORKER_ENABLED', default=True, cast=bool)
+
+# Same for photo variants and metadata (`manage.py generate_image_variants
+# --loop`, docker-compose `image_worker` service). Each web worker process
+# decodes at most one image at a time.
+IMAGE_WORKER_ENABLED = config('IMAGE_WORKER_ENABLED', default=True, cast=bool)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -14,3 +14,24 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+# Background work for deployments without worker processes: the daily
+# kegiatan status roll-over (catch-up on start, then every Jakarta
+# midnight), the storage outbox and photo variants. Started here rather
+# than in AppConfig.ready() so one-off manage.py commands don't spawn them.
+from django.conf import settings  # noqa: E402
+
+if settings.KEGIATAN_SCHEDULER_ENABLED:
+    from dhaharan.tasks import start_auto_complete_scheduler
+
+    start_auto_complete_scheduler()
+
+if settings.STORAGE_OUTBOX_WORKER_ENABLED:
+    from dhaharan.tasks import start_storage_outbox_worker
+
+    start_storage_outbox_worker()
+
+if settings.IMAGE_WORKER_ENABLED:
+    from dhaharan.tasks import start_image_worker
+
+    start_image_worker()
@@ -1,9 +1,11 @@
 from django.contrib import admin
 from django.contrib.gis.admin import GISModelAdmin
+from django.utils import timezone
+from . import response_cache
 from .models import (
     JenisKegiatan, StatusKegiatan, Kegiatan, FotoKegiatan, Volunteer,
     Resep, BahanResep, StepsResep, TipsResep, NutrisiResep, FotoResep,
-    TipeTransaksi, Transaksi, Pengurus
+    TipeTransaksi, Transaksi, Pengurus, StorageOutbox, StoredObject
 )
 
 
@@ -42,7 +44,9 @@ class VolunteerAdmin(admin.ModelAdmin):
     actions = ['approve_volunteers']
     
     def approve_volunteers(self, request, queryset):
-        queryset.update(is_approved=True)
+        # .update() skips auto_now and signals: keep ETags and cached responses in step
+        queryset.update(is_approved=True, updated_at=timezone.now())
+        response_cache.invalidate_all('volunteer')
     approve_volunteers.short_description = "Approve selected volunteers"
 
 
@@ -108,4 +112,15 @@ class PengurusAdmin(admin.ModelAdmin):
     search_fields = ['nama', 'jabatan']
 
 
+@admin.register(StorageOutbox)
+class StorageOutboxAdmin(admin.ModelAdmin):
+    list_display = ['id', 'key', 'attempts', 'next_attempt_at', 'created_at']
+    search_fields = ['key', 'last_error']
+    readonly_fields = ['created_at', 'updated_at']
 
+
+@admin.register(StoredObject)
+class StoredObjectAdmin(admin.ModelAdmin):
+    list_display = ['id', 'key', 'size', 'ref_count', 'pending_count', 'created_at']
+    search_fields = ['key', 'sha256']
+    readonly_fields = ['created_at', 'updated_at']
@@ -5,3 +5,6 @@ class DhaharanConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'dhaharan'
     verbose_name = 'Dhaharan Management'
+
+    def ready(self):
+        from . import signals  # noqa: F401
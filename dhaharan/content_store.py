@@ -0,0 +1,148 @@
+"""
+Content-addressed storage for uploaded images.
+
+Streamed uploads carry the SHA-256 of their bytes (see upload_handlers) and
+are placed at <prefix>/content/<sha256>.<ext>. StoredObject keeps one row per
+object with the number of rows (FotoKegiatan, FotoResep, Pengurus) that
+reference it: a duplicate upload reuses the existing object, and the object
+and its variants are only queued for deletion when the last reference goes.
+
+An upload is not attached to a row yet when it is stored, so store_staged()
+takes a provisional reference (pending_count, valid until pending_until).
+The first acquire() turns it into a real one; provisional references that
+are never claimed are dropped by expire_pending(). Until then the object
+cannot be deleted under a client that is about to attach it.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import images, outbox
+from .models import StorageOutbox, StoredObject
+from .storage_backends import get_s3_client
+from .upload_handlers import CONTENT_TYPE_EXTENSIONS
+
+CONTENT_FOLDER = 'content'
+
+# How long an upload may stay unattached (covers the presign/confirm window)
+PENDING_TTL = timedelta(hours=24)
+
+
+def content_prefix():
+    return f"{settings.AWS_S3_PREFIX}/{CONTENT_FOLDER}/"
+
+
+def content_key(sha256, content_type):
+    ext = CONTENT_TYPE_EXTENSIONS.get(content_type, 'jpg')
+    return f"{content_prefix()}{sha256}.{ext}"
+
+
+def is_content_key(key):
+    return bool(key) and key.startswith(content_prefix())
+
+
+def store_staged(uploaded):
+    """
+    Move a streamed upload (S3UploadedFile with sha256) to its
+    content-addressed key. Returns (key, created); created is False when an
+    identical object was already stored, in which case nothing is copied.
+    Either way the object gets a provisional reference for the row the
+    upload will be attached to. The staging object is queued for deletion.
+    """
+    s3_key = content_key(uploaded.sha256, uploaded.content_type)
+    pending_until = timezone.now() + PENDING_TTL
+    with transaction.atomic():
+        stored, created = StoredObject.objects.select_for_update().get_or_create(
+            sha256=uploaded.sha256,
+            defaults={
+                'key': s3_key, 'size': uploaded.size, 'content_type': uploaded.content_type,
+                'pending_count': 1, 'pending_until': pending_until,
+            },
+        )
+        if created:
+            # An earlier copy and its variants may still be queued for
+            # deletion: cancel them (waits for a worker that already claimed
+            # them) before copying
+            StorageOutbox.objects.filter(key__in=[stored.key] + images.all_variant_keys(stored.key)).delete()
+            bucket_name = settings.AWS_STORAGE_BUCKET_NAME
+            get_s3_client().copy_object(
+                Bucket=bucket_name,
+                Key=stored.key,
+                CopySource={'Bucket': bucket_name, 'Key': uploaded.s3_key},
+                ContentType=uploaded.content_type,
+                MetadataDirective='REPLACE',
+            )
+        else:
+            stored.pending_count += 1
+            stored.pending_until = pending_until
+            stored.save(update_fields=['pending_count', 'pending_until', 'updated_at'])
+        outbox.enqueue_keys([uploaded.s3_key])
+    return stored.key, created
+
+
+def acquire(key):
+    """
+    Count one more row referencing ``key`` (no-op for other keys),
+    claiming a provisional reference from store_staged() if there is one.
+    """
+    if not is_content_key(key):
+        return
+    with transaction.atomic():
+        stored = StoredObject.objects.select_for_update().filter(key=key).first()
+        if stored is None:
+            return
+        if stored.pending_count:
+            stored.pending_count -= 1
+        stored.ref_count += 1
+        stored.save(update_fields=['ref_count', 'pending_count', 'updated_at'])
+
+
+def _delete(stored):
+    stored.delete()
+    outbox.enqueue_keys([stored.key] + images.all_variant_keys(stored.key))
+
+
+def release(key):
+    """
+    Drop one reference to ``key``. When no reference (real or provisional)
+    is left, the object and every variant derived from it are queued in the
+    storage outbox.
+    Returns False if ``key`` is not content-addressed (caller deletes it).
+    """
+    if not is_content_key(key):
+        return False
+    with transaction.atomic():
+        stored = StoredObject.objects.select_for_update().filter(key=key).first()
+        if stored is None:
+            # Not tracked: leave it to reconcile_s3_objects rather than guess
+            return True
+        if stored.ref_count <= 1 and not stored.pending_count:
+            _delete(stored)
+        else:
+            stored.ref_count = max(stored.ref_count - 1, 0)
+            stored.save(update_fields=['ref_count', 'updated_at'])
+    return True
+
+
+def expire_pending(now=None):
+    """
+    Drop provisional references older than PENDING_TTL (uploads that were
+    never attached); objects left without references are queued for
+    deletion. Returns the number of objects queued.
+    """
+    now = now or timezone.now()
+    deleted = 0
+    with transaction.atomic():
+        expired = StoredObject.objects.select_for_update(skip_locked=True).filter(
+            pending_count__gt=0, pending_until__lte=now,
+        )
+        for stored in expired:
+            if stored.ref_count == 0:
+                _delete(stored)
+                deleted += 1
+            else:
+                stored.pending_count = 0
+                stored.save(update_fields=['pending_count', 'updated_at'])
+    return deleted
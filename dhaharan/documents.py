@@ -0,0 +1,101 @@
+"""
+Materialized recipe documents.
+
+ResepDokumen holds the full ResepSerializer output of each recipe, rebuilt
+in the same transaction as every write to the recipe or its children
+(signals, nested writes). Retrieve then serves it with one primary-key
+lookup instead of querying six tables.
+
+Inside deferred_rebuild() rebuilds are collected and run once on exit, so a
+nested write that touches 30 rows rebuilds the document once.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Prefetch
+
+from .models import FotoResep, Resep, ResepDokumen
+
+_state = threading.local()
+
+
+def _pending():
+    return getattr(_state, 'pending', None)
+
+
+def build(resep):
+    """Document data for a Resep with its children prefetched."""
+    # Imported here: serializers -> nested -> signals -> documents
+    from .serializers import ResepSerializer
+
+    return ResepSerializer(resep).data
+
+
+def rebuild_now(resep_ids):
+    """
+    Rebuild (or create) the documents of ``resep_ids``; returns how many.
+    The Resep rows are locked before the children are read: a concurrent
+    write to the same recipe (which locks it through touch_parent or its
+    own rebuild) commits first, so an older snapshot never overwrites a
+    newer document.
+    """
+    resep_ids = set(resep_ids)
+    if not resep_ids:
+        return 0
+    # Locked in pk order so overlapping rebuilds cannot deadlock
+    queryset = Resep.objects.select_for_update().filter(pk__in=resep_ids).order_by('pk').prefetch_related(
+        'bahan', 'steps', 'tips', 'nutrisi', Prefetch('foto', queryset=FotoResep.objects.order_by('id')),
+    )
+    count = 0
+    with transaction.atomic():
+        for resep in queryset:
+            ResepDokumen.objects.update_or_create(resep=resep, defaults={'data': build(resep)})
+            count += 1
+    return count
+
+
+def rebuild(resep_ids):
+    """Rebuild now, or on leaving the enclosing deferred_rebuild() block."""
+    pending = _pending()
+    if pending is not None:
+        pending.update(resep_ids)
+    else:
+        rebuild_now(resep_ids)
+
+
+@contextmanager
+def deferred_rebuild():
+    """Collect rebuilds in this block and run them once at the end."""
+    if _pending() is not None:
+        # Nested block: the outermost one rebuilds
+        yield
+        return
+    _state.pending = set()
+    try:
+        yield
+        pending = _state.pending
+    finally:
+        _state.pending = None
+    rebuild_now(pending)
+
+
+def get(resep_id):
+    """Stored document data, building it on first access; None if no such recipe."""
+    data = ResepDokumen.objects.filter(resep_id=resep_id).values_list('data', flat=True).first()
+    if data is None and rebuild_now([resep_id]):
+        data = ResepDokumen.objects.filter(resep_id=resep_id).values_list('data', flat=True).first()
+    return data
+
+
+def rebuild_all(batch_size=200):
+    """Rebuild every document, ``batch_size`` recipes at a time."""
+    total, last_id = 0, 0
+    while True:
+        ids = list(
+            Resep.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return total
+        total += rebuild_now(ids)
+        last_id = ids[-1]
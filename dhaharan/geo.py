@@ -0,0 +1,162 @@
+"""
+Spatial query helpers for Kegiatan.lokasi (PointField, SRID 4326).
+
+Every filter here is expressed as a bounding-box test first so PostGIS can
+answer it from the GiST index that Django creates for the PointField.
+"""
+import math
+
+from django.contrib.gis.geos import Point, Polygon
+from django.db import connection
+
+SRID = 4326
+KM_PER_DEGREE_LAT = 111.32
+MAX_RADIUS_KM = 1000
+MAX_ZOOM = 22
+
+# Web Mercator world width in metres, and the on-screen size of one cluster
+# cell (a 256px tile is split into 4x4 cells).
+WORLD_WIDTH_M = 40075016.68557849
+CLUSTER_CELL_PX = 64
+
+CLUSTER_SQL = """
+WITH pts AS (
+    SELECT k.id, k.jumlah_peserta, k.jenis_kegiatan_id, k.lokasi,
+           floor(ST_X(ST_Transform(k.lokasi, 3857)) / %(cell)s) AS cx,
+           floor(ST_Y(ST_Transform(k.lokasi, 3857)) / %(cell)s) AS cy
+    FROM kegiatan k
+    WHERE k.lokasi && ST_MakeEnvelope(%(minx)s, %(miny)s, %(maxx)s, %(maxy)s, 4326)
+),
+clusters AS (
+    SELECT cx, cy,
+           COUNT(*) AS jumlah,
+           COALESCE(SUM(jumlah_peserta), 0) AS total_peserta,
+           ST_Centroid(ST_Collect(lokasi)) AS center,
+           CASE WHEN COUNT(*) = 1 THEN MIN(id) END AS kegiatan_id
+    FROM pts
+    GROUP BY cx, cy
+),
+per_jenis AS (
+    SELECT cx, cy, jenis_kegiatan_id, COUNT(*) AS jumlah
+    FROM pts
+    GROUP BY cx, cy, jenis_kegiatan_id
+),
+breakdown AS (
+    SELECT p.cx, p.cy,
+           json_agg(json_build_object(
+               'jenis_kegiatan', p.jenis_kegiatan_id,
+               'nama', jk.nama,
+               'jumlah', p.jumlah
+           ) ORDER BY p.jumlah DESC) AS per_jenis
+    FROM per_jenis p
+    JOIN jenis_kegiatan jk ON jk.id = p.jenis_kegiatan_id
+    GROUP BY p.cx, p.cy
+)
+SELECT ST_X(c.center), ST_Y(c.center), c.jumlah, c.total_peserta, b.per_jenis, c.kegiatan_id
+FROM clusters c
+JOIN breakdown b ON b.cx = c.cx AND b.cy = c.cy
+ORDER BY c.jumlah DESC
+"""
+
+
+def parse_bbox(value):
+    """
+    Parse "minx,miny,maxx,maxy" (lng/lat) into a Polygon.
+    Raises ValueError on malformed input.
+    """
+    try:
+        minx, miny, maxx, maxy = [float(v) for v in value.split(',')]
+    except (AttributeError, ValueError):
+        raise ValueError('bbox harus berformat minx,miny,maxx,maxy')
+
+    if minx > maxx or miny > maxy:
+        raise ValueError('bbox tidak valid: min harus lebih kecil dari max')
+    if not (-180 <= minx <= 180 and -180 <= maxx <= 180 and -90 <= miny <= 90 and -90 <= maxy <= 90):
+        raise ValueError('bbox di luar rentang koordinat WGS84')
+
+    bbox = Polygon.from_bbox((minx, miny, maxx, maxy))
+    bbox.srid = SRID
+    return bbox
+
+
+def parse_point(lat, lng):
+    """Build a WGS84 Point from lat/lng query params. Raises ValueError."""
+    try:
+        lat = float(lat)
+        lng = float(lng)
+    except (TypeError, ValueError):
+        raise ValueError('lat dan lng wajib diisi dengan angka')
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError('lat/lng di luar rentang koordinat WGS84')
+    return Point(lng, lat, srid=SRID)
+
+
+def parse_radius_km(value, default=10):
+    if value in (None, ''):
+        return float(default)
+    try:
+        radius_km = float(value)
+    except ValueError:
+        raise ValueError('radius_km harus berupa angka')
+    if not (0 < radius_km <= MAX_RADIUS_KM):
+        raise ValueError(f'radius_km harus di antara 0 dan {MAX_RADIUS_KM}')
+    return radius_km
+
+
+def radius_envelope(point, radius_km):
+    """
+    Degree-aligned rectangle that fully contains the circle of ``radius_km``
+    around ``point``. Used as an index-friendly pre-filter before the exact
+    spherical distance test.
+    """
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    cos_lat = max(math.cos(math.radians(point.y)), 0.01)
+    dlng = min(radius_km / (KM_PER_DEGREE_LAT * cos_lat), 180)
+
+    envelope = Polygon.from_bbox((
+        max(point.x - dlng, -180), max(point.y - dlat, -90),
+        min(point.x + dlng, 180), min(point.y + dlat, 90),
+    ))
+    envelope.srid = SRID
+    return envelope
+
+
+def parse_zoom(value):
+    try:
+        zoom = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('zoom wajib diisi dengan bilangan bulat')
+    if not (0 <= zoom <= MAX_ZOOM):
+        raise ValueError(f'zoom harus di antara 0 dan {MAX_ZOOM}')
+    return zoom
+
+
+def cluster_cell_size(zoom):
+    """Grid cell size in Web Mercator metres for a zoom level."""
+    return WORLD_WIDTH_M / (2 ** zoom) / (256 / CLUSTER_CELL_PX)
+
+
+def cluster_kegiatan(bbox, zoom):
+    """
+    Grid-cluster the kegiatan inside ``bbox`` in the database.
+    Returns one dict per non-empty cell, so the result size depends on the
+    viewport and zoom, not on the number of kegiatan.
+    """
+    minx, miny, maxx, maxy = bbox.extent
+    with connection.cursor() as cursor:
+        cursor.execute(CLUSTER_SQL, {
+            'cell': cluster_cell_size(zoom),
+            'minx': minx, 'miny': miny, 'maxx': maxx, 'maxy': maxy,
+        })
+        rows = cursor.fetchall()
+
+    return [
+        {
+            'lokasi': {'type': 'Point', 'coordinates': [lng, lat]},
+            'jumlah': jumlah,
+            'total_peserta': total_peserta,
+            'per_jenis': per_jenis,
+            'kegiatan_id': kegiatan_id,
+        }
+        for lng, lat, jumlah, total_peserta, per_jenis, kegiatan_id in rows
+    ]
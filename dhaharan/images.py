@@ -0,0 +1,300 @@
+"""
+Image derivative pipeline: fixed-width WebP and JPEG copies of uploaded
+photos, generated by a background worker (manage.py generate_image_variants).
+The same pass records the photo's dimensions, byte size and a tiny inline
+placeholder so clients can lay out galleries before any image loads.
+
+Variant keys are derived from the source key, so re-running is idempotent:
+the same object is simply overwritten.
+
+The worker runs in a thread of the web process (config/wsgi.py) unless
+IMAGE_WORKER_ENABLED is off, as in docker-compose where the image_worker
+service runs the command instead.
+"""
+import base64
+import io
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from PIL import Image, ImageOps
+
+from .models import FotoKegiatan, FotoResep, Pengurus
+from .storage_backends import S3Storage, get_s3_client, key_from_url, key_url
+
+VARIANT_WIDTHS = (320, 800, 1600)
+
+# format name -> (Pillow format, extension, content type, save options)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', 'webp', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+VARIANT_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Longest side of the inline blur placeholder
+PLACEHOLDER_SIZE = 16
+
+
+def variant_key(source_key, width, fmt):
+    base = source_key.rsplit('.', 1)[0]
+    return f"{base}_w{width}.{VARIANT_FORMATS[fmt][1]}"
+
+
+def all_variant_keys(source_key):
+    """Every variant key that can exist for ``source_key``."""
+    return [variant_key(source_key, width, fmt) for width in VARIANT_WIDTHS for fmt in VARIANT_FORMATS]
+
+
+def variant_keys(variants):
+    """All S3 keys referenced by a variants map."""
+    return [
+        key
+        for width, formats in (variants or {}).items()
+        if not width.startswith('_')
+        for key in formats.values()
+    ]
+
+
+def srcset(variants):
+    """Variants map with S3 keys turned into URLs, for the serializers."""
+    return {
+        width: {fmt: key_url(key) for fmt, key in formats.items()}
+        for width, formats in (variants or {}).items()
+        if not width.startswith('_')
+    }
+
+
+def _encode(image, fmt):
+    pil_format, _, _, options = VARIANT_FORMATS[fmt]
+    if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA', 'L'):
+        image = image.convert('RGBA')
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def load_source(source_key):
+    """Download ``source_key``; returns (bytes, upright Pillow image)."""
+    body = get_s3_client().get_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=source_key)['Body'].read()
+    with Image.open(io.BytesIO(body)) as original:
+        original = ImageOps.exif_transpose(original)
+        original.load()
+    return body, original
+
+
+def image_metadata(image, file_size):
+    """Dimensions, byte size and a base64 WebP placeholder of ``image``."""
+    preview = image.copy()
+    preview.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.LANCZOS)
+    if preview.mode not in ('RGB', 'RGBA'):
+        preview = preview.convert('RGBA' if 'A' in preview.getbands() else 'RGB')
+    buffer = io.BytesIO()
+    preview.save(buffer, 'WEBP', quality=40)
+    return {
+        'width': image.width,
+        'height': image.height,
+        'file_size': file_size,
+        'placeholder': 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii'),
+    }
+
+
+def generate_variants(source_key, original=None):
+    """
+    Write every width/format variant of ``source_key`` next to it and
+    return the variants map. Widths larger than the original are skipped
+    (an image narrower than the smallest width gets one copy at its own size).
+    Pass ``original`` when the image is already loaded.
+    """
+    s3_client = get_s3_client()
+    bucket_name = settings.AWS_STORAGE_BUCKET_NAME
+
+    if original is None:
+        _, original = load_source(source_key)
+
+    widths = [w for w in VARIANT_WIDTHS if w <= original.width] or [VARIANT_WIDTHS[0]]
+
+    variants = {}
+    for width in widths:
+        target_width = min(width, original.width)
+        if target_width == original.width:
+            resized = original
+        else:
+            height = max(round(original.height * target_width / original.width), 1)
+            resized = original.resize((target_width, height), Image.LANCZOS)
+
+        variants[str(width)] = {}
+        for fmt, (_, _, content_type, _) in VARIANT_FORMATS.items():
+            key = variant_key(source_key, width, fmt)
+            s3_client.put_object(
+                Bucket=bucket_name,
+                Key=key,
+                Body=_encode(resized, fmt),
+                ContentType=content_type,
+                CacheControl=VARIANT_CACHE_CONTROL,
+            )
+            variants[str(width)][fmt] = key
+    return variants
+
+
+def _foto_kegiatan_source(foto):
+    storage = foto.file_path.storage
+    if not foto.file_path or not isinstance(storage, S3Storage):
+        return None
+    return storage._get_s3_key(foto.file_path.name)
+
+
+def _url_source(url):
+    if not url:
+        return None
+    try:
+        return key_from_url(url)
+    except ValueError:
+        return None
+
+
+# model, variants field, source key getter, rows still waiting for variants
+TARGETS = [
+    (FotoKegiatan, 'variants', _foto_kegiatan_source, Q(variants={})),
+    (FotoResep, 'variants', lambda foto: _url_source(foto.file_path), Q(variants={})),
+    (
+        Pengurus, 'photo_variants', lambda pengurus: _url_source(pengurus.photo),
+        Q(photo_variants={}) & Q(photo__isnull=False) & ~Q(photo=''),
+    ),
+]
+
+
+SOURCE_KEYS = {model: get_source for model, _, get_source, _ in TARGETS}
+
+
+def source_key(instance):
+    """S3 key of the image a FotoKegiatan/FotoResep/Pengurus row points at."""
+    return SOURCE_KEYS[type(instance)](instance)
+
+
+# Models that also store width/height/file_size/placeholder
+METADATA_MODELS = (FotoKegiatan, FotoResep)
+METADATA_FIELDS = ['width', 'height', 'file_size', 'placeholder']
+
+
+# Marker held in the variants field while a worker generates them:
+# {"_claimed": <epoch seconds>}. A claim older than CLAIM_TIMEOUT belongs to
+# a worker that died mid-row and is taken over.
+CLAIM_KEY = '_claimed'
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+def _claim(model, field, pending):
+    """
+    Claim the next pending row. The row lock (SKIP LOCKED, so several
+    workers can run) is only held while the marker is written.
+    Returns (row, claim) or (None, None).
+    """
+    expired = int(time.time() - CLAIM_TIMEOUT.total_seconds())
+    with transaction.atomic():
+        obj = (
+            model.objects.select_for_update(skip_locked=True)
+            .filter(pending | Q(**{f'{field}__{CLAIM_KEY}__lt': expired}))
+            .order_by('id').first()
+        )
+        if obj is None:
+            return None, None
+        claim = {CLAIM_KEY: int(time.time())}
+        # No visible change (srcset skips "_" keys): no signals, no updated_at
+        model.objects.filter(pk=obj.pk).update(**{field: claim})
+    return obj, claim
+
+
+def _store_result(model, field, obj, claim, variants, metadata):
+    """
+    Save the outcome if the row still holds our claim; a row deleted,
+    pointed at another image or taken over meanwhile is left alone (S3
+    objects written for it are removed by reconcile_s3_objects).
+    Returns whether the result was saved.
+    """
+    with transaction.atomic():
+        row = model.objects.select_for_update().filter(pk=obj.pk, **{field: claim}).first()
+        if row is None:
+            return False
+        setattr(row, field, variants)
+        for name, value in metadata.items():
+            setattr(row, name, value)
+        # save() so post_save invalidates caches and touches the parent
+        row.save(update_fields=[field, 'updated_at'] + list(metadata))
+    return True
+
+
+def process_pending(batch_size=20):
+    """
+    Generate variants (and image metadata) for up to ``batch_size`` rows
+    that have none yet. Each row is claimed in a short transaction; the
+    download, encoding and uploads run outside of it. Failures are stored
+    as {"_error": ...} and skipped until reset (--retry-failed). Returns
+    the number of rows processed.
+    """
+    processed = 0
+    for model, field, get_source, pending in TARGETS:
+        while processed < batch_size:
+            obj, claim = _claim(model, field, pending)
+            if obj is None:
+                break
+            metadata = {}
+            try:
+                source = get_source(obj)
+                if source:
+                    body, original = load_source(source)
+                    # Before the variants, so dimensions survive a failed encode
+                    if model in METADATA_MODELS:
+                        metadata = image_metadata(original, len(body))
+                    variants = generate_variants(source, original)
+                else:
+                    variants = {'_error': 'No S3 source object'}
+            except Exception as e:
+                variants = {'_error': str(e)}
+            _store_result(model, field, obj, claim, variants, metadata)
+            processed += 1
+    return processed
+
+
+def backfill_metadata(batch_size=50, log=print):
+    """
+    Fill width/height/file_size/placeholder on existing photos, one pass
+    over the rows missing them (keyset on id). Returns (updated, failed).
+    """
+    updated = failed = 0
+    for model in METADATA_MODELS:
+        get_source = SOURCE_KEYS[model]
+        last_id = 0
+        while True:
+            batch = list(model.objects.filter(width__isnull=True, id__gt=last_id).order_by('id')[:batch_size])
+            if not batch:
+                break
+            for obj in batch:
+                last_id = obj.id
+                source = get_source(obj)
+                if not source:
+                    failed += 1
+                    continue
+                try:
+                    body, original = load_source(source)
+                    for name, value in image_metadata(original, len(body)).items():
+                        setattr(obj, name, value)
+                except Exception as e:
+                    log(f"{model.__name__} {obj.id}: {e}")
+                    failed += 1
+                    continue
+                obj.save(update_fields=METADATA_FIELDS + ['updated_at'])
+                updated += 1
+    return updated, failed
+
+
+def reset_failed():
+    """Mark failed rows as pending again."""
+    count = 0
+    for model, field, _, _ in TARGETS:
+        count += model.objects.filter(**{f'{field}__has_key': '_error'}).update(**{field: {}})
+    return count
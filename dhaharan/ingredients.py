@@ -0,0 +1,158 @@
+"""
+Ingredient name normalization for the "what can I cook" search.
+
+BahanResep.nama is free text ("2 siung bawang putih, cincang halus",
+"cabe rawit 5 bh"). normalize() reduces it to the ingredient itself
+("bawang putih", "cabai rawit"), which is stored in BahanResep.nama_normal
+and matched with pg_trgm so remaining spelling variants still hit.
+"""
+import re
+import unicodedata
+
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import documents, response_cache
+from .models import BahanResep, Resep
+
+# Max ingredients accepted in one search
+MAX_TERMS = 20
+
+# Quantities, units and preparation words that say nothing about the ingredient
+STOPWORDS = {
+    'secukupnya', 'sckpnya', 'sesuai', 'selera', 'sejumput', 'sedikit', 'agak',
+    'sdm', 'sdt', 'sdk', 'gr', 'gram', 'g', 'kg', 'ons', 'ml', 'liter', 'ltr', 'l', 'cc',
+    'buah', 'bh', 'siung', 'butir', 'btr', 'lembar', 'lbr', 'batang', 'btg', 'ruas',
+    'cm', 'potong', 'ptg', 'ikat', 'genggam', 'tangkai', 'bungkus', 'bks', 'sachet',
+    'gelas', 'cangkir', 'mangkuk', 'papan', 'kotak', 'ekor', 'kaleng', 'botol', 'keping',
+    'iris', 'diiris', 'irisan', 'cincang', 'dicincang', 'halus', 'haluskan', 'dihaluskan',
+    'geprek', 'digeprek', 'memarkan', 'dimemarkan', 'dipotong', 'serut',
+    'parut', 'diparut', 'tumis', 'rebus', 'direbus', 'kupas', 'dikupas', 'tipis', 'kasar',
+    'besar', 'kecil', 'sedang', 'segar', 'secukup', 'untuk', 'dan', 'atau', 'yang', 'dari',
+    'utuh', 'bersih', 'tambahan', 'pelengkap', 'opsional',
+}
+
+# Spelling variants and abbreviations -> canonical word(s)
+SYNONYMS = {
+    'cabe': 'cabai',
+    'cabay': 'cabai',
+    'lombok': 'cabai',
+    'bwg': 'bawang',
+    'bamer': 'bawang merah',
+    'baput': 'bawang putih',
+    'brambang': 'bawang merah',
+    'telor': 'telur',
+    'sereh': 'serai',
+    'sere': 'serai',
+    'merica': 'lada',
+    'laos': 'lengkuas',
+    'kunir': 'kunyit',
+    'santen': 'santan',
+    'penyedap': 'kaldu',
+    'masako': 'kaldu',
+    'royco': 'kaldu',
+    'micin': 'msg',
+    'vetsin': 'msg',
+}
+
+# Multi-word variants, applied after single words
+PHRASES = {
+    'gula jawa': 'gula merah',
+    'gula aren': 'gula merah',
+    'minyak sayur': 'minyak goreng',
+}
+
+_NUMBER = re.compile(r'\d+(?:[.,/]\d+)?')
+_PAREN = re.compile(r'\([^)]*\)')
+_NON_WORD = re.compile(r'[^a-z\s]')
+
+
+def _strip_accents(value):
+    return ''.join(
+        c for c in unicodedata.normalize('NFKD', value) if not unicodedata.combining(c)
+    )
+
+
+def normalize(nama):
+    """'2 siung Bawang Putih (cincang)' -> 'bawang putih'"""
+    value = _strip_accents((nama or '').lower())
+    value = _PAREN.sub(' ', value)
+    # Reduplication shorthand: cabe2 -> cabe
+    value = re.sub(r'([a-z])2\b', r'\1', value)
+    value = _NUMBER.sub(' ', value)
+    value = _NON_WORD.sub(' ', value)
+
+    words = []
+    for word in value.split():
+        if word in STOPWORDS:
+            continue
+        words.extend(SYNONYMS.get(word, word).split())
+
+    result = ' '.join(words)
+    for phrase, replacement in PHRASES.items():
+        result = re.sub(rf'\b{phrase}\b', replacement, result)
+    return result
+
+
+def parse_terms(value):
+    """Comma/semicolon separated user input -> distinct normalized terms."""
+    terms = []
+    for part in re.split(r'[,;\n]', value or ''):
+        term = normalize(part)
+        if term and term not in terms:
+            terms.append(term)
+    return terms[:MAX_TERMS]
+
+
+def refresh_jumlah_bahan(resep_ids):
+    """
+    Recount the cached Resep.jumlah_bahan of the given recipes. Only rows
+    whose count changed are written (with a new updated_at); returns how many.
+    """
+    count = Coalesce(Subquery(
+        BahanResep.objects.filter(resep=OuterRef('pk')).order_by()
+        .values('resep').annotate(n=Count('id')).values('n')
+    ), 0)
+    return Resep.objects.filter(pk__in=resep_ids).exclude(jumlah_bahan=count).update(
+        jumlah_bahan=count, updated_at=timezone.now()
+    )
+
+
+def rebuild_index(batch_size=2000):
+    """
+    Re-normalize every BahanResep.nama and recount jumlah_bahan (after
+    SYNONYMS change). Changed rows and their recipes get a new updated_at
+    (ETags), the recipe documents are rebuilt and the cached responses are
+    dropped.
+    """
+    updated, batch = 0, []
+    for bahan in BahanResep.objects.only('id', 'resep_id', 'nama', 'nama_normal').iterator(chunk_size=batch_size):
+        nama_normal = normalize(bahan.nama)
+        if nama_normal != bahan.nama_normal:
+            bahan.nama_normal = nama_normal
+            batch.append(bahan)
+        if len(batch) >= batch_size:
+            updated += _save_batch(batch)
+            batch = []
+    if batch:
+        updated += _save_batch(batch)
+
+    recounted = refresh_jumlah_bahan(Resep.objects.values('pk'))
+    if updated:
+        response_cache.invalidate_all('bahan-resep')
+    if updated or recounted:
+        response_cache.invalidate_all('resep')
+    return updated
+
+
+def _save_batch(batch):
+    now = timezone.now()
+    for bahan in batch:
+        bahan.updated_at = now
+    count = BahanResep.objects.bulk_update(batch, ['nama_normal', 'updated_at'])
+    resep_ids = {bahan.resep_id for bahan in batch}
+    Resep.objects.filter(pk__in=resep_ids).update(updated_at=now)
+    # The stored recipe documents render these columns
+    documents.rebuild(resep_ids)
+    return count
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from dhaharan.tasks import auto_complete_past_kegiatan, run_auto_complete_forever
+
+
+class Command(BaseCommand):
+    help = (
+        "Set status kegiatan yang tanggalnya sudah lewat menjadi 'Selesai'. "
+        "Runs once by default; use --loop to keep running and repeat at every "
+        "Asia/Jakarta midnight."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Run the catch-up now, then again every day at 00:00 Asia/Jakarta',
+        )
+
+    def handle(self, *args, **options):
+        if options['loop']:
+            run_auto_complete_forever(log=self.stdout.write)
+            return
+
+        try:
+            updated_count, current_date = auto_complete_past_kegiatan()
+        except Exception as e:
+            self.stderr.write(self.style.ERROR(f'Error auto-completing kegiatan: {e}'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'{updated_count} kegiatan diupdate ke status Selesai (tanggal {current_date})'
+        ))
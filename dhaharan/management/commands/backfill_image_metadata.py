@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from dhaharan.images import backfill_metadata
+
+
+class Command(BaseCommand):
+    help = 'Compute width/height/file size/placeholder for existing FotoKegiatan and FotoResep rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+
+    def handle(self, *args, **options):
+        updated, failed = backfill_metadata(
+            batch_size=options['batch_size'],
+            log=lambda message: self.stderr.write(self.style.WARNING(message)),
+        )
+        self.stdout.write(self.style.SUCCESS(f'Updated {updated} photos, {failed} failed'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from dhaharan.nutrition import backfill
+
+
+class Command(BaseCommand):
+    help = 'Parse NutrisiResep label/nilai into kunci/jumlah/satuan for every row'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        updated = backfill(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{updated} nutrisi rows updated'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from dhaharan.images import process_pending, reset_failed
+from dhaharan.tasks import run_image_variants_forever
+
+
+class Command(BaseCommand):
+    help = 'Generate resized WebP/JPEG variants for photos that do not have them yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new photos')
+        parser.add_argument('--interval', type=float, default=10.0, help='Seconds to sleep when nothing is pending')
+        parser.add_argument('--batch-size', type=int, default=20)
+        parser.add_argument('--retry-failed', action='store_true', help='Retry photos that failed before')
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            self.stdout.write(f'{reset_failed()} failed photos queued again')
+
+        if options['loop']:
+            run_image_variants_forever(
+                interval=options['interval'], batch_size=options['batch_size'], log=self.stdout.write,
+            )
+            return
+
+        while True:
+            try:
+                processed = process_pending(batch_size=options['batch_size'])
+            except Exception as e:
+                self.stderr.write(self.style.ERROR(f'Variant batch failed: {e}'))
+                return
+            if not processed:
+                return
+            self.stdout.write(f'Generated variants for {processed} photos')
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from dhaharan.storage_backends import DELETE_BATCH_SIZE, S3Storage
+from dhaharan.tasks import process_storage_outbox, run_storage_outbox_forever
+
+
+class Command(BaseCommand):
+    help = 'Delete queued S3 objects (StorageOutbox) in batches, retrying failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new work')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to sleep when the outbox is empty')
+        parser.add_argument('--batch-size', type=int, default=DELETE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        batch_size = min(options['batch_size'], DELETE_BATCH_SIZE)
+
+        if options['loop']:
+            run_storage_outbox_forever(
+                interval=options['interval'], batch_size=batch_size, log=self.stdout.write,
+            )
+            return
+
+        try:
+            expired, deleted, failed = process_storage_outbox(storage=S3Storage(), batch_size=batch_size)
+        except Exception as e:
+            self.stderr.write(self.style.ERROR(f'Outbox batch failed: {e}'))
+            return
+        self.stdout.write(
+            f'Queued {expired} unattached uploads, deleted {deleted} objects, {failed} failed (will retry)'
+        )
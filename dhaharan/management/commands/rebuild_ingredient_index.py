@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from dhaharan.ingredients import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Re-normalize BahanResep.nama_normal and recount Resep.jumlah_bahan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        updated = rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{updated} bahan re-normalized, ingredient counts refreshed'))
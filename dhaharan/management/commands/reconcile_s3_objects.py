@@ -0,0 +1,48 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from dhaharan.reconcile import reconcile
+from dhaharan.storage_backends import DELETE_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Report (or delete) S3 objects under AWS_S3_PREFIX that no database row references'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete', action='store_true', help='Delete the orphans (default: report only)')
+        parser.add_argument('--dry-run', action='store_true', help='Report only, even with --delete')
+        parser.add_argument('--batch-size', type=int, default=DELETE_BATCH_SIZE)
+        parser.add_argument(
+            '--min-age-hours', type=float, default=24.0,
+            help='Ignore objects newer than this (uploads still being attached)',
+        )
+        parser.add_argument('--prefix', default=None, help='Limit to a sub-prefix, e.g. <AWS_S3_PREFIX>/resep/')
+        parser.add_argument('--verbose-keys', action='store_true', help='Print every orphan key')
+
+    def handle(self, *args, **options):
+        delete = options['delete'] and not options['dry_run']
+
+        def on_batch(objects, errors):
+            if options['verbose_keys']:
+                for obj in objects:
+                    self.stdout.write(obj['Key'])
+            action = 'Deleted' if delete else 'Found'
+            self.stdout.write(f'{action} {len(objects) - len(errors)} orphaned objects')
+            for key, error in errors.items():
+                self.stderr.write(self.style.ERROR(f'{key}: {error}'))
+
+        count, size, failed = reconcile(
+            delete=delete,
+            min_age=timedelta(hours=options['min_age_hours']),
+            batch_size=options['batch_size'],
+            prefix=options['prefix'],
+            on_batch=on_batch,
+        )
+
+        summary = f'{count} orphaned objects ({size / (1024 * 1024):.1f} MB)'
+        if delete:
+            summary += f', {count - failed} deleted, {failed} failed'
+        else:
+            summary += ', nothing deleted (pass --delete to remove them)'
+        self.stdout.write(self.style.SUCCESS(summary))
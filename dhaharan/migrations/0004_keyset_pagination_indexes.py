@@ -0,0 +1,37 @@
+# Generated by Django 4.2.9 on 2026-10-18 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dhaharan', '0003_pengurus_photo_delete_fotopengurus'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='kegiatan',
+            options={'ordering': ['-tanggal', '-id'], 'verbose_name': 'Kegiatan', 'verbose_name_plural': 'Kegiatan'},
+        ),
+        migrations.AlterModelOptions(
+            name='resep',
+            options={'ordering': ['-created_at', '-id'], 'verbose_name': 'Resep', 'verbose_name_plural': 'Resep'},
+        ),
+        migrations.AlterModelOptions(
+            name='transaksi',
+            options={'ordering': ['-tanggal', '-id'], 'verbose_name': 'Transaksi', 'verbose_name_plural': 'Transaksi'},
+        ),
+        migrations.AddIndex(
+            model_name='kegiatan',
+            index=models.Index(fields=['-tanggal', '-id'], name='kegiatan_tanggal_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='resep',
+            index=models.Index(fields=['-created_at', '-id'], name='resep_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaksi',
+            index=models.Index(fields=['-tanggal', '-id'], name='transaksi_tanggal_id_idx'),
+        ),
+    ]
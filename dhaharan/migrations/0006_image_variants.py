@@ -0,0 +1,28 @@
+# Generated by Django 4.2.9 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dhaharan', '0005_storageoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fotokegiatan',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='fotoresep',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='pengurus',
+            name='photo_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
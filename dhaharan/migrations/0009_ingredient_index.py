@@ -0,0 +1,58 @@
+# Generated by Django 4.2.9 on 2026-10-18 16:00
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+from django.db.models import Count
+from django.utils import timezone
+
+
+def backfill(apps, schema_editor):
+    from dhaharan.ingredients import normalize
+
+    BahanResep = apps.get_model('dhaharan', 'BahanResep')
+    Resep = apps.get_model('dhaharan', 'Resep')
+
+    # New fields in the representation: move updated_at so ETags change
+    now = timezone.now()
+    batch = []
+    for bahan in BahanResep.objects.only('id', 'nama').iterator(chunk_size=2000):
+        bahan.nama_normal = normalize(bahan.nama)
+        bahan.updated_at = now
+        batch.append(bahan)
+        if len(batch) >= 2000:
+            BahanResep.objects.bulk_update(batch, ['nama_normal', 'updated_at'])
+            batch = []
+    if batch:
+        BahanResep.objects.bulk_update(batch, ['nama_normal', 'updated_at'])
+
+    for resep_id, jumlah in BahanResep.objects.values_list('resep').annotate(n=Count('id')).order_by():
+        Resep.objects.filter(pk=resep_id).update(jumlah_bahan=jumlah)
+    # jumlah_bahan is a new field of every recipe
+    Resep.objects.update(updated_at=now)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dhaharan', '0008_photo_metadata'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='resep',
+            name='jumlah_bahan',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='bahanresep',
+            name='nama_normal',
+            field=models.CharField(blank=True, default='', max_length=200),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='bahanresep',
+            index=GinIndex(fields=['nama_normal'], name='bahan_nama_normal_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.9 on 2026-10-18 17:00
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill(apps, schema_editor):
+    from dhaharan.nutrition import parse_nutrisi
+
+    NutrisiResep = apps.get_model('dhaharan', 'NutrisiResep')
+    Resep = apps.get_model('dhaharan', 'Resep')
+
+    # New fields in the representation: move updated_at so ETags change
+    now = timezone.now()
+    fields = ['kunci', 'jumlah', 'satuan', 'updated_at']
+    batch = []
+    for nutrisi in NutrisiResep.objects.only('id', 'label', 'nilai').iterator(chunk_size=1000):
+        nutrisi.kunci, nutrisi.jumlah, nutrisi.satuan = parse_nutrisi(nutrisi.label, nutrisi.nilai)
+        nutrisi.updated_at = now
+        batch.append(nutrisi)
+        if len(batch) >= 1000:
+            NutrisiResep.objects.bulk_update(batch, fields)
+            batch = []
+    if batch:
+        NutrisiResep.objects.bulk_update(batch, fields)
+    Resep.objects.filter(pk__in=NutrisiResep.objects.values('resep')).update(updated_at=now)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dhaharan', '0009_ingredient_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nutrisiresep',
+            name='kunci',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='nutrisiresep',
+            name='jumlah',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='nutrisiresep',
+            name='satuan',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='nutrisiresep',
+            index=models.Index(fields=['kunci', 'jumlah', 'resep'], name='nutrisi_kunci_jumlah_idx'),
+        ),
+    ]
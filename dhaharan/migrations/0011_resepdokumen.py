@@ -0,0 +1,27 @@
+# Generated by Django 4.2.9 on 2026-10-18 18:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dhaharan', '0010_nutrisi_structured'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResepDokumen',
+            fields=[
+                ('resep', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='dokumen', serialize=False, to='dhaharan.resep')),
+                ('data', models.JSONField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Resep Dokumen',
+                'verbose_name_plural': 'Resep Dokumen',
+                'db_table': 'resep_dokumen',
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.9 on 2026-10-19 09:00
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def mark_unattached(apps, schema_editor):
+    # Objects stored but never attached so far: give them the usual grace
+    # period, after which expire_pending() queues them for deletion
+    StoredObject = apps.get_model('dhaharan', 'StoredObject')
+    StoredObject.objects.filter(ref_count=0).update(
+        pending_count=1, pending_until=timezone.now() + timedelta(hours=24),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dhaharan', '0011_resepdokumen'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storedobject',
+            name='pending_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='storedobject',
+            name='pending_until',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(mark_unattached, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,7 @@
 from django.contrib.gis.db import models as gis_models
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
+from django.utils import timezone
 
 
 class JenisKegiatan(models.Model):
@@ -47,7 +49,11 @@ class Kegiatan(models.Model):
         db_table = 'kegiatan'
         verbose_name = 'Kegiatan'
         verbose_name_plural = 'Kegiatan'
-        ordering = ['-tanggal']
+        ordering = ['-tanggal', '-id']
+        indexes = [
+            # Keyset pagination (see KeysetPagination)
+            models.Index(fields=['-tanggal', '-id'], name='kegiatan_tanggal_id_idx'),
+        ]
 
     def __str__(self):
         return self.nama
@@ -57,6 +63,13 @@ class FotoKegiatan(models.Model):
     kegiatan = models.ForeignKey(Kegiatan, on_delete=models.CASCADE, related_name='foto')
     file_path = models.ImageField(upload_to='kegiatan/')
     file_name = models.CharField(max_length=255)
+    # Resized WebP/JPEG copies: {"320": {"webp": <s3 key>, "jpeg": <s3 key>}, ...}
+    variants = models.JSONField(default=dict, blank=True)
+    # Filled by the image worker (or backfill_image_metadata); null until then
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    file_size = models.PositiveBigIntegerField(null=True, blank=True)
+    placeholder = models.TextField(blank=True, default='')  # 16px WebP data URI
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -111,6 +124,8 @@ class Resep(models.Model):
     waktu_persiapan = models.IntegerField(help_text='Waktu dalam menit')
     porsi = models.IntegerField()
     kalori = models.IntegerField()
+    # Number of BahanResep rows, kept by signals (ingredient-match ranking)
+    jumlah_bahan = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -118,7 +133,11 @@ class Resep(models.Model):
         db_table = 'resep'
         verbose_name = 'Resep'
         verbose_name_plural = 'Resep'
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
+        indexes = [
+            # Keyset pagination (see KeysetPagination)
+            models.Index(fields=['-created_at', '-id'], name='resep_created_id_idx'),
+        ]
 
     def __str__(self):
         return self.judul
@@ -128,6 +147,8 @@ class BahanResep(models.Model):
     resep = models.ForeignKey(Resep, on_delete=models.CASCADE, related_name='bahan')
     nama = models.CharField(max_length=200)
     takaran = models.CharField(max_length=100)
+    # ingredients.normalize(nama), set on save; trigram-indexed for search
+    nama_normal = models.CharField(max_length=200, blank=True, default='')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -135,6 +156,9 @@ class BahanResep(models.Model):
         db_table = 'bahan_resep'
         verbose_name = 'Bahan Resep'
         verbose_name_plural = 'Bahan Resep'
+        indexes = [
+            GinIndex(fields=['nama_normal'], opclasses=['gin_trgm_ops'], name='bahan_nama_normal_trgm'),
+        ]
 
     def __str__(self):
         return f"{self.nama} - {self.resep.judul}"
@@ -178,6 +202,10 @@ class NutrisiResep(models.Model):
     label = models.CharField(max_length=100)
     nilai = models.CharField(max_length=100)
     resep = models.ForeignKey(Resep, on_delete=models.CASCADE, related_name='nutrisi')
+    # Parsed from label/nilai on save (nutrition.parse_nutrisi): 'protein', 15.00, 'g'
+    kunci = models.CharField(max_length=50, blank=True, default='')
+    jumlah = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    satuan = models.CharField(max_length=20, blank=True, default='')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -185,6 +213,10 @@ class NutrisiResep(models.Model):
         db_table = 'nutrisi_resep'
         verbose_name = 'Nutrisi Resep'
         verbose_name_plural = 'Nutrisi Resep'
+        indexes = [
+            # ?protein_min=...: range on (kunci, jumlah), resep_id for the EXISTS
+            models.Index(fields=['kunci', 'jumlah', 'resep'], name='nutrisi_kunci_jumlah_idx'),
+        ]
 
     def __str__(self):
         return f"{self.label} - {self.resep.judul}"
@@ -217,7 +249,11 @@ class Transaksi(models.Model):
         db_table = 'transaksi'
         verbose_name = 'Transaksi'
         verbose_name_plural = 'Transaksi'
-        ordering = ['-tanggal']
+        ordering = ['-tanggal', '-id']
+        indexes = [
+            # Keyset pagination (see KeysetPagination)
+            models.Index(fields=['-tanggal', '-id'], name='transaksi_tanggal_id_idx'),
+        ]
 
     def __str__(self):
         return self.nama
@@ -227,6 +263,7 @@ class Pengurus(models.Model):
     nama = models.CharField(max_length=200)
     jabatan = models.CharField(max_length=100)
     photo = models.CharField(max_length=500, blank=True, null=True)  # URL from S3
+    photo_variants = models.JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -243,6 +280,12 @@ class FotoResep(models.Model):
     resep = models.ForeignKey(Resep, on_delete=models.CASCADE, related_name='foto')
     file_path = models.CharField(max_length=500)  # Changed from ImageField to CharField for S3 URLs
     file_name = models.CharField(max_length=255)
+    variants = models.JSONField(default=dict, blank=True)
+    # Image metadata, see FotoKegiatan
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    file_size = models.PositiveBigIntegerField(null=True, blank=True)
+    placeholder = models.TextField(blank=True, default='')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -253,3 +296,68 @@ class FotoResep(models.Model):
 
     def __str__(self):
         return f"{self.resep.judul} - {self.file_name}"
+
+
+class ResepDokumen(models.Model):
+    """
+    Full ResepSerializer output of a recipe, rebuilt on every write to the
+    recipe or its children (see documents.py). Served by retrieve as is.
+    """
+    resep = models.OneToOneField(Resep, on_delete=models.CASCADE, primary_key=True, related_name='dokumen')
+    data = models.JSONField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'resep_dokumen'
+        verbose_name = 'Resep Dokumen'
+        verbose_name_plural = 'Resep Dokumen'
+
+    def __str__(self):
+        return f"Dokumen {self.resep_id}"
+
+
+class StorageOutbox(models.Model):
+    """
+    Pending S3 object deletions, written in the same transaction as the row
+    that referenced the object and drained by `manage.py process_storage_outbox`.
+    """
+    key = models.CharField(max_length=1024)  # Full S3 key, prefix included
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now, db_index=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'storage_outbox'
+        verbose_name = 'Storage Outbox'
+        verbose_name_plural = 'Storage Outbox'
+
+    def __str__(self):
+        return self.key
+
+
+class StoredObject(models.Model):
+    """
+    Content-addressed S3 objects (<prefix>/content/<sha256>.<ext>) and how
+    many rows reference them. Identical uploads share one object; it is
+    deleted when the last referencing row goes away.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    key = models.CharField(max_length=1024, unique=True)  # Full S3 key, prefix included
+    size = models.PositiveBigIntegerField(default=0)
+    content_type = models.CharField(max_length=100, blank=True, default='')
+    ref_count = models.PositiveIntegerField(default=0)
+    # Uploads stored but not attached to a row yet (content_store.store_staged)
+    pending_count = models.PositiveIntegerField(default=0)
+    pending_until = models.DateTimeField(null=True, blank=True, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'stored_object'
+        verbose_name = 'Stored Object'
+        verbose_name_plural = 'Stored Objects'
+
+    def __str__(self):
+        return self.key
@@ -0,0 +1,93 @@
+"""
+Nested child writes for ResepSerializer (bahan, steps, tips, nutrisi, foto).
+
+Children are written with bulk_create / bulk_update and a filtered delete,
+diffed against the rows already stored, so a recipe with 40 children is a
+handful of queries instead of 40 requests. bulk_* skip model signals; the
+side effects they would have had (response cache, content references) are
+applied here, as are derived columns (BahanResep.nama_normal, the
+recipe's jumlah_bahan, NutrisiResep kunci/jumlah/satuan).
+"""
+from django.utils import timezone
+from rest_framework import serializers
+
+from . import content_store, images, ingredients, nutrition, response_cache
+from .models import BahanResep, FotoResep, NutrisiResep
+from .signals import RESOURCES
+
+
+def write_children(parent, relation, items):
+    """
+    Make ``parent.<relation>`` match ``items`` (validated child dicts).
+
+    Items with an ``id`` update that row (only if a value changed), items
+    without one are created, and stored rows missing from ``items`` are
+    deleted. Returns True if anything changed.
+    """
+    manager = getattr(parent, relation)
+    model = manager.model
+    fk_name = manager.field.name
+    existing = {obj.pk: obj for obj in manager.all()}
+
+    unknown = [item['id'] for item in items if 'id' in item and item['id'] not in existing]
+    if unknown:
+        raise serializers.ValidationError(
+            {relation: f'Unknown {relation} id(s) for this resep: {", ".join(map(str, unknown))}'}
+        )
+
+    to_create, to_update, changed_fields, kept = [], [], set(), set()
+    now = timezone.now()
+    for item in items:
+        values = {name: value for name, value in item.items() if name != 'id'}
+        if 'id' not in item:
+            obj = model(**values, **{fk_name: parent})
+            if model is BahanResep:
+                obj.nama_normal = ingredients.normalize(obj.nama)
+            elif model is NutrisiResep:
+                nutrition.apply(obj)
+            to_create.append(obj)
+            continue
+
+        obj = existing[item['id']]
+        kept.add(obj.pk)
+        changed = [name for name, value in values.items() if getattr(obj, name) != value]
+        if not changed:
+            continue
+        for name in changed:
+            setattr(obj, name, values[name])
+        if model is FotoResep and 'file_path' in changed:
+            # Signals swap the content reference and reset the variants
+            obj.save()
+            continue
+        if model is BahanResep and 'nama' in changed:
+            obj.nama_normal = ingredients.normalize(obj.nama)
+            changed.append('nama_normal')
+        elif model is NutrisiResep and {'label', 'nilai'} & set(changed):
+            nutrition.apply(obj)
+            changed += ['kunci', 'jumlah', 'satuan']
+        obj.updated_at = now
+        to_update.append(obj)
+        changed_fields.update(changed)
+
+    stale_ids = [pk for pk in existing if pk not in kept]
+    if stale_ids:
+        # Per-row signals run here (file cleanup, reference counts)
+        model.objects.filter(pk__in=stale_ids).delete()
+
+    if to_create:
+        model.objects.bulk_create(to_create)
+        if model is FotoResep:
+            for obj in to_create:
+                content_store.acquire(images.source_key(obj))
+    if to_update:
+        model.objects.bulk_update(to_update, sorted(changed_fields) + ['updated_at'])
+    if model is BahanResep and to_create:
+        ingredients.refresh_jumlah_bahan([parent.pk])
+
+    resource = RESOURCES[model]
+    for obj in to_update:
+        response_cache.invalidate(resource, obj.pk)
+    if to_create:
+        response_cache.invalidate(resource)
+
+    return bool(to_create or to_update or stale_ids)
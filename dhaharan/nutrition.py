@@ -0,0 +1,241 @@
+"""
+Structured nutrition values.
+
+NutrisiResep.label / nilai are free text ("Protein", "15g"; "Lemak Total",
+"6,5 gram"). parse_nutrisi() turns them into a canonical key, a Decimal
+amount and a unit, stored in kunci / jumlah / satuan so recipes can be
+filtered by range in SQL (?protein_min=10&lemak_max=20).
+
+Amounts are converted to the key's canonical unit (protein in g, natrium
+in mg, ...), so one filter value compares every row the same way.
+Numbers are read the Indonesian way: ',' is the decimal mark and '.'
+followed by groups of three digits separates thousands ("1.200 mg");
+any other '.' is a decimal point ("0.5 g").
+"""
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from . import documents, response_cache
+from .models import NutrisiResep, Resep
+
+# Label (lowercase) -> canonical key
+LABEL_KEYS = {
+    'protein': 'protein',
+    'lemak': 'lemak',
+    'lemak total': 'lemak',
+    'total lemak': 'lemak',
+    'fat': 'lemak',
+    'lemak jenuh': 'lemak_jenuh',
+    'karbohidrat': 'karbohidrat',
+    'karbohidrat total': 'karbohidrat',
+    'karbo': 'karbohidrat',
+    'carbs': 'karbohidrat',
+    'serat': 'serat',
+    'serat pangan': 'serat',
+    'fiber': 'serat',
+    'gula': 'gula',
+    'sugar': 'gula',
+    'natrium': 'natrium',
+    'sodium': 'natrium',
+    'kolesterol': 'kolesterol',
+    'kalsium': 'kalsium',
+    'kalium': 'kalium',
+    'zat besi': 'zat_besi',
+    'kalori': 'kalori',
+    'energi': 'kalori',
+    'energi total': 'kalori',
+    'calories': 'kalori',
+}
+
+# Canonical unit per key; other keys keep the unit they were written in
+KEY_UNITS = {
+    'protein': 'g',
+    'lemak': 'g',
+    'lemak_jenuh': 'g',
+    'karbohidrat': 'g',
+    'serat': 'g',
+    'gula': 'g',
+    'natrium': 'mg',
+    'kolesterol': 'mg',
+    'kalsium': 'mg',
+    'kalium': 'mg',
+    'zat_besi': 'mg',
+    'kalori': 'kkal',
+}
+
+# Spelling -> unit
+UNIT_ALIASES = {
+    'g': 'g', 'gr': 'g', 'gram': 'g', 'grams': 'g',
+    'mg': 'mg', 'miligram': 'mg', 'milligram': 'mg',
+    'mcg': 'mcg', 'ug': 'mcg', 'µg': 'mcg', 'mikrogram': 'mcg',
+    'kg': 'kg',
+    'kkal': 'kkal', 'kcal': 'kkal', 'kal': 'kkal', 'cal': 'kkal', 'kalori': 'kkal',
+    '%': '%', 'persen': '%',
+}
+
+# Mass units in grams
+MASS_IN_GRAMS = {
+    'kg': Decimal('1000'),
+    'g': Decimal('1'),
+    'mg': Decimal('0.001'),
+    'mcg': Decimal('0.000001'),
+}
+
+_GROUPED = r'[1-9]\d{0,2}(?:\.\d{3})+(?!\d)(?:,\d+)?'
+_AMOUNT = re.compile(rf'({_GROUPED}|\d+(?:[.,]\d+)?)\s*([a-zµ%]*)')
+_RANGE_PARAM = re.compile(r'^([a-z_]+)_(min|max)$')
+
+# NutrisiResep.jumlah is DecimalField(max_digits=12, decimal_places=2)
+MAX_JUMLAH = Decimal('1e10')
+
+
+def label_key(label):
+    """'Lemak Total (g)' -> 'lemak'; unknown labels become a slug."""
+    value = re.sub(r'\([^)]*\)', ' ', (label or '').lower())
+    value = ' '.join(value.split())
+    if value in LABEL_KEYS:
+        return LABEL_KEYS[value]
+    return re.sub(r'[^a-z0-9]+', '_', value).strip('_')
+
+
+def parse_nilai(nilai):
+    """
+    '15g' -> (Decimal('15'), 'g'); '6,5 gram' -> (Decimal('6.5'), 'g');
+    '1.200 mg' -> (Decimal('1200'), 'mg'). For ranges ('10-12g') the first number is used. Returns (None, '')
+    when there is no number.
+    """
+    match = _AMOUNT.search((nilai or '').lower())
+    if not match:
+        return None, ''
+    number = match.group(1)
+    if re.fullmatch(_GROUPED, number):
+        number = number.replace('.', '')
+    try:
+        amount = Decimal(number.replace(',', '.'))
+    except InvalidOperation:
+        return None, ''
+    unit = UNIT_ALIASES.get(match.group(2), match.group(2))
+    return amount, unit
+
+
+def convert(amount, unit, target):
+    """Convert between mass units; other units are returned unchanged."""
+    if amount is None or unit == target or unit not in MASS_IN_GRAMS or target not in MASS_IN_GRAMS:
+        return amount, unit
+    return (amount * MASS_IN_GRAMS[unit] / MASS_IN_GRAMS[target]).quantize(Decimal('0.01')), target
+
+
+def parse_nutrisi(label, nilai):
+    """(label, nilai) -> (kunci, jumlah, satuan)"""
+    kunci = label_key(label)
+    amount, unit = parse_nilai(nilai)
+    if not unit and kunci in KEY_UNITS:
+        # '15' under 'Protein' means grams
+        unit = KEY_UNITS[kunci]
+    amount, unit = convert(amount, unit, KEY_UNITS.get(kunci, unit))
+    return kunci, amount, unit
+
+
+def fits(amount):
+    """Whether ``amount`` can be stored in NutrisiResep.jumlah."""
+    return amount is None or abs(amount) < MAX_JUMLAH
+
+
+def parse_storable(label, nilai):
+    """
+    parse_nutrisi() with amounts too large for the column dropped; the
+    API rejects those (NutrisiResepSerializer), other writers keep only
+    the text.
+    """
+    kunci, amount, unit = parse_nutrisi(label, nilai)
+    return kunci, amount if fits(amount) else None, unit
+
+
+def apply(nutrisi):
+    """Fill kunci/jumlah/satuan of a NutrisiResep from its label/nilai."""
+    nutrisi.kunci, nutrisi.jumlah, nutrisi.satuan = parse_storable(nutrisi.label, nutrisi.nilai)
+
+
+def parse_range_params(params):
+    """
+    {'protein_min': '10', 'kalori_max': '500', ...} -> {'protein': (10, None), 'kalori': (None, 500)}
+    Only keys in KEY_UNITS are recognised. Raises ValueError on bad numbers.
+    """
+    ranges = {}
+    for name, value in params.items():
+        match = _RANGE_PARAM.match(name)
+        if not match or match.group(1) not in KEY_UNITS:
+            continue
+        kunci, bound = match.groups()
+        try:
+            number = Decimal(value.replace(',', '.'))
+        except InvalidOperation:
+            number = None
+        if number is None or not number.is_finite():
+            raise ValueError(f'{name} harus berupa angka')
+        low, high = ranges.get(kunci, (None, None))
+        ranges[kunci] = (number, high) if bound == 'min' else (low, number)
+    return ranges
+
+
+def filter_resep(queryset, ranges):
+    """
+    Apply parse_range_params() output to a Resep queryset. kalori uses the
+    Resep.kalori column; other keys need a NutrisiResep row in range
+    (EXISTS on the (kunci, jumlah) index).
+    """
+    for kunci, (low, high) in ranges.items():
+        if kunci == 'kalori':
+            if low is not None:
+                queryset = queryset.filter(kalori__gte=low)
+            if high is not None:
+                queryset = queryset.filter(kalori__lte=high)
+            continue
+
+        rows = NutrisiResep.objects.filter(resep=OuterRef('pk'), kunci=kunci)
+        if low is not None:
+            rows = rows.filter(jumlah__gte=low)
+        if high is not None:
+            rows = rows.filter(jumlah__lte=high)
+        queryset = queryset.filter(Exists(rows))
+    return queryset
+
+
+def backfill(batch_size=1000):
+    """
+    Re-parse every NutrisiResep row; returns the number of rows changed.
+    Changed rows and their recipes get a new updated_at (ETags), the
+    recipe documents are rebuilt and the cached responses are dropped.
+    """
+    updated, batch = 0, []
+    for nutrisi in NutrisiResep.objects.only(
+        'id', 'resep_id', 'label', 'nilai', 'kunci', 'jumlah', 'satuan'
+    ).iterator(chunk_size=batch_size):
+        parsed = parse_storable(nutrisi.label, nutrisi.nilai)
+        if parsed != (nutrisi.kunci, nutrisi.jumlah, nutrisi.satuan):
+            nutrisi.kunci, nutrisi.jumlah, nutrisi.satuan = parsed
+            batch.append(nutrisi)
+        if len(batch) >= batch_size:
+            updated += _save_batch(batch)
+            batch = []
+    if batch:
+        updated += _save_batch(batch)
+    if updated:
+        response_cache.invalidate_all('nutrisi-resep')
+        response_cache.invalidate_all('resep')
+    return updated
+
+
+def _save_batch(batch):
+    now = timezone.now()
+    for nutrisi in batch:
+        nutrisi.updated_at = now
+    count = NutrisiResep.objects.bulk_update(batch, ['kunci', 'jumlah', 'satuan', 'updated_at'])
+    resep_ids = {nutrisi.resep_id for nutrisi in batch}
+    Resep.objects.filter(pk__in=resep_ids).update(updated_at=now)
+    # The stored recipe documents render these columns
+    documents.rebuild(resep_ids)
+    return count
@@ -0,0 +1,93 @@
+"""
+Transactional outbox for S3 side effects.
+
+Deleting a photo row only records the object key in StorageOutbox, inside
+the same transaction; a background worker (tasks.run_storage_outbox_forever,
+in a thread of the web process or as `manage.py process_storage_outbox
+--loop`) removes the objects from S3 in batches and retries failures with
+exponential backoff. Request latency no longer depends on S3.
+"""
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import StorageOutbox
+from .storage_backends import DELETE_BATCH_SIZE, S3Storage, key_from_url
+
+logger = logging.getLogger(__name__)
+
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 6 * 60 * 60
+
+
+def enqueue_keys(keys):
+    """Record S3 keys for deletion (call inside the deleting transaction)."""
+    keys = [key for key in keys if key]
+    if keys:
+        StorageOutbox.objects.bulk_create([StorageOutbox(key=key) for key in keys])
+
+
+def enqueue_field_file(field_file):
+    """Queue deletion of a FileField/ImageField file."""
+    if not field_file:
+        return
+    storage = field_file.storage
+    if isinstance(storage, S3Storage):
+        enqueue_keys([storage._get_s3_key(field_file.name)])
+    else:
+        # Local storage (no AWS credentials): cheap, delete after commit
+        name = field_file.name
+        transaction.on_commit(lambda: storage.delete(name))
+
+
+def enqueue_url(url):
+    """Queue deletion of a file stored as an S3 URL (FotoResep, Pengurus)."""
+    if not url:
+        return
+    try:
+        enqueue_keys([key_from_url(url)])
+    except ValueError:
+        logger.warning("Not an S3 URL in our bucket, skipping delete: %s", url)
+
+
+def backoff(attempts):
+    return timedelta(seconds=min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS))
+
+
+def process_batch(batch_size=DELETE_BATCH_SIZE, storage=None):
+    """
+    Delete one batch of due outbox keys from S3.
+    Returns (deleted_count, failed_count). Rows are claimed with
+    SKIP LOCKED so several workers can run side by side.
+    """
+    storage = storage or S3Storage()
+    now = timezone.now()
+
+    with transaction.atomic():
+        rows = list(
+            StorageOutbox.objects.select_for_update(skip_locked=True)
+            .filter(next_attempt_at__lte=now)
+            .order_by('id')[:batch_size]
+        )
+        if not rows:
+            return 0, 0
+
+        try:
+            errors = storage.delete_keys({row.key for row in rows})
+        except Exception as e:
+            errors = {row.key: str(e) for row in rows}
+
+        done_ids = [row.id for row in rows if row.key not in errors]
+        failed = [row for row in rows if row.key in errors]
+
+        StorageOutbox.objects.filter(id__in=done_ids).delete()
+        for row in failed:
+            row.attempts += 1
+            row.last_error = errors[row.key]
+            row.next_attempt_at = now + backoff(row.attempts)
+            row.updated_at = now
+        StorageOutbox.objects.bulk_update(failed, ['attempts', 'last_error', 'next_attempt_at', 'updated_at'])
+
+    return len(done_ids), len(failed)
@@ -0,0 +1,140 @@
+"""
+Keyset (cursor) pagination for the time-ordered feeds.
+"""
+import base64
+import json
+from urllib import parse
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginate on (<ordering field>, id) instead of OFFSET.
+
+    The view declares ``keyset_ordering``, e.g. ('-tanggal', '-id'); the last
+    item of a page is encoded in an opaque ``cursor`` and the next page is a
+    range scan on the matching composite index, so every page costs the same
+    and no COUNT(*) is run.
+    """
+    page_size = api_settings.PAGE_SIZE or 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+
+        ordering = list(view.keyset_ordering)
+        self.field_name = ordering[0].lstrip('-')
+        self.descending = ordering[0].startswith('-')
+        self.field = queryset.model._meta.get_field(self.field_name)
+
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor['reverse'])
+
+        if reverse:
+            ordering = [o[1:] if o.startswith('-') else f'-{o}' for o in ordering]
+        queryset = queryset.order_by(*ordering)
+
+        if cursor:
+            queryset = queryset.filter(self._after(cursor, reverse))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        self.next_position = None
+        self.previous_position = None
+        if results:
+            # Coming back from a later page means there is always a next one
+            if has_more or reverse:
+                self.next_position = self._position(results[-1])
+            if (cursor and not reverse) or (reverse and has_more):
+                self.previous_position = self._position(results[0])
+
+        return results
+
+    def _after(self, cursor, reverse):
+        """Rows strictly after the cursor position in the current direction."""
+        value = cursor['value']
+        pk = cursor['id']
+        ascending = self.descending == reverse
+        op = 'gt' if ascending else 'lt'
+        bound = 'gte' if ascending else 'lte'
+        # The leading bound lets PostgreSQL start a range scan on the index
+        return Q(**{f'{self.field_name}__{bound}': value}) & (
+            Q(**{f'{self.field_name}__{op}': value})
+            | Q(**{self.field_name: value, f'id__{op}': pk})
+        )
+
+    def _position(self, obj):
+        value = getattr(obj, self.field_name)
+        return {'value': value.isoformat() if hasattr(value, 'isoformat') else value, 'id': obj.pk}
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(parse.unquote(encoded).encode('ascii')))
+            value = self.field.to_python(data['v'])
+            pk = int(data['id'])
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        # Anything else would fail in the database instead (NULL bound, bigint overflow)
+        if value is None or not 0 < pk < 2 ** 63:
+            raise NotFound(self.invalid_cursor_message)
+        return {'value': value, 'id': pk, 'reverse': bool(data.get('r'))}
+
+    def encode_cursor(self, position, reverse):
+        data = {'v': position['value'], 'id': position['id']}
+        if reverse:
+            data['r'] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position, reverse=False)
+
+    def get_previous_link(self):
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(self.previous_position, reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
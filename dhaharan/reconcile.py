@@ -0,0 +1,187 @@
+"""
+Find S3 objects under AWS_S3_PREFIX that no database row references.
+
+Both sides are streamed in the same (byte-wise) key order and merge-joined,
+so memory stays bounded no matter how many objects or rows there are:
+list_objects_v2 returns keys in UTF-8 binary order, and the referenced keys
+come from one UNION query ordered with COLLATE "C" through a server-side
+cursor.
+
+Referenced keys are: FotoKegiatan files, FotoResep / Pengurus photo URLs,
+every variant in the variants JSON, StoredObject rows that still have a
+reference (real, or a provisional one that has not expired) and keys
+already waiting in the storage outbox (the outbox worker owns those).
+StoredObject rows without references are orphans like any other object;
+deleting one also drops its row.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import content_store
+from .models import FotoKegiatan, FotoResep, Pengurus, StorageOutbox, StoredObject
+from .storage_backends import DELETE_BATCH_SIZE, get_s3_client
+
+LIST_PAGE_SIZE = 1000
+DB_FETCH_SIZE = 2000
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def _column(model, field_name):
+    return connection.ops.quote_name(model._meta.get_field(field_name).column)
+
+
+def referenced_keys_sql():
+    """(sql, params) yielding one ``key`` column, distinct and byte-ordered."""
+    url_marker = f"/{settings.AWS_STORAGE_BUCKET_NAME}/"
+    selects, params = [], []
+
+    # ImageField names are relative to the prefix
+    selects.append(
+        f"SELECT %s || {_column(FotoKegiatan, 'file_path')} AS key FROM {_table(FotoKegiatan)} "
+        f"WHERE {_column(FotoKegiatan, 'file_path')} <> ''"
+    )
+    params.append(f"{settings.AWS_S3_PREFIX}/")
+
+    # Stored URLs: the key is everything after /<bucket>/
+    for model, field_name in ((FotoResep, 'file_path'), (Pengurus, 'photo')):
+        column = _column(model, field_name)
+        selects.append(
+            f"SELECT substring({column} from strpos({column}, %s) + %s) AS key "
+            f"FROM {_table(model)} WHERE strpos({column}, %s) > 0"
+        )
+        params.extend([url_marker, len(url_marker), url_marker])
+
+    # {"320": {"webp": key, "jpeg": key}, "_error": "..."}
+    for model, field_name in ((FotoKegiatan, 'variants'), (FotoResep, 'variants'), (Pengurus, 'photo_variants')):
+        selects.append(
+            f"SELECT v.value AS key FROM {_table(model)} t "
+            f"CROSS JOIN LATERAL jsonb_each(t.{_column(model, field_name)}) w "
+            f"CROSS JOIN LATERAL jsonb_each_text("
+            f"CASE WHEN jsonb_typeof(w.value) = 'object' THEN w.value ELSE '{{}}'::jsonb END) v"
+        )
+
+    selects.append(
+        f"SELECT {_column(StoredObject, 'key')} AS key FROM {_table(StoredObject)} "
+        f"WHERE {_column(StoredObject, 'ref_count')} > 0 "
+        f"OR ({_column(StoredObject, 'pending_count')} > 0 AND {_column(StoredObject, 'pending_until')} > now())"
+    )
+    selects.append(f"SELECT {_column(StorageOutbox, 'key')} AS key FROM {_table(StorageOutbox)}")
+
+    sql = ' UNION '.join(selects) + ' ORDER BY 1 COLLATE "C"'
+    return sql, params
+
+
+def iter_referenced_keys(fetch_size=DB_FETCH_SIZE):
+    """Referenced keys in byte order, fetched through a server-side cursor."""
+    sql, params = referenced_keys_sql()
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                return
+            for (key,) in rows:
+                yield key
+
+
+def iter_s3_objects(prefix=None, s3_client=None, page_size=LIST_PAGE_SIZE):
+    """Objects under ``prefix`` ({'Key', 'Size', 'LastModified', ...}) in key order."""
+    s3_client = s3_client or get_s3_client()
+    prefix = prefix if prefix is not None else f"{settings.AWS_S3_PREFIX}/"
+    paginator = s3_client.get_paginator('list_objects_v2')
+    pages = paginator.paginate(
+        Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+        Prefix=prefix,
+        PaginationConfig={'PageSize': page_size},
+    )
+    for page in pages:
+        yield from page.get('Contents', [])
+
+
+def find_orphans(s3_objects, referenced_keys):
+    """
+    Merge-join two key-ordered streams and yield the S3 objects whose key
+    is not referenced. Only the current item of each stream is held.
+    """
+    referenced = iter(referenced_keys)
+    current = next(referenced, None)
+    for obj in s3_objects:
+        key = obj['Key']
+        while current is not None and current < key:
+            current = next(referenced, None)
+        if current != key:
+            yield obj
+
+
+def batched_orphans(orphans, min_age, batch_size=DELETE_BATCH_SIZE, now=None):
+    """
+    Group orphans older than ``min_age`` into lists of ``batch_size``.
+    Newer objects are skipped: they may belong to an upload whose row has
+    not been written yet (streamed staging keys, presigned uploads).
+    """
+    cutoff = (now or timezone.now()) - min_age
+    batch = []
+    for obj in orphans:
+        if obj['LastModified'] > cutoff:
+            continue
+        batch.append(obj)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def claim_for_delete(objects, now=None):
+    """
+    Drop the StoredObject rows of ``objects`` that are still unreferenced
+    and return the objects that may be deleted from S3. Rows that gained a
+    reference since the listing (a duplicate upload) keep their object.
+    Call inside a transaction: the rows stay locked until the S3 delete.
+    """
+    now = now or timezone.now()
+    keys = [obj['Key'] for obj in objects]
+    rows = list(StoredObject.objects.select_for_update().filter(key__in=keys))
+    claimed = {
+        row.key for row in rows
+        if row.ref_count > 0 or (row.pending_count > 0 and row.pending_until and row.pending_until > now)
+    }
+    StoredObject.objects.filter(pk__in=[row.pk for row in rows if row.key not in claimed]).delete()
+    return [obj for obj in objects if obj['Key'] not in claimed]
+
+
+def reconcile(delete=False, min_age=timedelta(hours=24), batch_size=DELETE_BATCH_SIZE,
+              prefix=None, storage=None, s3_client=None, on_batch=None):
+    """
+    Report (and with ``delete`` remove) orphaned objects.
+    ``on_batch(objects, errors)`` is called per batch. Returns
+    (orphan_count, orphan_bytes, failed_count).
+    """
+    if delete and storage is None:
+        from .storage_backends import S3Storage
+        storage = S3Storage()
+    if delete:
+        # Expired unattached uploads go through the outbox like other deletes
+        content_store.expire_pending()
+
+    count = size = failed = 0
+    orphans = find_orphans(iter_s3_objects(prefix, s3_client), iter_referenced_keys())
+    for batch in batched_orphans(orphans, min_age, min(batch_size, DELETE_BATCH_SIZE)):
+        errors = {}
+        if delete:
+            with transaction.atomic():
+                batch = claim_for_delete(batch)
+                if batch:
+                    errors = storage.delete_keys([obj['Key'] for obj in batch])
+        count += len(batch)
+        size += sum(obj.get('Size', 0) for obj in batch)
+        failed += len(errors)
+        if on_batch and batch:
+            on_batch(batch, errors)
+    return count, size, failed
@@ -0,0 +1,88 @@
+"""
+Per-resource API response cache.
+
+Cached entries are keyed by resource (router basename), path, query params
+and auth scope, plus version tokens:
+
+- generation token of the resource (bumped when something every response
+  embeds changes, e.g. a jenis kegiatan rename)
+- list token (list/custom actions) or per-object token (retrieve)
+
+Invalidation only replaces the tokens of the resources involved; stale
+entries are never read again and expire through the cache TIMEOUT. This
+works with local backends (locmem/file) since no key scan is needed.
+
+Tokens are replaced once the surrounding transaction commits: a request
+running in between would otherwise cache the pre-commit rows under the
+new token.
+"""
+import hashlib
+import uuid
+from urllib.parse import urlencode
+
+from django.core.cache import caches
+from django.db import transaction
+
+CACHE_ALIAS = 'responses'
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _token(key):
+    # Random tokens rather than counters: if a token is culled a fresh one is
+    # generated and old entries simply become unreachable.
+    return _cache().get_or_set(key, lambda: uuid.uuid4().hex, timeout=None)
+
+
+def _renew(key):
+    _cache().set(key, uuid.uuid4().hex, timeout=None)
+
+
+def _generation_key(resource):
+    return f'resp:gen:{resource}'
+
+
+def _list_key(resource):
+    return f'resp:list:{resource}'
+
+
+def _object_key(resource, pk):
+    return f'resp:obj:{resource}:{pk}'
+
+
+def cache_key(request, resource, pk=None):
+    if request.user and request.user.is_authenticated:
+        scope = f'user:{request.user.pk}'
+    else:
+        scope = 'anon'
+    query = urlencode(sorted(request.query_params.lists()), doseq=True)
+    digest = hashlib.md5(f'{request.path}?{query}|{scope}'.encode('utf-8')).hexdigest()
+
+    generation = _token(_generation_key(resource))
+    version = _token(_list_key(resource)) if pk is None else _token(_object_key(resource, pk))
+    return f'resp:{resource}:{generation}:{version}:{digest}'
+
+
+def get(key):
+    return _cache().get(key)
+
+
+def store(key, value):
+    _cache().set(key, value)
+
+
+def invalidate(resource, pk=None):
+    """Evict the lists of ``resource`` and, if given, the detail of ``pk``."""
+    def renew():
+        _renew(_list_key(resource))
+        if pk is not None:
+            _renew(_object_key(resource, pk))
+
+    transaction.on_commit(renew)
+
+
+def invalidate_all(resource):
+    """Evict every cached response of ``resource``."""
+    transaction.on_commit(lambda: _renew(_generation_key(resource)))
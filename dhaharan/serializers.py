@@ -1,6 +1,11 @@
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from django.contrib.gis.geos import GEOSGeometry
+from django.db import transaction
 import json
+from . import documents, nutrition
+from .images import srcset
+from .nested import write_children
 from .models import (
     JenisKegiatan, StatusKegiatan, Kegiatan, FotoKegiatan, Volunteer,
     Resep, BahanResep, StepsResep, TipsResep, NutrisiResep, FotoResep,
@@ -8,29 +13,118 @@ from .models import (
 )
 
 
+def _parse_csv_param(value):
+    if value is None:
+        return None
+    return {item.strip() for item in value.split(',') if item.strip()}
+
+
+class DynamicFieldsMixin:
+    """
+    Sparse fieldsets and opt-in expansion driven by query params:
+
+        ?fields=id,nama,tanggal   only these fields
+        ?expand=foto,bahan        include these nested relations
+
+    Nested relations listed in Meta.expandable_fields are only rendered when
+    named in ?expand (or ?fields) once either param is used. Without either
+    param the full representation is returned, as before.
+
+    Only the top-level serializer reacts to the params; nested serializers
+    are built without a request in their context. Writes (POST/PUT/PATCH)
+    ignore them, so no writable field is dropped from validation.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return
+
+        keep = self.requested_fields(request, self.fields.keys())
+        if keep is None:
+            return
+        for name in list(self.fields):
+            if name not in keep:
+                self.fields.pop(name)
+
+    @classmethod
+    def expandable_fields(cls):
+        return set(getattr(cls.Meta, 'expandable_fields', ()))
+
+    @classmethod
+    def requested_fields(cls, request, available):
+        """Names of the fields to render, or None for the full representation."""
+        fields = _parse_csv_param(request.query_params.get('fields'))
+        expand = _parse_csv_param(request.query_params.get('expand'))
+        if fields is None and expand is None:
+            return None
+
+        expandable = cls.expandable_fields()
+        if fields:
+            keep = set(fields)
+        else:
+            keep = {name for name in available if name not in expandable}
+        keep |= (expand or set()) & expandable
+        return keep
+
+    @classmethod
+    def requested_expansions(cls, request):
+        """Expandable relations that will be rendered for this request."""
+        expandable = cls.expandable_fields()
+        if request is None or request.method not in SAFE_METHODS:
+            return expandable
+        keep = cls.requested_fields(request, expandable)
+        if keep is None:
+            return expandable
+        return expandable & keep
+
+
 # Jenis Kegiatan Serializers
-class JenisKegiatanSerializer(serializers.ModelSerializer):
+class JenisKegiatanSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = JenisKegiatan
         fields = '__all__'
 
 
 # Status Kegiatan Serializers
-class StatusKegiatanSerializer(serializers.ModelSerializer):
+class StatusKegiatanSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = StatusKegiatan
         fields = '__all__'
 
 
+class StreamedImageField(serializers.ImageField):
+    """
+    ImageField that accepts files streamed to S3 by upload_handlers without
+    downloading them again for Pillow: the handler already checked the
+    content type, the file signature and the size.
+    """
+
+    def to_internal_value(self, data):
+        if getattr(data, 's3_key', None):
+            return serializers.FileField.to_internal_value(self, data)
+        return super().to_internal_value(data)
+
+
 # Foto Kegiatan Serializers
-class FotoKegiatanSerializer(serializers.ModelSerializer):
+class FotoKegiatanSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    file_path = StreamedImageField()
+    srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = FotoKegiatan
-        fields = '__all__'
+        exclude = ['variants']
+        # Filled by the image worker
+        read_only_fields = ['width', 'height', 'file_size', 'placeholder']
+
+    def get_srcset(self, obj):
+        """{"320": {"webp": url, "jpeg": url}, ...}; empty until generated"""
+        return srcset(obj.variants)
 
 
 # Kegiatan Serializers
-class KegiatanSerializer(serializers.ModelSerializer):
+class KegiatanSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     jenis_kegiatan_detail = JenisKegiatanSerializer(source='jenis_kegiatan', read_only=True)
     status_kegiatan_detail = StatusKegiatanSerializer(source='status_kegiatan', read_only=True)
     foto = FotoKegiatanSerializer(many=True, read_only=True)
@@ -43,11 +137,12 @@ class KegiatanSerializer(serializers.ModelSerializer):
             'status_kegiatan', 'status_kegiatan_detail', 'foto',
             'created_at', 'updated_at'
         ]
+        expandable_fields = ['jenis_kegiatan_detail', 'status_kegiatan_detail', 'foto']
     
     def to_representation(self, instance):
         """Convert Point to GeoJSON format for output"""
         data = super().to_representation(instance)
-        if instance.lokasi:
+        if 'lokasi' in data and instance.lokasi:
             data['lokasi'] = {
                 'type': 'Point',
                 'coordinates': [instance.lokasi.x, instance.lokasi.y]  # [lng, lat]
@@ -67,33 +162,12 @@ class KegiatanSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 
-class KegiatanListSerializer(serializers.ModelSerializer):
-    jenis_kegiatan_detail = JenisKegiatanSerializer(source='jenis_kegiatan', read_only=True)
-    status_kegiatan_detail = StatusKegiatanSerializer(source='status_kegiatan', read_only=True)
-    foto = FotoKegiatanSerializer(many=True, read_only=True)
-    
-    class Meta:
-        model = Kegiatan
-        fields = [
-            'id', 'nama', 'deskripsi', 'tanggal', 'jumlah_peserta',
-            'lokasi', 'jenis_kegiatan', 'jenis_kegiatan_detail',
-            'status_kegiatan', 'status_kegiatan_detail', 'foto',
-            'created_at', 'updated_at'
-        ]
-    
-    def to_representation(self, instance):
-        """Convert Point to GeoJSON format for output"""
-        data = super().to_representation(instance)
-        if instance.lokasi:
-            data['lokasi'] = {
-                'type': 'Point',
-                'coordinates': [instance.lokasi.x, instance.lokasi.y]  # [lng, lat]
-            }
-        return data
+class KegiatanListSerializer(KegiatanSerializer):
+    """Rows of the list action; same shape as the detail serializer."""
 
 
 # Volunteer Serializers
-class VolunteerSerializer(serializers.ModelSerializer):
+class VolunteerSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     kegiatan_detail = serializers.SerializerMethodField()
     
     class Meta:
@@ -103,6 +177,7 @@ class VolunteerSerializer(serializers.ModelSerializer):
             'kegiatan', 'kegiatan_detail', 'is_approved',
             'created_at', 'updated_at'
         ]
+        expandable_fields = ['kegiatan_detail']
     
     def get_kegiatan_detail(self, obj):
         return {
@@ -113,47 +188,109 @@ class VolunteerSerializer(serializers.ModelSerializer):
 
 
 # Bahan Resep Serializers
-class BahanResepSerializer(serializers.ModelSerializer):
+class BahanResepSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = BahanResep
         fields = '__all__'
+        read_only_fields = ['nama_normal']
 
 
 # Steps Resep Serializers
-class StepsResepSerializer(serializers.ModelSerializer):
+class StepsResepSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = StepsResep
         fields = '__all__'
 
 
 # Tips Resep Serializers
-class TipsResepSerializer(serializers.ModelSerializer):
+class TipsResepSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = TipsResep
         fields = '__all__'
 
 
 # Nutrisi Resep Serializers
-class NutrisiResepSerializer(serializers.ModelSerializer):
+class NutrisiResepSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = NutrisiResep
         fields = '__all__'
+        # Parsed from label/nilai
+        read_only_fields = ['kunci', 'jumlah', 'satuan']
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        label = attrs.get('label', getattr(self.instance, 'label', ''))
+        nilai = attrs.get('nilai', getattr(self.instance, 'nilai', ''))
+        if not nutrition.fits(nutrition.parse_nutrisi(label, nilai)[1]):
+            raise serializers.ValidationError({'nilai': 'Nilai terlalu besar (maksimal 10 digit sebelum koma)'})
+        return attrs
 
 
 # Foto Resep Serializers
-class FotoResepSerializer(serializers.ModelSerializer):
+class FotoResepSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = FotoResep
-        fields = '__all__'
+        exclude = ['variants']
+        read_only_fields = ['width', 'height', 'file_size', 'placeholder']
+
+    def get_srcset(self, obj):
+        return srcset(obj.variants)
+
+
+# Nested children of ResepSerializer: optional id (update that row), resep set by the parent
+class NestedChildMixin(serializers.Serializer):
+    id = serializers.IntegerField(required=False)
+
+    def to_internal_value(self, data):
+        # A PATCH skips required fields all the way down, but an item
+        # without an id creates a row: validate it as a full create
+        if getattr(self.root, 'partial', False) and isinstance(data, dict) and 'id' not in data:
+            serializer = self.__class__(data=data)
+            serializer.is_valid(raise_exception=True)
+            return serializer.validated_data
+        return super().to_internal_value(data)
+
+
+class BahanResepNestedSerializer(NestedChildMixin, BahanResepSerializer):
+    class Meta(BahanResepSerializer.Meta):
+        read_only_fields = BahanResepSerializer.Meta.read_only_fields + ['resep']
+
+
+class StepsResepNestedSerializer(NestedChildMixin, StepsResepSerializer):
+    class Meta(StepsResepSerializer.Meta):
+        read_only_fields = ['resep']
+
+
+class TipsResepNestedSerializer(NestedChildMixin, TipsResepSerializer):
+    class Meta(TipsResepSerializer.Meta):
+        read_only_fields = ['resep']
+
+
+class NutrisiResepNestedSerializer(NestedChildMixin, NutrisiResepSerializer):
+    class Meta(NutrisiResepSerializer.Meta):
+        read_only_fields = NutrisiResepSerializer.Meta.read_only_fields + ['resep']
+
+
+class FotoResepNestedSerializer(NestedChildMixin, FotoResepSerializer):
+    class Meta(FotoResepSerializer.Meta):
+        read_only_fields = FotoResepSerializer.Meta.read_only_fields + ['resep']
 
 
 # Resep Serializers
-class ResepSerializer(serializers.ModelSerializer):
-    bahan = BahanResepSerializer(many=True, read_only=True)
-    steps = StepsResepSerializer(many=True, read_only=True)
-    tips = TipsResepSerializer(many=True, read_only=True)
-    nutrisi = NutrisiResepSerializer(many=True, read_only=True)
-    foto = FotoResepSerializer(many=True, read_only=True)
+class ResepSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """
+    Full recipe. On create/update the nested arrays are optional and
+    writable: each array sent replaces that relation (rows with an id are
+    updated, rows without are created, missing rows are deleted), all in
+    one transaction. Arrays left out are not touched.
+    """
+    bahan = BahanResepNestedSerializer(many=True, required=False)
+    steps = StepsResepNestedSerializer(many=True, required=False)
+    tips = TipsResepNestedSerializer(many=True, required=False)
+    nutrisi = NutrisiResepNestedSerializer(many=True, required=False)
+    foto = FotoResepNestedSerializer(many=True, required=False)
     
     class Meta:
         model = Resep
@@ -163,9 +300,33 @@ class ResepSerializer(serializers.ModelSerializer):
             'bahan', 'steps', 'tips', 'nutrisi', 'foto',
             'created_at', 'updated_at'
         ]
+        expandable_fields = ['bahan', 'steps', 'tips', 'nutrisi', 'foto']
+    
+    def _pop_children(self, validated_data):
+        return {
+            relation: validated_data.pop(relation)
+            for relation in self.Meta.expandable_fields
+            if relation in validated_data
+        }
+    
+    def create(self, validated_data):
+        children = self._pop_children(validated_data)
+        with transaction.atomic(), documents.deferred_rebuild():
+            resep = super().create(validated_data)
+            for relation, items in children.items():
+                write_children(resep, relation, items)
+        return resep
+    
+    def update(self, instance, validated_data):
+        children = self._pop_children(validated_data)
+        with transaction.atomic(), documents.deferred_rebuild():
+            for relation, items in children.items():
+                write_children(instance, relation, items)
+            # Always saved: updated_at moves and caches are invalidated
+            return super().update(instance, validated_data)
 
 
-class ResepListSerializer(serializers.ModelSerializer):
+class ResepListSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     bahan = BahanResepSerializer(many=True, read_only=True)
     steps = StepsResepSerializer(many=True, read_only=True)
     tips = TipsResepSerializer(many=True, read_only=True)
@@ -180,17 +341,62 @@ class ResepListSerializer(serializers.ModelSerializer):
             'bahan', 'steps', 'tips', 'nutrisi', 'foto',
             'created_at', 'updated_at'
         ]
+        expandable_fields = ['bahan', 'steps', 'tips', 'nutrisi', 'foto']
+
+
+class ResepSummarySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """
+    Card view of a recipe for list/by_kategori: no nested children, just
+    counts and one cover photo. Expects the annotations added by
+    ResepViewSet.summary_queryset (jumlah_steps, cover); jumlah_bahan is a
+    cached column.
+    """
+    jumlah_bahan = serializers.IntegerField(read_only=True)
+    jumlah_steps = serializers.IntegerField(read_only=True)
+    cover = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Resep
+        fields = [
+            'id', 'judul', 'kategori', 'tingkat_kesulitan',
+            'waktu_memasak', 'waktu_persiapan', 'porsi', 'kalori',
+            'jumlah_bahan', 'jumlah_steps', 'cover',
+            'created_at', 'updated_at'
+        ]
+
+    def get_cover(self, obj):
+        cover = getattr(obj, 'cover', None)
+        if not cover:
+            return None
+        return {
+            'id': cover['id'],
+            'file_path': cover['file_path'],
+            'file_name': cover['file_name'],
+            'srcset': srcset(cover['variants']),
+            'width': cover['width'],
+            'height': cover['height'],
+            'placeholder': cover['placeholder'],
+        }
+
+
+class ResepMatchSerializer(ResepSummarySerializer):
+    """Summary plus how well the recipe matches the searched ingredients."""
+    cocok = serializers.IntegerField(read_only=True)
+    coverage = serializers.FloatField(read_only=True)
+
+    class Meta(ResepSummarySerializer.Meta):
+        fields = ResepSummarySerializer.Meta.fields + ['cocok', 'coverage']
 
 
 # Tipe Transaksi Serializers
-class TipeTransaksiSerializer(serializers.ModelSerializer):
+class TipeTransaksiSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = TipeTransaksi
         fields = '__all__'
 
 
 # Transaksi Serializers
-class TransaksiSerializer(serializers.ModelSerializer):
+class TransaksiSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     tipe_transaksi_detail = TipeTransaksiSerializer(source='tipe_transaksi', read_only=True)
     
     class Meta:
@@ -200,13 +406,19 @@ class TransaksiSerializer(serializers.ModelSerializer):
             'deskripsi', 'jumlah', 'tanggal',
             'created_at', 'updated_at'
         ]
+        expandable_fields = ['tipe_transaksi_detail']
 
 
 # Pengurus Serializers
-class PengurusSerializer(serializers.ModelSerializer):
+class PengurusSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    photo_srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = Pengurus
         fields = [
-            'id', 'nama', 'jabatan', 'photo',
+            'id', 'nama', 'jabatan', 'photo', 'photo_srcset',
             'created_at', 'updated_at'
         ]
+
+    def get_photo_srcset(self, obj):
+        return srcset(obj.photo_variants)
@@ -0,0 +1,287 @@
+"""
+Model signal handlers: keep derived data (tile cache, parent timestamps, ...)
+in step with writes.
+"""
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import content_store, documents, images, ingredients, nutrition, outbox, response_cache, tiles
+from .models import (
+    JenisKegiatan, StatusKegiatan, Kegiatan, FotoKegiatan, Volunteer,
+    Resep, BahanResep, StepsResep, TipsResep, NutrisiResep, FotoResep,
+    TipeTransaksi, Transaksi, Pengurus
+)
+
+# Child model -> (parent model, FK attname). The parent's representation
+# nests these rows, so its updated_at must move when they change.
+CHILD_PARENTS = {
+    FotoKegiatan: (Kegiatan, 'kegiatan_id'),
+    BahanResep: (Resep, 'resep_id'),
+    StepsResep: (Resep, 'resep_id'),
+    TipsResep: (Resep, 'resep_id'),
+    NutrisiResep: (Resep, 'resep_id'),
+    FotoResep: (Resep, 'resep_id'),
+}
+
+
+@receiver(pre_save, sender=Kegiatan)
+def remember_old_lokasi(sender, instance, **kwargs):
+    # Needed to clear the tiles the point is moving away from
+    instance._old_lokasi = None
+    if instance.pk:
+        instance._old_lokasi = sender.objects.filter(pk=instance.pk).values_list('lokasi', flat=True).first()
+
+
+# Tile invalidation waits for the commit: a tile rendered by a concurrent
+# request before then would otherwise be cached again with the old data.
+
+@receiver(post_save, sender=Kegiatan)
+def invalidate_tiles_on_save(sender, instance, **kwargs):
+    points = [instance.lokasi]
+    old_lokasi = getattr(instance, '_old_lokasi', None)
+    if old_lokasi is not None and old_lokasi != instance.lokasi:
+        points.append(old_lokasi)
+
+    def invalidate():
+        for point in points:
+            tiles.invalidate_point(point)
+
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_delete, sender=Kegiatan)
+def invalidate_tiles_on_delete(sender, instance, **kwargs):
+    lokasi = instance.lokasi
+    transaction.on_commit(lambda: tiles.invalidate_point(lokasi))
+
+
+@receiver(post_save, sender=JenisKegiatan)
+@receiver(post_delete, sender=JenisKegiatan)
+@receiver(post_save, sender=StatusKegiatan)
+@receiver(post_delete, sender=StatusKegiatan)
+def invalidate_tiles_on_lookup_change(sender, **kwargs):
+    # Names are tile attributes, so every tile may be affected
+    transaction.on_commit(tiles.invalidate_all)
+
+
+def remember_old_parent(sender, instance, update_fields=None, **kwargs):
+    # A child moved to another parent changes both parents
+    _, fk_attname = CHILD_PARENTS[sender]
+    instance._old_parent_id = None
+    if update_fields is not None and not {fk_attname, fk_attname.removesuffix('_id')} & set(update_fields):
+        return
+    if instance.pk:
+        instance._old_parent_id = sender.objects.filter(pk=instance.pk).values_list(fk_attname, flat=True).first()
+
+
+def moved_from(sender, instance):
+    """The previous parent id if this save moved the child, else None."""
+    old_parent_id = getattr(instance, '_old_parent_id', None)
+    if old_parent_id and old_parent_id != getattr(instance, CHILD_PARENTS[sender][1]):
+        return old_parent_id
+    return None
+
+
+for child_model in CHILD_PARENTS:
+    pre_save.connect(remember_old_parent, sender=child_model, dispatch_uid=f'old_parent_{child_model.__name__}')
+
+
+def touch_parent(sender, instance, **kwargs):
+    """Bump the parent's updated_at so its ETag/Last-Modified change."""
+    parent_model, fk_attname = CHILD_PARENTS[sender]
+    parent_ids = [
+        parent_id for parent_id in (getattr(instance, fk_attname), moved_from(sender, instance)) if parent_id
+    ]
+    if parent_ids:
+        parent_model.objects.filter(pk__in=parent_ids).update(updated_at=timezone.now())
+
+
+for child_model in CHILD_PARENTS:
+    post_save.connect(touch_parent, sender=child_model, dispatch_uid=f'touch_parent_save_{child_model.__name__}')
+    post_delete.connect(touch_parent, sender=child_model, dispatch_uid=f'touch_parent_delete_{child_model.__name__}')
+
+
+@receiver(pre_save, sender=BahanResep)
+def normalize_bahan_nama(sender, instance, **kwargs):
+    instance.nama_normal = ingredients.normalize(instance.nama)
+
+
+@receiver(post_save, sender=BahanResep)
+@receiver(post_delete, sender=BahanResep)
+def refresh_jumlah_bahan(sender, instance, created=True, **kwargs):
+    # Edits don't change the count; creates, deletes and moves do
+    resep_ids = [instance.resep_id] if created and instance.resep_id else []
+    old_resep_id = moved_from(sender, instance)
+    if old_resep_id:
+        resep_ids += [old_resep_id, instance.resep_id]
+    if resep_ids:
+        ingredients.refresh_jumlah_bahan(resep_ids)
+
+
+@receiver(pre_save, sender=NutrisiResep)
+def parse_nutrisi_nilai(sender, instance, **kwargs):
+    nutrition.apply(instance)
+
+
+# Model -> router basename of its endpoint (see urls.py)
+RESOURCES = {
+    JenisKegiatan: 'jenis-kegiatan',
+    StatusKegiatan: 'status-kegiatan',
+    Kegiatan: 'kegiatan',
+    FotoKegiatan: 'foto-kegiatan',
+    Volunteer: 'volunteer',
+    Resep: 'resep',
+    BahanResep: 'bahan-resep',
+    StepsResep: 'steps-resep',
+    TipsResep: 'tips-resep',
+    NutrisiResep: 'nutrisi-resep',
+    FotoResep: 'foto-resep',
+    TipeTransaksi: 'tipe-transaksi',
+    Transaksi: 'transaksi',
+    Pengurus: 'pengurus',
+}
+
+# Model -> resources that render it inline in every row (lookup names etc.)
+DEPENDENT_RESOURCES = {
+    JenisKegiatan: ['kegiatan'],
+    StatusKegiatan: ['kegiatan'],
+    Kegiatan: ['volunteer'],
+    TipeTransaksi: ['transaksi'],
+}
+
+
+def invalidate_response_cache(sender, instance, **kwargs):
+    response_cache.invalidate(RESOURCES[sender], instance.pk)
+
+    if sender in CHILD_PARENTS:
+        parent_model, fk_attname = CHILD_PARENTS[sender]
+        for parent_id in (getattr(instance, fk_attname), moved_from(sender, instance)):
+            if parent_id:
+                response_cache.invalidate(RESOURCES[parent_model], parent_id)
+
+    for resource in DEPENDENT_RESOURCES.get(sender, []):
+        response_cache.invalidate_all(resource)
+
+
+for model in RESOURCES:
+    post_save.connect(invalidate_response_cache, sender=model, dispatch_uid=f'response_cache_save_{model.__name__}')
+    post_delete.connect(invalidate_response_cache, sender=model, dispatch_uid=f'response_cache_delete_{model.__name__}')
+
+
+@receiver(post_delete, sender=FotoKegiatan)
+def queue_foto_kegiatan_file_delete(sender, instance, **kwargs):
+    # Runs inside the delete transaction; the S3 call happens in the worker
+    if content_store.release(images.source_key(instance)):
+        return
+    outbox.enqueue_field_file(instance.file_path)
+    outbox.enqueue_keys(images.variant_keys(instance.variants))
+
+
+@receiver(post_delete, sender=FotoResep)
+def queue_foto_resep_file_delete(sender, instance, **kwargs):
+    if content_store.release(images.source_key(instance)):
+        return
+    outbox.enqueue_url(instance.file_path)
+    outbox.enqueue_keys(images.variant_keys(instance.variants))
+
+
+@receiver(post_delete, sender=Pengurus)
+def queue_pengurus_variants_delete(sender, instance, **kwargs):
+    if content_store.release(images.source_key(instance)):
+        return
+    outbox.enqueue_keys(images.variant_keys(instance.photo_variants))
+
+
+# Model -> (source image field, variants field)
+VARIANT_SOURCES = {
+    FotoKegiatan: ('file_path', 'variants'),
+    FotoResep: ('file_path', 'variants'),
+    Pengurus: ('photo', 'photo_variants'),
+}
+
+
+def _source_value(value):
+    # FieldFile for FotoKegiatan, plain URL string otherwise
+    return getattr(value, 'name', value) or ''
+
+
+def track_source_change(sender, instance, update_fields=None, **kwargs):
+    """
+    A replaced image gets fresh variants; the old ones are queued for
+    deletion. Content-addressed sources are reference counted instead:
+    the new one is acquired and the old one released after the save.
+    """
+    source_field, variants_field = VARIANT_SOURCES[sender]
+    instance._stale_variant_keys = []
+    instance._source_changed = False
+    instance._old_source_key = None
+    if update_fields and source_field not in update_fields:
+        return
+
+    old = None
+    if instance.pk:
+        old = sender.objects.filter(pk=instance.pk).only(source_field, variants_field).first()
+    if old is None:
+        instance._source_changed = True
+        return
+    if _source_value(getattr(old, source_field)) != _source_value(getattr(instance, source_field)):
+        instance._source_changed = True
+        instance._old_source_key = images.source_key(old)
+        if not content_store.is_content_key(instance._old_source_key):
+            instance._stale_variant_keys = images.variant_keys(getattr(old, variants_field))
+        setattr(instance, variants_field, {})
+
+
+def apply_source_change(sender, instance, **kwargs):
+    if getattr(instance, '_source_changed', False):
+        content_store.acquire(images.source_key(instance))
+        content_store.release(instance._old_source_key)
+        instance._source_changed = False
+        instance._old_source_key = None
+    outbox.enqueue_keys(getattr(instance, '_stale_variant_keys', []))
+    instance._stale_variant_keys = []
+
+
+for model in VARIANT_SOURCES:
+    pre_save.connect(track_source_change, sender=model, dispatch_uid=f'variants_reset_{model.__name__}')
+    post_save.connect(apply_source_change, sender=model, dispatch_uid=f'variants_stale_{model.__name__}')
+
+
+# Models rendered in the materialized recipe document -> attname of the recipe id.
+# Connected last so the parent's updated_at has already been touched.
+RESEP_DOCUMENT_SOURCES = {
+    Resep: 'id',
+    BahanResep: 'resep_id',
+    StepsResep: 'resep_id',
+    TipsResep: 'resep_id',
+    NutrisiResep: 'resep_id',
+    FotoResep: 'resep_id',
+}
+
+
+def _deleting_resep(origin):
+    return isinstance(origin, Resep) or (isinstance(origin, QuerySet) and origin.model is Resep)
+
+
+def rebuild_resep_document(sender, instance, origin=None, **kwargs):
+    # Children removed by deleting the recipe itself: the document goes too
+    if _deleting_resep(origin):
+        return
+    resep_ids = [getattr(instance, RESEP_DOCUMENT_SOURCES[sender])]
+    if sender in CHILD_PARENTS:
+        # Moved to another recipe: the old document loses the child
+        resep_ids.append(moved_from(sender, instance))
+    resep_ids = [resep_id for resep_id in resep_ids if resep_id]
+    if resep_ids:
+        documents.rebuild(resep_ids)
+
+
+for model in RESEP_DOCUMENT_SOURCES:
+    post_save.connect(rebuild_resep_document, sender=model, dispatch_uid=f'resep_document_save_{model.__name__}')
+    if model is not Resep:
+        post_delete.connect(
+            rebuild_resep_document, sender=model, dispatch_uid=f'resep_document_delete_{model.__name__}'
+        )
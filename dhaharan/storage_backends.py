@@ -3,11 +3,129 @@ S3 Storage Backend for Django
 Upload files to S3: s3://cdn.ruangbumi.com/dhaharan.id.ruangbumi.com/
 """
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from django.conf import settings
 from django.core.files.storage import Storage
 from django.utils.deconstruct import deconstructible
-import os
+from collections import OrderedDict
+import threading
+import time
+
+# S3 DeleteObjects accepts at most 1000 keys per request
+DELETE_BATCH_SIZE = 1000
+
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+
+def get_s3_client():
+    """
+    Process-wide S3 client, created on first use.
+
+    boto3 clients are thread-safe, so every code path (storage backend,
+    upload views, outbox worker) shares one client and its keep-alive
+    connection pool instead of re-reading credentials and opening new TLS
+    connections per call.
+    """
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                _s3_client = boto3.client(
+                    's3',
+                    aws_access_key_id=getattr(settings, 'AWS_ACCESS_KEY_ID', None),
+                    aws_secret_access_key=getattr(settings, 'AWS_SECRET_ACCESS_KEY', None),
+                    region_name=getattr(settings, 'AWS_S3_REGION_NAME', 'ap-southeast-1'),
+                    endpoint_url=getattr(settings, 'AWS_S3_ENDPOINT_URL', None),
+                    config=Config(
+                        max_pool_connections=getattr(settings, 'AWS_S3_MAX_POOL_CONNECTIONS', 20),
+                        tcp_keepalive=True,
+                        retries={'mode': 'standard'},
+                    ),
+                )
+    return _s3_client
+
+
+class MetadataCache:
+    """
+    Bounded TTL + LRU cache of head_object results, keyed by S3 key.
+
+    Stores the object size, or None for keys known to be missing. Missing
+    keys expire sooner since other processes (workers, presigned uploads)
+    may create them.
+    """
+
+    def __init__(self, max_entries, timeout, missing_timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.missing_timeout = missing_timeout
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return (found, size); size None means the key does not exist."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, size = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, size
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def set(self, key, size):
+        timeout = self.timeout if size is not None else self.missing_timeout
+        if timeout <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + timeout, size)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def info(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+            }
+
+
+_metadata_cache = None
+_metadata_cache_lock = threading.Lock()
+
+
+def get_metadata_cache():
+    """Process-wide MetadataCache shared by all S3Storage instances."""
+    global _metadata_cache
+    if _metadata_cache is None:
+        with _metadata_cache_lock:
+            if _metadata_cache is None:
+                _metadata_cache = MetadataCache(
+                    max_entries=getattr(settings, 'AWS_S3_METADATA_CACHE_MAX_ENTRIES', 10000),
+                    timeout=getattr(settings, 'AWS_S3_METADATA_CACHE_TIMEOUT', 300),
+                    missing_timeout=getattr(settings, 'AWS_S3_METADATA_CACHE_MISSING_TIMEOUT', 30),
+                )
+    return _metadata_cache
 
 
 @deconstructible
@@ -20,14 +138,43 @@ class S3Storage(Storage):
         self.bucket_name = getattr(settings, 'AWS_STORAGE_BUCKET_NAME', 'cdn.ruangbumi.com')
         self.prefix = getattr(settings, 'AWS_S3_PREFIX', 'dhaharan.id.ruangbumi.com')
         self.region = getattr(settings, 'AWS_S3_REGION_NAME', 'ap-southeast-1')
-        
-        # Initialize S3 client
-        self.s3_client = boto3.client(
-            's3',
-            aws_access_key_id=getattr(settings, 'AWS_ACCESS_KEY_ID', None),
-            aws_secret_access_key=getattr(settings, 'AWS_SECRET_ACCESS_KEY', None),
-            region_name=self.region
-        )
+    
+    @property
+    def s3_client(self):
+        return get_s3_client()
+    
+    @property
+    def metadata_cache(self):
+        return get_metadata_cache()
+    
+    def cache_info(self):
+        """Hit/miss counters of the exists()/size() metadata cache"""
+        return self.metadata_cache.info()
+    
+    def _head_size(self, s3_key):
+        """Object size from the metadata cache or head_object; None if missing"""
+        found, size = self.metadata_cache.get(s3_key)
+        if found:
+            return size
+        try:
+            response = self.s3_client.head_object(Bucket=self.bucket_name, Key=s3_key)
+        except ClientError as e:
+            error_code = e.response.get('Error', {}).get('Code', 'Unknown')
+            if error_code not in ('404', 'NoSuchKey', 'NotFound'):
+                # Permission/throttling errors say nothing about the key: don't cache
+                return None
+            size = None
+        else:
+            size = response['ContentLength']
+        self.metadata_cache.set(s3_key, size)
+        return size
+    
+    def _remember_saved(self, s3_key, content):
+        size = getattr(content, 'size', None)
+        if size is None:
+            self.metadata_cache.invalidate([s3_key])
+        else:
+            self.metadata_cache.set(s3_key, size)
     
     def _get_s3_key(self, name):
         """Generate S3 key with prefix"""
@@ -46,6 +193,14 @@ class S3Storage(Storage):
         s3_key = self._get_s3_key(name)
         
         try:
+            if getattr(content, 'sha256', None):
+                # Streamed upload (upload_handlers): already in S3, store it
+                # under its content hash instead of the generated name
+                from .content_store import store_staged
+                s3_key, _ = store_staged(content)
+                self._remember_saved(s3_key, content)
+                return s3_key[len(self.prefix) + 1:]
+
             # Upload file to S3
             self.s3_client.upload_fileobj(
                 content,
@@ -56,6 +211,7 @@ class S3Storage(Storage):
                     # ACL removed - bucket uses Bucket Owner Enforced setting
                 }
             )
+            self._remember_saved(s3_key, content)
             return name
         except ClientError as e:
             raise IOError(f"Error uploading to S3: {str(e)}")
@@ -64,13 +220,7 @@ class S3Storage(Storage):
         """
         Check if file exists in S3
         """
-        s3_key = self._get_s3_key(name)
-        
-        try:
-            self.s3_client.head_object(Bucket=self.bucket_name, Key=s3_key)
-            return True
-        except ClientError:
-            return False
+        return self._head_size(self._get_s3_key(name)) is not None
     
     def url(self, name):
         """
@@ -86,19 +236,62 @@ class S3Storage(Storage):
         """
         s3_key = self._get_s3_key(name)
         
+        self.metadata_cache.invalidate([s3_key])
         try:
             self.s3_client.delete_object(Bucket=self.bucket_name, Key=s3_key)
         except ClientError as e:
             raise IOError(f"Error deleting from S3: {str(e)}")
     
+    def delete_keys(self, keys):
+        """
+        Delete raw S3 keys (prefix included), up to 1000 per request.
+        Returns {key: error message} for the keys that could not be deleted.
+        """
+        keys = list(keys)
+        self.metadata_cache.invalidate(keys)
+        errors = {}
+        for start in range(0, len(keys), DELETE_BATCH_SIZE):
+            batch = keys[start:start + DELETE_BATCH_SIZE]
+            try:
+                response = self.s3_client.delete_objects(
+                    Bucket=self.bucket_name,
+                    Delete={
+                        'Objects': [{'Key': key} for key in batch],
+                        'Quiet': True,
+                    },
+                )
+            except ClientError as e:
+                for key in batch:
+                    errors[key] = f"Error deleting from S3: {str(e)}"
+                continue
+
+            for error in response.get('Errors', []):
+                errors[error.get('Key')] = f"{error.get('Code')}: {error.get('Message')}"
+        return errors
+    
     def size(self, name):
         """
         Return the size of the file
         """
-        s3_key = self._get_s3_key(name)
-        
-        try:
-            response = self.s3_client.head_object(Bucket=self.bucket_name, Key=s3_key)
-            return response['ContentLength']
-        except ClientError:
-            return 0
+        size = self._head_size(self._get_s3_key(name))
+        return size if size is not None else 0
+
+
+def key_from_url(url):
+    """
+    Extract the S3 key from a stored file URL.
+    Example: https://s3.ap-southeast-1.amazonaws.com/bucket/prefix/resep/file.jpg
+    -> prefix/resep/file.jpg
+    Raises ValueError if the URL does not point into our bucket.
+    """
+    bucket_name = settings.AWS_STORAGE_BUCKET_NAME
+    url_parts = url.split('/')
+    bucket_index = url_parts.index(bucket_name)
+    return '/'.join(url_parts[bucket_index + 1:])
+
+
+def key_url(s3_key):
+    """Public URL of a raw S3 key (same format as S3Storage.url)."""
+    region = getattr(settings, 'AWS_S3_REGION_NAME', 'ap-southeast-1')
+    bucket_name = getattr(settings, 'AWS_STORAGE_BUCKET_NAME', 'cdn.ruangbumi.com')
+    return f"https://s3.{region}.amazonaws.com/{bucket_name}/{s3_key}"
@@ -0,0 +1,178 @@
+"""
+Background jobs for the dhaharan app.
+
+These run outside the request cycle, either as management commands or in
+daemon threads that config/wsgi.py starts in the web process, so read
+endpoints never have to write.
+"""
+import threading
+import time as time_module
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+from django.db import close_old_connections
+from django.utils import timezone
+
+from . import images, outbox, response_cache, tiles
+from .content_store import expire_pending
+from .models import Kegiatan
+from .storage_backends import DELETE_BATCH_SIZE, S3Storage
+
+JAKARTA_TZ = ZoneInfo('Asia/Jakarta')
+
+# StatusKegiatan id for 'Selesai'
+STATUS_SELESAI_ID = 3
+
+
+def jakarta_today():
+    return timezone.now().astimezone(JAKARTA_TZ).date()
+
+
+def auto_complete_past_kegiatan():
+    """
+    Update status kegiatan menjadi 'Selesai' (id=3) untuk kegiatan yang
+    tanggalnya sudah lewat (timezone Asia/Jakarta).
+
+    Idempotent: rows that are already 'Selesai' are left untouched, so it is
+    safe to run at startup as a catch-up and again from the daily schedule.
+    """
+    current_date = jakarta_today()
+
+    updated_count = Kegiatan.objects.filter(
+        tanggal__lt=current_date
+    ).exclude(
+        status_kegiatan_id=STATUS_SELESAI_ID
+    ).update(status_kegiatan_id=STATUS_SELESAI_ID, updated_at=timezone.now())
+
+    if updated_count:
+        # .update() bypasses post_save (and auto_now), so updated_at is set
+        # above for ETags and derived data is invalidated here
+        tiles.invalidate_all()
+        response_cache.invalidate_all('kegiatan')
+        response_cache.invalidate_all('volunteer')
+
+    return updated_count, current_date
+
+
+def seconds_until_next_jakarta_midnight(now=None):
+    """Return seconds from ``now`` until the next 00:00 Asia/Jakarta."""
+    now = (now or timezone.now()).astimezone(JAKARTA_TZ)
+    next_midnight = datetime.combine(now.date() + timedelta(days=1), time.min, tzinfo=JAKARTA_TZ)
+    return max((next_midnight - now).total_seconds(), 0)
+
+
+def run_auto_complete_forever(log=print):
+    """
+    Catch-up now, then repeat every day just after 00:00 Asia/Jakarta.
+    Never returns; errors are logged and retried on the next run.
+    """
+    while True:
+        try:
+            updated_count, current_date = auto_complete_past_kegiatan()
+            log(f"{updated_count} kegiatan diupdate ke status Selesai (tanggal {current_date})")
+        except Exception as e:
+            log(f"Error auto-completing kegiatan: {e}")
+
+        # Small margin so we wake up after the date has actually rolled over
+        time_module.sleep(seconds_until_next_jakarta_midnight() + 5)
+
+
+def process_storage_outbox(storage=None, batch_size=DELETE_BATCH_SIZE):
+    """
+    One pass of the storage outbox worker: queue unattached uploads past
+    their grace period (content_store.expire_pending), then delete due
+    outbox keys batch by batch until a batch comes back short.
+    Returns (expired, deleted, failed).
+    """
+    storage = storage or S3Storage()
+    expired = expire_pending()
+    deleted = failed = 0
+    while True:
+        batch_deleted, batch_failed = outbox.process_batch(batch_size=batch_size, storage=storage)
+        deleted += batch_deleted
+        failed += batch_failed
+        # Failed keys are backed off, so a full batch always means new work
+        if batch_deleted + batch_failed < batch_size:
+            return expired, deleted, failed
+
+
+def run_storage_outbox_forever(interval=5.0, batch_size=DELETE_BATCH_SIZE, log=print):
+    """
+    Drain the storage outbox every ``interval`` seconds. Never returns;
+    errors are logged and retried on the next pass.
+    """
+    storage = S3Storage()
+    while True:
+        # Long-lived loop outside the request cycle: drop dead connections
+        close_old_connections()
+        try:
+            expired, deleted, failed = process_storage_outbox(storage=storage, batch_size=batch_size)
+            if expired:
+                log(f"Queued {expired} unattached uploads for deletion")
+            if deleted or failed:
+                log(f"Deleted {deleted} objects, {failed} failed (will retry)")
+        except Exception as e:
+            log(f"Storage outbox pass failed: {e}")
+        time_module.sleep(interval)
+
+
+def run_image_variants_forever(interval=10.0, batch_size=20, log=print):
+    """
+    Generate variants for new photos, sleeping ``interval`` seconds
+    whenever nothing is pending. Never returns; errors are logged.
+    """
+    while True:
+        close_old_connections()
+        try:
+            processed = images.process_pending(batch_size=batch_size)
+        except Exception as e:
+            log(f"Variant batch failed: {e}")
+            processed = 0
+        if processed:
+            log(f"Generated variants for {processed} photos")
+        else:
+            time_module.sleep(interval)
+
+
+_started = set()
+_started_lock = threading.Lock()
+
+
+def start_in_background(target, name):
+    """
+    Run ``target`` in a daemon thread of this process, at most once per
+    ``name``. Used by config/wsgi.py for deployments that have no separate
+    worker processes (Cloud Run).
+    """
+    with _started_lock:
+        if name in _started:
+            return False
+        _started.add(name)
+
+    thread = threading.Thread(target=target, name=name, daemon=True)
+    thread.start()
+    return True
+
+
+def start_auto_complete_scheduler():
+    """
+    Start the daily roll-over in this process (KEGIATAN_SCHEDULER_ENABLED);
+    safe to run in several workers at once since the update is idempotent.
+    """
+    start_in_background(run_auto_complete_forever, 'kegiatan-auto-complete')
+
+
+def start_storage_outbox_worker():
+    """
+    Drain the storage outbox in this process (STORAGE_OUTBOX_WORKER_ENABLED);
+    rows are claimed with SKIP LOCKED, so every worker process can run one.
+    """
+    start_in_background(run_storage_outbox_forever, 'storage-outbox')
+
+
+def start_image_worker():
+    """
+    Generate image variants and metadata in this process
+    (IMAGE_WORKER_ENABLED); rows are claimed with SKIP LOCKED.
+    """
+    start_in_background(run_image_variants_forever, 'image-variants')
@@ -1,3 +1,1497 @@
-from django.test import TestCase
+import base64
+import hashlib
+import io
+import json
+import math
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from botocore.exceptions import ClientError
+from django.contrib.gis.geos import Point
+from django.core import signing
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.urls import reverse
+from PIL import Image
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase
+
+from . import (
+    content_store, documents, geo, images, ingredients, nutrition, outbox, reconcile, response_cache,
+    storage_backends, tasks, tiles, upload_handlers, upload_views,
+)
+from .models import (
+    BahanResep, FotoKegiatan, FotoResep, JenisKegiatan, Kegiatan, NutrisiResep, Resep, ResepDokumen,
+    StatusKegiatan, StepsResep, StorageOutbox, StoredObject, TipeTransaksi, Transaksi,
+)
+from .storage_backends import key_url
+from .tasks import STATUS_SELESAI_ID, auto_complete_past_kegiatan
+from .views import stream_feature_collection
+
+LOCMEM = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+TEST_CACHES = {
+    'default': LOCMEM,
+    'tiles': {**LOCMEM, 'LOCATION': 'test-tiles'},
+    'responses': {**LOCMEM, 'LOCATION': 'test-responses'},
+}
+
+
+def make_resep(**kwargs):
+    values = {
+        'judul': 'Nasi Goreng', 'deskripsi': '-', 'kategori': 'makanan', 'tingkat_kesulitan': 'mudah',
+        'waktu_memasak': 15, 'waktu_persiapan': 10, 'porsi': 2, 'kalori': 450,
+    }
+    values.update(kwargs)
+    return Resep.objects.create(**values)
+
+
+def encode_cursor(data):
+    return base64.urlsafe_b64encode(json.dumps(data).encode('utf-8')).decode('ascii')
+
+
+class CacheIsolationMixin:
+    """
+    Fresh per-test caches (use with @override_settings(CACHES=TEST_CACHES));
+    the configured file caches outlive a test run.
+    """
+
+    def setUp(self):
+        super().setUp()
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class KeysetPaginationTests(CacheIsolationMixin, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        tipe = TipeTransaksi.objects.create(nama='Donasi')
+        start = date(2024, 1, 1)
+        # Two rows per date, so the id tie-break is exercised
+        cls.transaksi = [
+            Transaksi.objects.create(
+                nama=f'T{i}', tipe_transaksi=tipe, deskripsi='-', jumlah=i, tanggal=start + timedelta(days=i // 2),
+            )
+            for i in range(7)
+        ]
+
+    def test_round_trip_matches_ordering(self):
+        expected = [t.pk for t in sorted(self.transaksi, key=lambda t: (t.tanggal, t.pk), reverse=True)]
+        url = reverse('transaksi-list') + '?cursor=&page_size=3'
+        seen, pages = [], []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.data)
+            seen += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(pages), 3)
+        self.assertIsNone(pages[0]['previous'])
+
+        # Going back from the last page returns the middle one
+        response = self.client.get(pages[-1]['previous'])
+        self.assertEqual([row['id'] for row in response.data['results']], expected[3:6])
+
+    def test_invalid_cursors_are_404(self):
+        cursors = [
+            'not-base64!',
+            encode_cursor(['v', 1]),
+            encode_cursor({'v': '2024-01-01'}),
+            encode_cursor({'v': 'x', 'id': 1}),
+            encode_cursor({'v': None, 'id': 1}),
+            encode_cursor({'v': '2024-01-01', 'id': 'abc'}),
+            encode_cursor({'v': '2024-01-01', 'id': 2 ** 70}),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.client.get(reverse('transaksi-list'), {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ListQueryCountTests(CacheIsolationMixin, APITestCase):
+    """A list page costs the same number of queries for 10 rows as for 100."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.jenis = JenisKegiatan.objects.create(nama='Bagi Makanan')
+        cls.status = StatusKegiatan.objects.create(nama='Direncanakan')
+
+    def add_kegiatan(self, start, count):
+        for i in range(start, start + count):
+            kegiatan = Kegiatan.objects.create(
+                nama=f'K{i}', deskripsi='-', tanggal=date(2030, 1, 1) + timedelta(days=i),
+                lokasi=Point(110.37, -7.79), jenis_kegiatan=self.jenis, status_kegiatan=self.status,
+            )
+            FotoKegiatan.objects.create(kegiatan=kegiatan, file_path=f'kegiatan/{i}.jpg', file_name=f'{i}.jpg')
+
+    def add_resep(self, start, count):
+        for i in range(start, start + count):
+            resep = make_resep(judul=f'R{i}')
+            BahanResep.objects.create(resep=resep, nama='garam', takaran='1 sdt')
+            StepsResep.objects.create(resep=resep, urutan=1, nama='Aduk')
+            NutrisiResep.objects.create(resep=resep, label='Protein', nilai='15g')
+            FotoResep.objects.create(
+                resep=resep, file_path=key_url(f'{settings.AWS_S3_PREFIX}/resep/{i}.jpg'), file_name=f'{i}.jpg',
+            )
+
+    def assertConstantQueries(self, url, add_rows):
+        add_rows(0, 10)
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(len(self.client.get(url).data['results']), 10)
+
+        add_rows(10, 90)
+        caches['responses'].clear()
+        with self.assertNumQueries(len(small)):
+            self.assertEqual(len(self.client.get(url).data['results']), 100)
+
+    def test_kegiatan_list(self):
+        self.assertConstantQueries(reverse('kegiatan-list') + '?cursor=&page_size=100', self.add_kegiatan)
+
+    def test_resep_list_with_children(self):
+        url = reverse('resep-list') + '?cursor=&page_size=100&expand=bahan,steps,tips,nutrisi,foto'
+        self.assertConstantQueries(url, self.add_resep)
+
+    def test_resep_summary_queries(self):
+        # Steps count and cover photo are subqueries of the page query
+        self.add_resep(0, 100)
+        cases = (
+            # ETag aggregate, paginator count, page
+            (reverse('resep-list'), 3, 10),
+            (reverse('resep-list') + '?cursor=&page_size=100', 2, 100),
+            # by_bahan: paginator count, page (no conditional GET)
+            (reverse('resep-by-bahan') + '?bahan=garam', 2, 10),
+        )
+        for url, queries, rows in cases:
+            with self.subTest(url=url), self.assertNumQueries(queries):
+                response = self.client.get(url)
+                self.assertEqual(len(response.data['results']), rows)
+                self.assertIn('cover', response.data['results'][0])
+
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.client.get(reverse('resep-by-kategori') + '?kategori=makanan').data), 100)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ConditionalGetTests(CacheIsolationMixin, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.jenis = JenisKegiatan.objects.create(nama='Bagi Makanan')
+        for pk, nama in ((1, 'Direncanakan'), (2, 'Berlangsung'), (STATUS_SELESAI_ID, 'Selesai')):
+            StatusKegiatan.objects.create(pk=pk, nama=nama)
+        cls.resep = make_resep()
+        cls.bahan = BahanResep.objects.create(resep=cls.resep, nama='2 siung bawang putih', takaran='2')
+        cls.nutrisi = NutrisiResep.objects.create(resep=cls.resep, label='Protein', nilai='15g')
+
+    def get(self, url, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(url, **headers)
+
+    def assertEtagChanges(self, url, write):
+        """The cached ETag is answered with 304 until ``write`` runs, then 200."""
+        etag = self.get(url)['ETag']
+        self.assertEqual(self.get(url, etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+        response = self.get(url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response
+
+    def test_update_changes_detail_and_list(self):
+        detail = reverse('resep-detail', args=[self.resep.pk])
+        for url in (detail, reverse('resep-list')):
+            with self.subTest(url=url):
+                self.assertEtagChanges(url, lambda: self.client.patch(
+                    detail, {'judul': f'Nasi Goreng {url}'}, format='json'
+                ))
+
+    def test_create_and_delete_change_list(self):
+        url = reverse('resep-list')
+        created = []
+        self.assertEtagChanges(url, lambda: created.append(make_resep(judul='Soto')))
+        self.assertEtagChanges(url, lambda: created[0].delete())
+
+    def test_child_write_changes_parent(self):
+        url = reverse('resep-detail', args=[self.resep.pk])
+        response = self.assertEtagChanges(url, lambda: self.client.post(
+            reverse('bahan-resep-list'), {'resep': self.resep.pk, 'nama': 'garam', 'takaran': '1 sdt'}, format='json'
+        ))
+        self.assertIn('garam', [bahan['nama'] for bahan in response.data['bahan']])
+        self.assertEtagChanges(url, lambda: self.bahan.delete())
+
+    def test_lookup_rename_changes_dependent_list(self):
+        Kegiatan.objects.create(
+            nama='Jumat Berkah', deskripsi='-', tanggal=date(2030, 1, 1), lokasi=Point(110.37, -7.79),
+            jenis_kegiatan=self.jenis, status_kegiatan_id=1,
+        )
+
+        def rename():
+            self.jenis.nama = 'Berbagi Makanan'
+            self.jenis.save()
+
+        response = self.assertEtagChanges(reverse('kegiatan-list'), rename)
+        self.assertEqual(response.data['results'][0]['jenis_kegiatan_detail']['nama'], 'Berbagi Makanan')
+
+    def test_status_roll_over_changes_kegiatan(self):
+        kegiatan = Kegiatan.objects.create(
+            nama='Kemarin', deskripsi='-', tanggal=date(2020, 1, 1), lokasi=Point(110.37, -7.79),
+            jenis_kegiatan=self.jenis, status_kegiatan_id=1,
+        )
+        response = self.assertEtagChanges(
+            reverse('kegiatan-detail', args=[kegiatan.pk]), auto_complete_past_kegiatan
+        )
+        self.assertEqual(response.data['status_kegiatan'], STATUS_SELESAI_ID)
+
+    def test_backfills_change_resep(self):
+        url = reverse('resep-list')
+
+        def stale_nutrisi():
+            NutrisiResep.objects.filter(pk=self.nutrisi.pk).update(kunci='', jumlah=None, satuan='')
+            nutrition.backfill()
+
+        def stale_bahan():
+            BahanResep.objects.filter(pk=self.bahan.pk).update(nama_normal='')
+            ingredients.rebuild_index()
+
+        for write in (stale_nutrisi, stale_bahan):
+            with self.subTest(write=write.__name__):
+                self.assertEtagChanges(url, write)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ResponseCacheTests(CacheIsolationMixin, APITestCase):
+    def cache_key(self, pk=None):
+        request = Request(APIRequestFactory().get('/api/resep/'))
+        return response_cache.cache_key(request, 'resep', pk)
+
+    def test_invalidation_waits_for_commit(self):
+        list_key, detail_key = self.cache_key(), self.cache_key(pk=1)
+        with self.captureOnCommitCallbacks() as callbacks:
+            response_cache.invalidate('resep', 1)
+            # A request inside the write transaction still sees the old tokens
+            self.assertEqual(self.cache_key(), list_key)
+            self.assertEqual(self.cache_key(pk=1), detail_key)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(self.cache_key(), list_key)
+        self.assertNotEqual(self.cache_key(pk=1), detail_key)
+
+    def test_write_through_api_evicts_cached_detail(self):
+        resep = make_resep()
+        url = reverse('resep-detail', args=[resep.pk]) + '?fields=id,judul'
+        self.assertEqual(self.client.get(url).data['judul'], 'Nasi Goreng')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(reverse('resep-detail', args=[resep.pk]), {'judul': 'Mie Goreng'}, format='json')
+        self.assertEqual(self.client.get(url).data['judul'], 'Mie Goreng')
+
+
+class FakeStorage:
+    """delete_keys() stand-in: fails the keys in ``failing`` (or raises)."""
+
+    def __init__(self, failing=(), exception=None):
+        self.failing = set(failing)
+        self.exception = exception
+        self.deleted = []
+
+    def delete_keys(self, keys):
+        if self.exception:
+            raise self.exception
+        keys = list(keys)
+        self.deleted += [key for key in keys if key not in self.failing]
+        return {key: 'AccessDenied: nope' for key in keys if key in self.failing}
+
+
+class FakeS3Client:
+    """In-memory stand-in for the boto3 S3 client calls the app makes."""
+
+    def __init__(self):
+        self.objects = {}  # key -> (body, content type)
+        self.multipart = {}  # upload id -> (key, content type, {part number: body})
+        self.aborted = []
+
+    def not_found(self, operation):
+        return ClientError({'Error': {'Code': '404', 'Message': 'Not Found'}}, operation)
+
+    def put_object(self, Bucket, Key, Body, ContentType=None, **kwargs):
+        self.objects[Key] = (bytes(Body), ContentType)
+
+    def copy_object(self, Bucket, Key, CopySource, ContentType=None, **kwargs):
+        if CopySource['Key'] not in self.objects:
+            raise self.not_found('CopyObject')
+        self.objects[Key] = (self.objects[CopySource['Key']][0], ContentType)
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise self.not_found('HeadObject')
+        body, content_type = self.objects[Key]
+        return {'ContentType': content_type, 'ContentLength': len(body)}
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise self.not_found('GetObject')
+        return {'Body': io.BytesIO(self.objects[Key][0])}
+
+    def create_multipart_upload(self, Bucket, Key, ContentType=None):
+        upload_id = f'upload-{len(self.multipart) + len(self.aborted) + 1}'
+        self.multipart[upload_id] = (Key, ContentType, {})
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.multipart[UploadId][2][PartNumber] = bytes(Body)
+        return {'ETag': f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        key, content_type, parts = self.multipart.pop(UploadId)
+        self.objects[key] = (b''.join(parts[part['PartNumber']] for part in MultipartUpload['Parts']), content_type)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        del self.multipart[UploadId]
+        self.aborted.append(Key)
+
+    def generate_presigned_post(self, Bucket, Key, Fields, Conditions, ExpiresIn):
+        return {'url': f'https://s3.amazonaws.com/{Bucket}', 'fields': {'key': Key, **Fields}}
+
+
+class FakeS3Mixin:
+    """Route every S3 call of the app to ``self.s3`` (a FakeS3Client)."""
+
+    def setUp(self):
+        super().setUp()
+        self.s3 = FakeS3Client()
+        for module in ('storage_backends', 'content_store', 'images', 'upload_views'):
+            patcher = mock.patch(f'dhaharan.{module}.get_s3_client', return_value=self.s3)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+# S3 uploads are only enabled with credentials configured
+S3_SETTINGS = {'AWS_ACCESS_KEY_ID': 'test', 'AWS_SECRET_ACCESS_KEY': 'test'}
+
+
+def image_bytes(size=(40, 30), fmt='JPEG'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 120, 40)).save(buffer, fmt)
+    return buffer.getvalue()
+
+
+class StorageOutboxTests(TestCase):
+    def test_deletes_due_keys(self):
+        outbox.enqueue_keys(['a', 'b', ''])
+        storage = FakeStorage()
+        self.assertEqual(outbox.process_batch(storage=storage), (2, 0))
+        self.assertEqual(sorted(storage.deleted), ['a', 'b'])
+        self.assertFalse(StorageOutbox.objects.exists())
+
+    def test_failures_back_off_then_retry(self):
+        outbox.enqueue_keys(['ok', 'bad'])
+        before = timezone.now()
+        self.assertEqual(outbox.process_batch(storage=FakeStorage(failing={'bad'})), (1, 1))
+
+        row = StorageOutbox.objects.get()
+        self.assertEqual((row.key, row.attempts), ('bad', 1))
+        self.assertIn('AccessDenied', row.last_error)
+        self.assertGreaterEqual(row.next_attempt_at, before + outbox.backoff(1))
+
+        # Not due yet
+        self.assertEqual(outbox.process_batch(storage=FakeStorage()), (0, 0))
+
+        StorageOutbox.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(outbox.process_batch(storage=FakeStorage(failing={'bad'})), (0, 1))
+        self.assertEqual(StorageOutbox.objects.get().attempts, 2)
+
+        StorageOutbox.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(outbox.process_batch(storage=FakeStorage()), (1, 0))
+        self.assertFalse(StorageOutbox.objects.exists())
+
+    def test_storage_exception_fails_whole_batch(self):
+        outbox.enqueue_keys(['a', 'b'])
+        self.assertEqual(outbox.process_batch(storage=FakeStorage(exception=OSError('timeout'))), (0, 2))
+        self.assertEqual(set(StorageOutbox.objects.values_list('attempts', flat=True)), {1})
+
+    def test_backoff_doubles_up_to_the_cap(self):
+        self.assertEqual(outbox.backoff(1), timedelta(seconds=outbox.BACKOFF_BASE_SECONDS))
+        self.assertEqual(outbox.backoff(3), timedelta(seconds=4 * outbox.BACKOFF_BASE_SECONDS))
+        self.assertEqual(outbox.backoff(50), timedelta(seconds=outbox.BACKOFF_MAX_SECONDS))
+
+
+class StorageOutboxWorkerTests(TestCase):
+    def test_deleted_photo_is_removed_from_s3(self):
+        key = f'{settings.AWS_S3_PREFIX}/resep/foto.jpg'
+        variant = f'{settings.AWS_S3_PREFIX}/resep/foto_w320.webp'
+        foto = FotoResep.objects.create(
+            resep=make_resep(), file_path=key_url(key), file_name='foto.jpg', variants={'320': {'webp': variant}},
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            foto.delete()
+
+        storage = FakeStorage()
+        self.assertEqual(tasks.process_storage_outbox(storage=storage), (0, 2, 0))
+        self.assertEqual(sorted(storage.deleted), [key, variant])
+        self.assertFalse(StorageOutbox.objects.exists())
+
+    def test_pass_expires_unattached_uploads(self):
+        sha256 = 'b' * 64
+        key = content_store.content_key(sha256, 'image/png')
+        StoredObject.objects.create(sha256=sha256, key=key, pending_count=1, pending_until=timezone.now())
+        storage = FakeStorage()
+        expired, deleted, failed = tasks.process_storage_outbox(storage=storage)
+        self.assertEqual((expired, failed), (1, 0))
+        self.assertEqual(sorted(storage.deleted), sorted([key] + images.all_variant_keys(key)))
+
+    def test_pass_drains_full_batches(self):
+        outbox.enqueue_keys([f'k{i}' for i in range(5)])
+        self.assertEqual(tasks.process_storage_outbox(storage=FakeStorage(), batch_size=2), (0, 5, 0))
+
+    def test_worker_thread_starts_once_per_process(self):
+        with mock.patch.object(tasks, '_started', set()), mock.patch.object(tasks.threading, 'Thread') as thread:
+            tasks.start_storage_outbox_worker()
+            tasks.start_storage_outbox_worker()
+        thread.assert_called_once_with(target=tasks.run_storage_outbox_forever, name='storage-outbox', daemon=True)
+        thread.return_value.start.assert_called_once_with()
+
+
+class ContentStoreReferenceTests(TestCase):
+    def stored(self, **kwargs):
+        sha256 = 'a' * 64
+        return StoredObject.objects.create(
+            sha256=sha256, key=content_store.content_key(sha256, 'image/jpeg'), **kwargs
+        )
+
+    def queued(self, key):
+        return StorageOutbox.objects.filter(key=key).exists()
+
+    def test_pending_reference_survives_last_release(self):
+        # A duplicate upload is waiting to be attached when the last row goes
+        stored = self.stored(ref_count=1, pending_count=1, pending_until=timezone.now() + content_store.PENDING_TTL)
+        content_store.release(stored.key)
+        stored.refresh_from_db()
+        self.assertEqual((stored.ref_count, stored.pending_count), (0, 1))
+        self.assertFalse(self.queued(stored.key))
+
+        content_store.acquire(stored.key)
+        stored.refresh_from_db()
+        self.assertEqual((stored.ref_count, stored.pending_count), (1, 0))
+
+        content_store.release(stored.key)
+        self.assertFalse(StoredObject.objects.filter(pk=stored.pk).exists())
+        self.assertTrue(self.queued(stored.key))
+
+    def test_unattached_upload_expires(self):
+        stored = self.stored(pending_count=1, pending_until=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(content_store.expire_pending(), 1)
+        self.assertFalse(StoredObject.objects.filter(pk=stored.pk).exists())
+        self.assertTrue(self.queued(stored.key))
+
+    def test_expiry_keeps_attached_objects(self):
+        stored = self.stored(ref_count=2, pending_count=1, pending_until=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(content_store.expire_pending(), 0)
+        stored.refresh_from_db()
+        self.assertEqual((stored.ref_count, stored.pending_count), (2, 0))
+        self.assertFalse(self.queued(stored.key))
+
+
+class StoreStagedTests(FakeS3Mixin, TestCase):
+    def stage(self, name, body):
+        key = f'{settings.AWS_S3_PREFIX}/{upload_handlers.STAGING_FOLDER}/{name}'
+        self.s3.put_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key, Body=body, ContentType='image/jpeg')
+        return upload_handlers.S3UploadedFile(
+            key, 'foto.jpg', 'image/jpeg', len(body), sha256=hashlib.sha256(body).hexdigest(),
+        )
+
+    def test_reupload_after_delete_keeps_object_and_variants(self):
+        body = image_bytes()
+        first = self.stage('first', body)
+        key, _ = content_store.store_staged(first)
+        content_store.acquire(key)
+        content_store.release(key)
+        self.assertEqual(
+            set(StorageOutbox.objects.values_list('key', flat=True)),
+            {first.s3_key, key, *images.all_variant_keys(key)},
+        )
+
+        # Uploaded again before the outbox worker ran
+        second = self.stage('second', body)
+        self.assertEqual(content_store.store_staged(second), (key, True))
+        storage = FakeStorage()
+        tasks.process_storage_outbox(storage=storage)
+        self.assertEqual(sorted(storage.deleted), sorted([first.s3_key, second.s3_key]))
+        self.assertIn(key, self.s3.objects)
+
+
+def s3_object(key, age=timedelta(days=2), size=10):
+    return {'Key': key, 'Size': size, 'LastModified': datetime.now(dt_timezone.utc) - age}
+
+
+class FakeS3Lister:
+    """list_objects_v2 paginator stand-in serving ``objects`` in key order, two per page."""
+
+    def __init__(self, objects):
+        self.objects = sorted(objects, key=lambda obj: obj['Key'].encode('utf-8'))
+
+    def get_paginator(self, operation):
+        return self
+
+    def paginate(self, Bucket, Prefix, PaginationConfig):
+        matching = [obj for obj in self.objects if obj['Key'].startswith(Prefix)]
+        return [{'Contents': matching[i:i + 2]} for i in range(0, len(matching), 2)] or [{}]
+
+
+class OrphanMergeTests(SimpleTestCase):
+    def keys(self, objects):
+        return [obj['Key'] for obj in objects]
+
+    def test_merge_join_yields_unreferenced_objects(self):
+        objects = [s3_object(key) for key in ['a', 'b', 'c', 'd', 'e', 'é']]
+        orphans = reconcile.find_orphans(iter(objects), iter(['0', 'b', 'bb', 'd', 'é', 'z']))
+        self.assertEqual(self.keys(orphans), ['a', 'c', 'e'])
+
+    def test_no_references_or_no_objects(self):
+        objects = [s3_object('a'), s3_object('b')]
+        self.assertEqual(self.keys(reconcile.find_orphans(objects, [])), ['a', 'b'])
+        self.assertEqual(list(reconcile.find_orphans([], ['a'])), [])
+
+    def test_batches_skip_young_objects(self):
+        objects = [s3_object(f'k{i}') for i in range(5)] + [s3_object('new', age=timedelta(minutes=5))]
+        batches = list(reconcile.batched_orphans(objects, timedelta(hours=1), batch_size=2))
+        self.assertEqual([self.keys(batch) for batch in batches], [['k0', 'k1'], ['k2', 'k3'], ['k4']])
+
+
+class ReconcileTests(TestCase):
+    def key(self, name):
+        return f'{settings.AWS_S3_PREFIX}/{name}'
+
+    def test_reconcile_deletes_only_orphans(self):
+        resep = make_resep()
+        FotoResep.objects.create(resep=resep, file_path=key_url(self.key('resep/foto.jpg')), file_name='foto.jpg')
+        attached = StoredObject.objects.create(sha256='1' * 64, key=self.key('content/1.jpg'), ref_count=1)
+        unattached = StoredObject.objects.create(sha256='2' * 64, key=self.key('content/2.jpg'))
+        StorageOutbox.objects.create(key=self.key('resep/queued.jpg'))
+
+        lister = FakeS3Lister([
+            s3_object(self.key('resep/foto.jpg')),
+            s3_object(self.key('content/1.jpg')),
+            s3_object(self.key('content/2.jpg')),
+            s3_object(self.key('resep/queued.jpg')),
+            s3_object(self.key('resep/orphan.jpg'), size=7),
+            s3_object(self.key('resep/fresh.jpg'), age=timedelta(minutes=1)),
+        ])
+        storage = FakeStorage()
+        count, size, failed = reconcile.reconcile(delete=True, storage=storage, s3_client=lister)
+
+        self.assertEqual(sorted(storage.deleted), [self.key('content/2.jpg'), self.key('resep/orphan.jpg')])
+        self.assertEqual((count, size, failed), (2, 17, 0))
+        self.assertTrue(StoredObject.objects.filter(pk=attached.pk).exists())
+        self.assertFalse(StoredObject.objects.filter(pk=unattached.pk).exists())
+
+    def test_report_only_deletes_nothing(self):
+        StoredObject.objects.create(sha256='3' * 64, key=self.key('content/3.jpg'))
+        lister = FakeS3Lister([s3_object(self.key('content/3.jpg'))])
+        storage = FakeStorage()
+        self.assertEqual(reconcile.reconcile(storage=storage, s3_client=lister), (1, 10, 0))
+        self.assertEqual(storage.deleted, [])
+        self.assertEqual(StoredObject.objects.count(), 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class NestedResepWriteTests(CacheIsolationMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.resep = make_resep()
+        self.step1 = StepsResep.objects.create(resep=self.resep, urutan=1, nama='Panaskan minyak')
+        self.step2 = StepsResep.objects.create(resep=self.resep, urutan=2, nama='Masukkan nasi')
+        self.url = reverse('resep-detail', args=[self.resep.pk])
+
+    def patch(self, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.patch(self.url, data, format='json')
+
+    def test_patch_creates_updates_and_deletes(self):
+        response = self.patch({'steps': [
+            {'id': self.step1.pk, 'nama': 'Panaskan minyak goreng'},
+            {'urutan': 3, 'nama': 'Sajikan'},
+        ]})
+        self.assertEqual(response.status_code, 200)
+
+        steps = list(self.resep.steps.order_by('urutan').values_list('id', 'urutan', 'nama'))
+        self.assertEqual(steps[0], (self.step1.pk, 1, 'Panaskan minyak goreng'))
+        self.assertEqual(steps[1][1:], (3, 'Sajikan'))
+        self.assertEqual(len(steps), 2)
+        self.assertFalse(StepsResep.objects.filter(pk=self.step2.pk).exists())
+        self.assertEqual([step['nama'] for step in response.data['steps']], ['Panaskan minyak goreng', 'Sajikan'])
+
+    def test_patch_without_array_leaves_children(self):
+        self.assertEqual(self.patch({'judul': 'Nasi Goreng Kampung'}).status_code, 200)
+        self.assertEqual(self.resep.steps.count(), 2)
+
+    def test_new_items_need_required_fields(self):
+        for data in (
+            {'steps': [{'nama': 'Tanpa urutan'}]},
+            {'tips': [{'urutan': 1}]},
+            {'bahan': [{'takaran': '1 sdt'}]},
+        ):
+            with self.subTest(data=data):
+                response = self.patch(data)
+                self.assertEqual(response.status_code, 400)
+                relation = next(iter(data))
+                self.assertIn(relation, response.data)
+        self.assertEqual(self.resep.steps.count(), 2)
+        self.assertFalse(self.resep.bahan.exists())
+
+    def test_unknown_child_id_is_rejected(self):
+        other = make_resep(judul='Soto')
+        foreign = StepsResep.objects.create(resep=other, urutan=1, nama='Rebus ayam')
+        response = self.patch({'steps': [{'id': foreign.pk, 'nama': 'Diambil alih'}]})
+        self.assertEqual(response.status_code, 400)
+        foreign.refresh_from_db()
+        self.assertEqual(foreign.nama, 'Rebus ayam')
+
+
+class IngredientParserTests(SimpleTestCase):
+    def test_normalize(self):
+        cases = {
+            '2 siung Bawang Putih (cincang)': 'bawang putih',
+            'cabe rawit 5 bh': 'cabai rawit',
+            'Cabe2 merah': 'cabai merah',
+            'Gula Jawa 100 gr': 'gula merah',
+            'telor ayam 2 butir': 'telur ayam',
+            'Minyak sayur secukupnya': 'minyak goreng',
+            'Sereh 2 batang, memarkan': 'serai',
+            '1/2 sdt merica bubuk': 'lada bubuk',
+            '': '',
+        }
+        for nama, expected in cases.items():
+            with self.subTest(nama=nama):
+                self.assertEqual(ingredients.normalize(nama), expected)
+
+    def test_parse_terms(self):
+        self.assertEqual(ingredients.parse_terms('Bawang putih, bawang putih; telor\n'), ['bawang putih', 'telur'])
+        self.assertEqual(ingredients.parse_terms(' , ;'), [])
+        many = ','.join(f'bahan{chr(97 + i // 26)}{chr(97 + i % 26)}' for i in range(30))
+        self.assertEqual(len(ingredients.parse_terms(many)), ingredients.MAX_TERMS)
+
+
+class JumlahBahanTests(TestCase):
+    def test_count_follows_creates_deletes_and_moves(self):
+        resep, other = make_resep(), make_resep(judul='Soto')
+        bahan = BahanResep.objects.create(resep=resep, nama='garam', takaran='1 sdt')
+        BahanResep.objects.create(resep=resep, nama='gula', takaran='1 sdt')
+        resep.refresh_from_db()
+        self.assertEqual(resep.jumlah_bahan, 2)
+
+        bahan.resep = other
+        bahan.save()
+        resep.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((resep.jumlah_bahan, other.jumlah_bahan), (1, 1))
+
+        bahan.delete()
+        other.refresh_from_db()
+        self.assertEqual(other.jumlah_bahan, 0)
+
+
+class NutritionParserTests(SimpleTestCase):
+    def test_parse_nutrisi(self):
+        cases = [
+            (('Protein', '15g'), ('protein', Decimal('15'), 'g')),
+            (('Lemak Total', '6,5 gram'), ('lemak', Decimal('6.5'), 'g')),
+            (('Natrium', '0.5 g'), ('natrium', Decimal('500.00'), 'mg')),
+            (('Natrium', '1.200 mg'), ('natrium', Decimal('1200'), 'mg')),
+            (('Kalium', '1.234,5 mg'), ('kalium', Decimal('1234.5'), 'mg')),
+            (('Kalori', '2.500kkal'), ('kalori', Decimal('2500'), 'kkal')),
+            (('Gula', '1.2345 g'), ('gula', Decimal('1.2345'), 'g')),
+            (('Kalori', '350 kkal'), ('kalori', Decimal('350'), 'kkal')),
+            (('Protein', '15'), ('protein', Decimal('15'), 'g')),
+            (('Serat (g)', '10-12g'), ('serat', Decimal('10'), 'g')),
+            (('Vitamin C', '20 mg'), ('vitamin_c', Decimal('20'), 'mg')),
+            (('Gula', '-'), ('gula', None, 'g')),
+        ]
+        for (label, nilai), expected in cases:
+            with self.subTest(label=label, nilai=nilai):
+                self.assertEqual(nutrition.parse_nutrisi(label, nilai), expected)
+
+    def test_oversized_amounts_are_not_stored(self):
+        self.assertEqual(nutrition.parse_storable('Natrium', '99999999999 mg'), ('natrium', None, 'mg'))
+        self.assertEqual(nutrition.parse_storable('Natrium', '9999999999 mg')[1], Decimal('9999999999'))
+
+    def test_parse_range_params(self):
+        ranges = nutrition.parse_range_params({
+            'protein_min': '10', 'protein_max': '20,5', 'kalori_max': '500', 'page': '2', 'foo_min': '1',
+        })
+        self.assertEqual(ranges, {
+            'protein': (Decimal('10'), Decimal('20.5')),
+            'kalori': (None, Decimal('500')),
+        })
+
+    def test_bad_range_values(self):
+        for value in ('abc', 'nan', 'inf', ''):
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    nutrition.parse_range_params({'protein_min': value})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class NutritionFilterTests(CacheIsolationMixin, APITestCase):
+    def test_list_filters_by_range(self):
+        lean, rich = make_resep(judul='Lean', kalori=300), make_resep(judul='Rich', kalori=800)
+        NutrisiResep.objects.create(resep=lean, label='Protein', nilai='25 g')
+        NutrisiResep.objects.create(resep=rich, label='Protein', nilai='5g')
+
+        response = self.client.get(reverse('resep-list'), {'protein_min': '10', 'kalori_max': '500'})
+        self.assertEqual([row['judul'] for row in response.data['results']], ['Lean'])
+        response = self.client.get(reverse('resep-list'), {'protein_min': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_oversized_amounts_are_rejected(self):
+        resep = make_resep()
+        # Eleven integer digits once converted to grams
+        nilai = '12.345.678 kg'
+        response = self.client.post(
+            reverse('nutrisi-resep-list'), {'resep': resep.pk, 'label': 'Protein', 'nilai': nilai}, format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('nilai', response.data)
+
+        response = self.client.patch(
+            reverse('resep-detail', args=[resep.pk]), {'nutrisi': [{'label': 'Protein', 'nilai': nilai}]},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(NutrisiResep.objects.exists())
+
+        response = self.client.post(
+            reverse('nutrisi-resep-list'), {'resep': resep.pk, 'label': 'Protein', 'nilai': '1.200 g'}, format='json',
+        )
+        self.assertEqual(response.data['jumlah'], '1200.00')
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ResepDocumentTests(CacheIsolationMixin, APITestCase):
+    def detail(self, resep):
+        return self.client.get(reverse('resep-detail', args=[resep.pk])).data
+
+    def test_document_follows_child_writes_and_moves(self):
+        resep, other = make_resep(), make_resep(judul='Soto')
+        bahan = BahanResep.objects.create(resep=resep, nama='garam', takaran='1 sdt')
+        self.assertEqual([row['nama'] for row in self.detail(resep)['bahan']], ['garam'])
+
+        before = self.detail(resep)['updated_at']
+        self.client.patch(reverse('bahan-resep-detail', args=[bahan.pk]), {'resep': other.pk}, format='json')
+        old, new = self.detail(resep), self.detail(other)
+        self.assertEqual(old['bahan'], [])
+        self.assertNotEqual(old['updated_at'], before)
+        self.assertEqual([row['nama'] for row in new['bahan']], ['garam'])
+
+    def test_backfills_rebuild_documents(self):
+        resep = make_resep()
+        nutrisi = NutrisiResep.objects.create(resep=resep, label='Protein', nilai='15g')
+        bahan = BahanResep.objects.create(resep=resep, nama='cabe rawit', takaran='5')
+        NutrisiResep.objects.filter(pk=nutrisi.pk).update(kunci='', jumlah=None, satuan='')
+        BahanResep.objects.filter(pk=bahan.pk).update(nama_normal='')
+        # Stored document with the stale columns, as before a backfill
+        documents.rebuild_now([resep.pk])
+        self.assertEqual(self.detail(resep)['nutrisi'][0]['kunci'], '')
+
+        nutrition.backfill()
+        ingredients.rebuild_index()
+
+        data = self.detail(resep)
+        self.assertEqual(data['nutrisi'][0]['kunci'], 'protein')
+        self.assertEqual(data['bahan'][0]['nama_normal'], 'cabai rawit')
+
+    def test_detail_etag_changes_after_backfill(self):
+        resep = make_resep()
+        nutrisi = NutrisiResep.objects.create(resep=resep, label='Protein', nilai='15g')
+        url = reverse('resep-detail', args=[resep.pk])
+        NutrisiResep.objects.filter(pk=nutrisi.pk).update(kunci='')
+        documents.rebuild_now([resep.pk])
+        etag = self.client.get(url)['ETag']
+        nutrition.backfill()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ConcurrentDocumentRebuildTests(CacheIsolationMixin, TransactionTestCase):
+    def test_stale_rebuild_waits_for_the_writer(self):
+        resep = make_resep()
+        ResepDokumen.objects.all().delete()
+        written, commit = threading.Event(), threading.Event()
+
+        def write():
+            try:
+                with transaction.atomic():
+                    BahanResep.objects.create(resep=resep, nama='garam', takaran='1 sdt')
+                    written.set()
+                    commit.wait(5)
+            finally:
+                connection.close()
+
+        def read():
+            # First access of a missing document, as documents.get() does
+            try:
+                documents.rebuild_now([resep.pk])
+            finally:
+                connection.close()
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        written.wait(5)
+        reader = threading.Thread(target=read)
+        reader.start()
+        # Without the lock the reader builds from the snapshot without the bahan
+        time.sleep(0.2)
+        commit.set()
+        writer.join()
+        reader.join()
+
+        data = ResepDokumen.objects.get(resep=resep).data
+        self.assertEqual([row['nama'] for row in data['bahan']], ['garam'])
+
+
+class GeoParamTests(SimpleTestCase):
+    def test_parse_bbox(self):
+        bbox = geo.parse_bbox('110.3,-7.9,110.5,-7.7')
+        self.assertEqual(bbox.extent, (110.3, -7.9, 110.5, -7.7))
+        self.assertEqual(bbox.srid, geo.SRID)
+        for value in (None, '', '1,2,3', 'a,b,c,d', '110.5,-7.9,110.3,-7.7', '0,0,181,1', '0,-91,1,0'):
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    geo.parse_bbox(value)
+
+    def test_parse_point_and_radius(self):
+        point = geo.parse_point('-7.79', '110.37')
+        self.assertEqual((point.x, point.y, point.srid), (110.37, -7.79, geo.SRID))
+        for lat, lng in ((None, '110'), ('x', '110'), ('91', '0'), ('0', '-181')):
+            with self.subTest(lat=lat, lng=lng):
+                with self.assertRaises(ValueError):
+                    geo.parse_point(lat, lng)
+
+        self.assertEqual(geo.parse_radius_km(None), 10.0)
+        self.assertEqual(geo.parse_radius_km('2.5'), 2.5)
+        for value in ('abc', '0', '-1', str(geo.MAX_RADIUS_KM + 1)):
+            with self.subTest(radius_km=value):
+                with self.assertRaises(ValueError):
+                    geo.parse_radius_km(value)
+
+    def test_radius_envelope_contains_circle(self):
+        point = geo.parse_point('-7.79', '110.37')
+        minx, miny, maxx, maxy = geo.radius_envelope(point, 10).extent
+        dlat = 10 / geo.KM_PER_DEGREE_LAT
+        self.assertAlmostEqual(miny, point.y - dlat)
+        self.assertAlmostEqual(maxy, point.y + dlat)
+        # A degree of longitude is shorter than a degree of latitude away from the equator
+        self.assertGreater(maxx - point.x, dlat)
+        self.assertAlmostEqual(point.x - minx, maxx - point.x)
+
+    def test_radius_envelope_is_clamped(self):
+        near_pole = geo.parse_point('89.9', '179')
+        self.assertEqual(geo.radius_envelope(near_pole, 500).extent[2:], (180, 90))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class KegiatanLocationTests(CacheIsolationMixin, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        jenis = JenisKegiatan.objects.create(nama='Bagi Makanan')
+        status = StatusKegiatan.objects.create(nama='Direncanakan')
+        cls.kegiatan = {
+            nama: Kegiatan.objects.create(
+                nama=nama, deskripsi='-', tanggal=date(2030, 1, 1), lokasi=Point(lng, lat),
+                jenis_kegiatan=jenis, status_kegiatan=status,
+            )
+            for nama, lng, lat in (
+                ('Tugu', 110.3671, -7.7829), ('Malioboro', 110.3653, -7.7926), ('Solo', 110.8243, -7.5695),
+            )
+        }
+
+    def names(self, response):
+        return [row['nama'] for row in response.data['results']]
+
+    def test_bbox_filters_list(self):
+        response = self.client.get(reverse('kegiatan-list'), {'bbox': '110.3,-7.9,110.5,-7.7'})
+        self.assertEqual(sorted(self.names(response)), ['Malioboro', 'Tugu'])
+        response = self.client.get(reverse('kegiatan-list'), {'bbox': '1,2,3'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_nearby_orders_by_distance(self):
+        url = reverse('kegiatan-nearby')
+        response = self.client.get(url, {'lat': '-7.7829', 'lng': '110.3671', 'radius_km': '5'})
+        self.assertEqual(self.names(response), ['Tugu', 'Malioboro'])
+        distances = [row['distance_km'] for row in response.data['results']]
+        self.assertEqual(distances[0], 0)
+        self.assertAlmostEqual(distances[1], 1.1, delta=0.2)
+
+        response = self.client.get(url, {'lat': '-7.7829', 'lng': '110.3671', 'radius_km': '100'})
+        self.assertEqual(self.names(response), ['Tugu', 'Malioboro', 'Solo'])
+        self.assertEqual(self.client.get(url, {'lat': 'x', 'lng': '110'}).status_code, 400)
+
+
+@override_settings(CACHES=TEST_CACHES, KEGIATAN_TILE_MAX_ZOOM=14)
+class KegiatanTileTests(CacheIsolationMixin, SimpleTestCase):
+    def tile_of(self, lng, lat, z):
+        n = 2 ** z
+        x = int((lng + 180) / 360 * n)
+        y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+        return z, x, y
+
+    def test_tiles_for_point_include_containing_tile(self):
+        tiles_ = set(tiles.tiles_for_point(110.37, -7.79))
+        for z in range(15):
+            with self.subTest(z=z):
+                self.assertIn(self.tile_of(110.37, -7.79, z), tiles_)
+                self.assertTrue(all(tiles.is_valid_tile(*tile) for tile in tiles_))
+        # Far from the tile edges at zoom 2 and 3: only the containing tile
+        self.assertEqual(sorted(tile for tile in tiles_ if tile[0] in (2, 3)), [(2, 3, 2), (3, 6, 4)])
+
+    def test_tiles_for_point_include_buffered_neighbours(self):
+        # Just east of the meridian: also drawn in the buffer of the tiles to the west
+        zoom1 = {tile for tile in tiles.tiles_for_point(0.0001, -30) if tile[0] == 1}
+        self.assertEqual(zoom1, {(1, 0, 1), (1, 1, 1)})
+        # Latitudes beyond the Web Mercator limit are clamped, not rejected
+        self.assertIn((14, 0, 0), set(tiles.tiles_for_point(-180, 90)))
+
+    def test_is_valid_tile(self):
+        self.assertTrue(tiles.is_valid_tile(0, 0, 0))
+        self.assertTrue(tiles.is_valid_tile(2, 3, 3))
+        for tile in ((2, 4, 0), (2, 0, -1), (-1, 0, 0), (15, 0, 0)):
+            with self.subTest(tile=tile):
+                self.assertFalse(tiles.is_valid_tile(*tile))
+
+    def test_invalidation(self):
+        with mock.patch.object(tiles, 'render_tile', side_effect=lambda z, x, y: b'tile') as render:
+            z, x, y = self.tile_of(110.37, -7.79, 10)
+            tiles.get_tile(z, x, y)
+            tiles.get_tile(z, x, y)
+            self.assertEqual(render.call_count, 1)
+
+            # A point elsewhere leaves the tile cached
+            tiles.invalidate_point(Point(-70, 40))
+            tiles.get_tile(z, x, y)
+            self.assertEqual(render.call_count, 1)
+
+            tiles.invalidate_point(Point(110.37, -7.79))
+            tiles.get_tile(z, x, y)
+            self.assertEqual(render.call_count, 2)
+
+            tiles.invalidate_all()
+            tiles.get_tile(z, x, y)
+            self.assertEqual(render.call_count, 3)
+
+
+class ClusterParamTests(SimpleTestCase):
+    def test_parse_zoom(self):
+        self.assertEqual(geo.parse_zoom('8'), 8)
+        for value in (None, 'x', '1.5', '-1', str(geo.MAX_ZOOM + 1)):
+            with self.subTest(zoom=value):
+                with self.assertRaises(ValueError):
+                    geo.parse_zoom(value)
+
+    def test_cell_size_halves_per_zoom(self):
+        self.assertAlmostEqual(geo.cluster_cell_size(0), geo.WORLD_WIDTH_M / 4)
+        for zoom in range(1, geo.MAX_ZOOM + 1):
+            self.assertAlmostEqual(geo.cluster_cell_size(zoom) * 2, geo.cluster_cell_size(zoom - 1))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class KegiatanClusterTests(CacheIsolationMixin, APITestCase):
+    def test_clusters_group_nearby_points(self):
+        jenis = JenisKegiatan.objects.create(nama='Bagi Makanan')
+        status = StatusKegiatan.objects.create(nama='Direncanakan')
+        created = [
+            Kegiatan.objects.create(
+                nama=nama, deskripsi='-', tanggal=date(2030, 1, 1), lokasi=Point(lng, lat), jumlah_peserta=peserta,
+                jenis_kegiatan=jenis, status_kegiatan=status,
+            )
+            for nama, lng, lat, peserta in (
+                ('Tugu', 110.3671, -7.7829, 10), ('Malioboro', 110.3653, -7.7926, 5), ('Monas', 106.8272, -6.1754, 7),
+            )
+        ]
+        response = self.client.get(reverse('kegiatan-clusters'), {'bbox': '105,-9,112,-5', 'zoom': '5'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['cell_size_m'], geo.cluster_cell_size(5))
+
+        yogya, jakarta = response.data['clusters']
+        self.assertEqual((yogya['jumlah'], yogya['total_peserta'], yogya['kegiatan_id']), (2, 15, None))
+        self.assertEqual(yogya['per_jenis'], [{'jenis_kegiatan': jenis.pk, 'nama': 'Bagi Makanan', 'jumlah': 2}])
+        self.assertEqual((jakarta['jumlah'], jakarta['kegiatan_id']), (1, created[2].pk))
+        self.assertEqual(jakarta['lokasi']['coordinates'], [106.8272, -6.1754])
+
+    def test_clusters_need_bbox_and_zoom(self):
+        url = reverse('kegiatan-clusters')
+        for params in ({'zoom': '5'}, {'bbox': '105,-9,112,-5'}, {'bbox': '105,-9,112,-5', 'zoom': '40'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+
+
+class FeatureCollectionStreamTests(SimpleTestCase):
+    def row(self, pk):
+        return (pk, f'K{pk}', date(2030, 1, pk), pk * 10, Point(110 + pk, -7), 1, 'Bagi Makanan', 2, 'Berlangsung')
+
+    def collect(self, rows):
+        return json.loads(''.join(stream_feature_collection(rows)))
+
+    def test_features(self):
+        data = self.collect([self.row(1), self.row(2)])
+        self.assertEqual(data['type'], 'FeatureCollection')
+        self.assertEqual(data['features'][1], {
+            'type': 'Feature',
+            'id': 2,
+            'geometry': {'type': 'Point', 'coordinates': [112.0, -7.0]},
+            'properties': {
+                'nama': 'K2', 'tanggal': '2030-01-02', 'jumlah_peserta': 20,
+                'jenis_kegiatan': 1, 'jenis_kegiatan_nama': 'Bagi Makanan',
+                'status_kegiatan': 2, 'status_kegiatan_nama': 'Berlangsung',
+            },
+        })
+
+    def test_empty_and_chunked(self):
+        self.assertEqual(self.collect([]), {'type': 'FeatureCollection', 'features': []})
+        rows = [self.row(pk % 28 + 1) for pk in range(1201)]
+        chunks = list(stream_feature_collection(rows))
+        # Opening, three buffered writes (500, 500, 201 features), closing
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(len(json.loads(''.join(chunks))['features']), 1201)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class KegiatanGeoJSONTests(CacheIsolationMixin, APITestCase):
+    def test_streams_all_or_bbox(self):
+        jenis = JenisKegiatan.objects.create(nama='Bagi Makanan')
+        status = StatusKegiatan.objects.create(nama='Direncanakan')
+        for nama, lng, lat in (('Tugu', 110.3671, -7.7829), ('Monas', 106.8272, -6.1754)):
+            Kegiatan.objects.create(
+                nama=nama, deskripsi='-', tanggal=date(2030, 1, 1), lokasi=Point(lng, lat),
+                jenis_kegiatan=jenis, status_kegiatan=status,
+            )
+        url = reverse('kegiatan-geojson')
+
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'application/geo+json')
+        features = json.loads(b''.join(response.streaming_content))['features']
+        self.assertEqual([f['properties']['nama'] for f in features], ['Tugu', 'Monas'])
+
+        response = self.client.get(url, {'bbox': '106,-7,107,-6'})
+        features = json.loads(b''.join(response.streaming_content))['features']
+        self.assertEqual([f['properties']['nama'] for f in features], ['Monas'])
+        self.assertEqual(self.client.get(url, {'bbox': 'x'}).status_code, 400)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SparseFieldsTests(CacheIsolationMixin, APITestCase):
+    def test_fields_and_expand_trim_reads(self):
+        resep = make_resep()
+        StepsResep.objects.create(resep=resep, urutan=1, nama='Aduk')
+        url = reverse('resep-detail', args=[resep.pk])
+        self.assertEqual(set(self.client.get(url, {'fields': 'id,judul'}).data), {'id', 'judul'})
+        data = self.client.get(url, {'expand': 'steps'}).data
+        self.assertIn('steps', data)
+        self.assertNotIn('bahan', data)
+
+    def test_writes_ignore_fields(self):
+        body = {
+            'judul': 'Soto', 'deskripsi': '-', 'kategori': 'makanan', 'tingkat_kesulitan': 'sedang',
+            'waktu_memasak': 30, 'waktu_persiapan': 15, 'porsi': 4, 'kalori': 300,
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('resep-list') + '?fields=id,judul', body, format='json')
+        self.assertEqual(response.status_code, 201)
+        resep = Resep.objects.get(pk=response.data['id'])
+        self.assertEqual((resep.kategori, resep.porsi), ('makanan', 4))
+
+        url = reverse('resep-detail', args=[resep.pk]) + '?fields=id'
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(url, {'porsi': 6, 'judul': 'Soto Ayam'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        resep.refresh_from_db()
+        self.assertEqual((resep.judul, resep.porsi), ('Soto Ayam', 6))
+
+
+@override_settings(CACHES=TEST_CACHES, **S3_SETTINGS)
+class PresignedUploadTests(CacheIsolationMixin, FakeS3Mixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.resep = make_resep()
+
+    def presign(self, **data):
+        data = {'folder': 'resep', 'content_type': 'image/jpeg', 'file_name': 'foto.jpg', **data}
+        return self.client.post(reverse('upload-presign'), data, format='json')
+
+    def upload(self, key, content_type='image/jpeg'):
+        self.s3.put_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key, Body=image_bytes(), ContentType=content_type)
+
+    def confirm(self, token, target_id):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('upload-confirm'), {'token': token, 'target_id': target_id}, format='json')
+
+    def test_presign_validates_and_names_uniquely(self):
+        self.assertEqual(self.presign(folder='../etc').status_code, 400)
+        self.assertEqual(self.presign(content_type='text/html').status_code, 400)
+
+        first, second = self.presign(title='Nasi Goreng').data, self.presign(title='Nasi Goreng').data
+        self.assertTrue(first['key'].startswith(f'{settings.AWS_S3_PREFIX}/resep/Nasi_Goreng_'))
+        self.assertNotEqual(first['key'], second['key'])
+        self.assertEqual(first['fields']['Content-Type'], 'image/jpeg')
+
+    def test_confirm_is_idempotent(self):
+        presigned = self.presign().data
+        response = self.confirm(presigned['token'], self.resep.pk)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('not been uploaded', response.data['error'])
+
+        self.upload(presigned['key'])
+        response = self.confirm(presigned['token'], self.resep.pk)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['file_path'], key_url(presigned['key']))
+
+        # Replayed token: same row back, nothing created
+        replay = self.confirm(presigned['token'], self.resep.pk)
+        self.assertEqual((replay.status_code, replay.data['id']), (200, response.data['id']))
+        self.assertEqual(FotoResep.objects.filter(file_path=key_url(presigned['key'])).count(), 1)
+
+        other = make_resep(judul='Soto')
+        self.assertEqual(self.confirm(presigned['token'], other.pk).status_code, 400)
+        self.assertFalse(other.foto.exists())
+
+    def test_confirm_rejects_keys_that_were_not_presigned(self):
+        key = f'{settings.AWS_S3_PREFIX}/resep/someone-elses.jpg'
+        self.upload(key)
+        forged = signing.dumps({'key': key, 'folder': 'resep', 'file_name': 'x.jpg'}, salt='not-the-presign-salt')
+        presigned = self.presign().data
+        for token in (forged, '', presigned['token'][:-2] + 'xx'):
+            with self.subTest(token=token):
+                response = self.confirm(token, self.resep.pk)
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(FotoResep.objects.exists())
+
+    def test_confirm_checks_the_stored_object(self):
+        presigned = self.presign().data
+        self.upload(presigned['key'], content_type='text/html')
+        self.assertEqual(self.confirm(presigned['token'], self.resep.pk).status_code, 400)
+        self.assertEqual(self.confirm(presigned['token'], 0).status_code, 404)
+
+    def test_confirm_takes_the_key_lock(self):
+        presigned = self.presign().data
+        self.upload(presigned['key'])
+        with CaptureQueriesContext(connection) as queries:
+            self.confirm(presigned['token'], self.resep.pk)
+        statements = [query['sql'] for query in queries]
+        lock = next(i for i, sql in enumerate(statements) if 'pg_advisory_xact_lock' in sql)
+        insert = next(i for i, sql in enumerate(statements) if sql.startswith('INSERT INTO "foto_resep"'))
+        self.assertLess(lock, insert)
+
+
+@override_settings(CACHES=TEST_CACHES, **S3_SETTINGS)
+class ConcurrentConfirmTests(CacheIsolationMixin, FakeS3Mixin, TransactionTestCase):
+    def test_concurrent_confirms_attach_once(self):
+        resep = make_resep()
+        key = f'{settings.AWS_S3_PREFIX}/resep/foto.jpg'
+        self.s3.put_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key, Body=image_bytes(), ContentType='image/jpeg')
+        token = signing.dumps(
+            {'key': key, 'folder': 'resep', 'file_name': 'foto.jpg'}, salt=upload_views.PRESIGN_TOKEN_SALT,
+        )
+
+        real_attached_row = upload_views.attached_row
+
+        def slow_attached_row(folder, s3_key):
+            # Without the lock both requests would find no row and insert one
+            row = real_attached_row(folder, s3_key)
+            time.sleep(0.2)
+            return row
+
+        statuses = []
+
+        def confirm():
+            try:
+                response = APIClient().post(
+                    reverse('upload-confirm'), {'token': token, 'target_id': resep.pk}, format='json',
+                )
+                statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        with mock.patch.object(upload_views, 'attached_row', side_effect=slow_attached_row):
+            threads = [threading.Thread(target=confirm) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(sorted(statuses), [200, 201])
+        self.assertEqual(FotoResep.objects.filter(resep=resep).count(), 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ImageWorkerTests(CacheIsolationMixin, FakeS3Mixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.key = f'{settings.AWS_S3_PREFIX}/resep/foto.jpg'
+        self.s3.put_object(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=self.key, Body=image_bytes((1000, 500)),
+            ContentType='image/jpeg',
+        )
+        self.foto = FotoResep.objects.create(resep=make_resep(), file_path=key_url(self.key), file_name='foto.jpg')
+        self.load_source = images.load_source
+
+    def test_generates_variants(self):
+        self.assertEqual(images.process_pending(), 1)
+        self.foto.refresh_from_db()
+        self.assertEqual(sorted(self.foto.variants), ['320', '800'])
+        for key in images.variant_keys(self.foto.variants):
+            self.assertIn(key, self.s3.objects)
+        self.assertEqual(images.process_pending(), 0)
+
+    def test_new_photo_gets_metadata(self):
+        images.process_pending()
+        self.foto.refresh_from_db()
+        body = self.s3.objects[self.key][0]
+        self.assertEqual((self.foto.width, self.foto.height, self.foto.file_size), (1000, 500, len(body)))
+        self.assertTrue(self.foto.placeholder.startswith('data:image/webp;base64,'))
+
+    def test_metadata_survives_failed_variants(self):
+        with mock.patch.object(images, 'generate_variants', side_effect=OSError('encoder failed')):
+            images.process_pending()
+        self.foto.refresh_from_db()
+        self.assertEqual(self.foto.variants, {'_error': 'encoder failed'})
+        self.assertEqual((self.foto.width, self.foto.height), (1000, 500))
+
+    def test_missing_source_is_recorded(self):
+        del self.s3.objects[self.key]
+        images.process_pending()
+        self.foto.refresh_from_db()
+        self.assertIn('_error', self.foto.variants)
+        self.assertEqual(images.process_pending(), 0)
+
+    def test_s3_work_runs_outside_the_claim_transaction(self):
+        depth = len(connection.atomic_blocks)
+        seen = []
+
+        def load_source(key):
+            seen.append(len(connection.atomic_blocks))
+            # Claimed: no other worker picks the row up meanwhile
+            self.assertEqual(images._claim(FotoResep, 'variants', Q(variants={})), (None, None))
+            return self.load_source(key)
+
+        with mock.patch.object(images, 'load_source', side_effect=load_source):
+            self.assertEqual(images.process_pending(), 1)
+        self.assertEqual(seen, [depth])
+
+    def test_stale_claims_are_taken_over(self):
+        fresh = {images.CLAIM_KEY: int(time.time())}
+        FotoResep.objects.filter(pk=self.foto.pk).update(variants=fresh)
+        self.assertEqual(images.process_pending(), 0)
+
+        stale = {images.CLAIM_KEY: int(time.time() - images.CLAIM_TIMEOUT.total_seconds()) - 60}
+        FotoResep.objects.filter(pk=self.foto.pk).update(variants=stale)
+        self.assertEqual(images.process_pending(), 1)
+        self.foto.refresh_from_db()
+        self.assertIn('320', self.foto.variants)
+
+    def test_result_for_a_replaced_photo_is_dropped(self):
+        def load_source(key):
+            # The photo is replaced while the worker is busy with the old one
+            FotoResep.objects.filter(pk=self.foto.pk).update(
+                file_path=key_url(f'{settings.AWS_S3_PREFIX}/resep/baru.jpg'), variants={},
+            )
+            return self.load_source(key)
+
+        with mock.patch.object(images, 'load_source', side_effect=load_source):
+            self.assertEqual(images.process_pending(batch_size=1), 1)
+        self.foto.refresh_from_db()
+        self.assertEqual(self.foto.variants, {})
+
+    def test_worker_thread_starts_once_per_process(self):
+        with mock.patch.object(tasks, '_started', set()), mock.patch.object(tasks.threading, 'Thread') as thread:
+            tasks.start_image_worker()
+            tasks.start_image_worker()
+        thread.assert_called_once_with(target=tasks.run_image_variants_forever, name='image-variants', daemon=True)
+
+
+@override_settings(**S3_SETTINGS)
+class StreamingUploadHandlerTests(FakeS3Mixin, SimpleTestCase):
+    def parse(self, body, content_type='image/jpeg', **handler_kwargs):
+        request = APIRequestFactory().post(
+            '/api/upload/s3/', {'file': SimpleUploadedFile('foto.jpg', body, content_type=content_type)},
+            format='multipart',
+        )
+        handler = upload_handlers.S3MultipartUploadHandler(request, **handler_kwargs)
+        handler.chunk_size = 1024
+        request.upload_handlers = [handler]
+        return handler, request.FILES.get('file')
+
+    def test_small_file_is_one_put(self):
+        body = image_bytes()
+        handler, uploaded = self.parse(body)
+        self.assertEqual(handler.errors, [])
+        self.assertTrue(uploaded.s3_key.startswith(f'{settings.AWS_S3_PREFIX}/{upload_handlers.STAGING_FOLDER}/'))
+        self.assertEqual(self.s3.objects[uploaded.s3_key], (body, 'image/jpeg'))
+        self.assertEqual((uploaded.size, uploaded.sha256), (len(body), hashlib.sha256(body).hexdigest()))
+        self.assertEqual(uploaded.read(), body)
+
+    def test_large_file_is_sent_in_parts(self):
+        body = image_bytes() + bytes(range(256)) * 20
+        with mock.patch.object(upload_handlers, 'PART_SIZE', 1024):
+            handler, uploaded = self.parse(body)
+        self.assertEqual(self.s3.objects[uploaded.s3_key][0], body)
+        self.assertEqual(self.s3.multipart, {})
+        self.assertEqual(uploaded.sha256, hashlib.sha256(body).hexdigest())
+
+    def test_oversized_file_is_aborted(self):
+        body = image_bytes() + bytes(5000)
+        with mock.patch.object(upload_handlers, 'PART_SIZE', 1024):
+            handler, uploaded = self.parse(body, max_size=2500)
+        self.assertIsNone(uploaded)
+        self.assertIn('File too large', handler.errors[0])
+        self.assertEqual(len(self.s3.aborted), 1)
+        self.assertEqual((self.s3.objects, self.s3.multipart), ({}, {}))
+
+    def test_non_images_are_rejected(self):
+        for body, content_type in ((image_bytes(), 'text/plain'), (b'<html></html>' * 10, 'image/jpeg')):
+            with self.subTest(content_type=content_type):
+                handler, uploaded = self.parse(body, content_type=content_type)
+                self.assertIsNone(uploaded)
+                self.assertIn('Invalid file type', handler.errors[0])
+        self.assertEqual(self.s3.objects, {})
+
+    def test_interrupted_upload_is_aborted(self):
+        handler = upload_handlers.S3MultipartUploadHandler()
+        handler.new_file('file', 'foto.jpg', 'image/jpeg', None)
+        with mock.patch.object(upload_handlers, 'PART_SIZE', 1024):
+            handler.receive_data_chunk(image_bytes() + bytes(2048), 0)
+        handler.upload_interrupted()
+        self.assertEqual((len(self.s3.aborted), self.s3.multipart), (1, {}))
+
+    def test_failed_abort_is_logged(self):
+        handler = upload_handlers.S3MultipartUploadHandler()
+        handler.new_file('file', 'foto.jpg', 'image/jpeg', None)
+        with mock.patch.object(upload_handlers, 'PART_SIZE', 1024):
+            handler.receive_data_chunk(image_bytes() + bytes(2048), 0)
+        with mock.patch.object(self.s3, 'abort_multipart_upload', side_effect=OSError('timeout')):
+            with self.assertLogs('dhaharan.upload_handlers', 'WARNING'):
+                handler.upload_interrupted()
+
+
+@override_settings(CACHES=TEST_CACHES, **S3_SETTINGS)
+class StreamedUploadViewTests(CacheIsolationMixin, FakeS3Mixin, APITestCase):
+    def upload(self, body, content_type='image/jpeg'):
+        return self.client.post(
+            reverse('upload-s3'), {'file': SimpleUploadedFile('foto.jpg', body, content_type=content_type)},
+            format='multipart',
+        )
+
+    def test_duplicate_upload_reuses_the_stored_object(self):
+        body = image_bytes()
+        first, second = self.upload(body), self.upload(body)
+        self.assertEqual((first.status_code, second.status_code), (201, 201))
+        self.assertEqual((first.data['duplicate'], second.data['duplicate']), (False, True))
+        self.assertEqual(first.data['url'], second.data['url'])
+
+        key = content_store.content_key(hashlib.sha256(body).hexdigest(), 'image/jpeg')
+        self.assertEqual(first.data['url'], key_url(key))
+        self.assertEqual(self.s3.objects[key][0], body)
+        self.assertEqual(StoredObject.objects.get(key=key).pending_count, 2)
+        # Both staging objects are queued for deletion
+        self.assertEqual(StorageOutbox.objects.filter(key__contains='/incoming/').count(), 2)
+
+    def test_rejected_upload_is_400(self):
+        response = self.upload(b'<html></html>' * 10)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StoredObject.objects.exists())
+
+
+class MetadataCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = storage_backends.MetadataCache(max_entries=2, timeout=60, missing_timeout=5)
+        self.now = 1000.0
+        patcher = mock.patch('dhaharan.storage_backends.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_entries_expire(self):
+        self.cache.set('a', 10)
+        self.cache.set('gone', None)
+        self.assertEqual((self.cache.get('a'), self.cache.get('gone')), ((True, 10), (True, None)))
+
+        self.now += 10  # past missing_timeout only
+        self.assertEqual((self.cache.get('a'), self.cache.get('gone')), ((True, 10), (False, None)))
+        self.now += 60
+        self.assertEqual(self.cache.get('a'), (False, None))
+        self.assertEqual(self.cache.info(), {'hits': 3, 'misses': 2, 'size': 0, 'max_entries': 2})
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+        self.assertEqual([self.cache.get(key)[0] for key in 'abc'], [True, False, True])
+
+    def test_zero_timeout_is_not_cached(self):
+        cache = storage_backends.MetadataCache(max_entries=2, timeout=60, missing_timeout=0)
+        cache.set('gone', None)
+        self.assertEqual(cache.info()['size'], 0)
+
+    def test_invalidate_and_clear(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.invalidate(['a', 'missing'])
+        self.assertEqual((self.cache.get('a'), self.cache.get('b')), ((False, None), (True, 2)))
+        self.cache.clear()
+        self.assertEqual(self.cache.info(), {'hits': 0, 'misses': 0, 'size': 0, 'max_entries': 2})
+
+
+class S3StorageMetadataTests(FakeS3Mixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = storage_backends.MetadataCache(max_entries=10, timeout=60, missing_timeout=60)
+        patcher = mock.patch('dhaharan.storage_backends.get_metadata_cache', return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.storage = storage_backends.S3Storage()
+        self.key = self.storage._get_s3_key('kegiatan/a.jpg')
+
+    def test_size_and_exists_share_one_head_request(self):
+        self.s3.put_object(Bucket=self.storage.bucket_name, Key=self.key, Body=b'12345')
+        with mock.patch.object(self.s3, 'head_object', wraps=self.s3.head_object) as head:
+            self.assertTrue(self.storage.exists('kegiatan/a.jpg'))
+            self.assertEqual(self.storage.size('kegiatan/a.jpg'), 5)
+        self.assertEqual(head.call_count, 1)
+
+    def test_missing_key_is_cached(self):
+        with mock.patch.object(self.s3, 'head_object', wraps=self.s3.head_object) as head:
+            self.assertFalse(self.storage.exists('kegiatan/a.jpg'))
+            self.assertFalse(self.storage.exists('kegiatan/a.jpg'))
+        self.assertEqual(head.call_count, 1)
+
+    def test_other_errors_are_not_cached(self):
+        denied = ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'Forbidden'}}, 'HeadObject')
+        with mock.patch.object(self.s3, 'head_object', side_effect=denied) as head:
+            self.assertFalse(self.storage.exists('kegiatan/a.jpg'))
+            self.assertFalse(self.storage.exists('kegiatan/a.jpg'))
+        self.assertEqual(head.call_count, 2)
+        self.assertEqual(self.cache.info()['size'], 0)
+
+    def test_delete_invalidates(self):
+        self.cache.set(self.key, 5)
+        self.s3.delete_object = mock.Mock()
+        self.storage.delete('kegiatan/a.jpg')
+        self.assertEqual(self.cache.get(self.key), (False, None))
+
+
+class KeyFromUrlTests(SimpleTestCase):
+    def test_round_trip(self):
+        key = f'{settings.AWS_S3_PREFIX}/resep/nasi goreng.jpg'
+        self.assertEqual(storage_backends.key_from_url(key_url(key)), key)
+        self.assertEqual(storage_backends.S3Storage().url('resep/a.jpg'), key_url(f'{settings.AWS_S3_PREFIX}/resep/a.jpg'))
+
+    def test_foreign_url_is_rejected(self):
+        with self.assertRaises(ValueError):
+            storage_backends.key_from_url('https://example.com/other-bucket/a.jpg')
@@ -0,0 +1,22 @@
+"""
+Vector tile endpoint for the kegiatan map
+"""
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.views.decorators.http import require_GET
+
+from .tiles import get_tile, is_valid_tile
+
+
+@require_GET
+def kegiatan_tile(request, z, x, y):
+    """
+    GET /api/kegiatan/tiles/{z}/{x}/{y}.mvt
+    Layer 'kegiatan' with id, nama, tanggal, jumlah_peserta,
+    jenis_kegiatan(_id) and status_kegiatan(_id) as attributes.
+    """
+    if not is_valid_tile(z, x, y):
+        return HttpResponseBadRequest('Invalid tile coordinates')
+
+    response = HttpResponse(get_tile(z, x, y), content_type='application/vnd.mapbox-vector-tile')
+    response['Cache-Control'] = 'public, max-age=300'
+    return response
@@ -0,0 +1,142 @@
+"""
+Mapbox Vector Tiles for Kegiatan points, rendered by PostGIS (ST_AsMVT)
+and kept in a bounded cache that is invalidated per tile on writes.
+
+The 'tiles' cache is shared between processes (file/Redis), so a write
+handled by one worker, or a status roll-over run by the scheduler, drops
+the tiles every worker serves.
+"""
+import math
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+
+TILE_EXTENT = 4096
+TILE_BUFFER = 256
+MAX_LATITUDE = 85.0511287798
+
+TILE_SQL = """
+WITH bounds AS (
+    SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS tile,
+           ST_Transform(ST_TileEnvelope(%(z)s, %(x)s, %(y)s, margin => %(margin)s), 4326) AS area
+),
+features AS (
+    SELECT ST_AsMVTGeom(ST_Transform(k.lokasi, 3857), bounds.tile, %(extent)s, %(buffer)s, true) AS geom,
+           k.id,
+           k.nama,
+           k.tanggal::text AS tanggal,
+           k.jumlah_peserta,
+           k.jenis_kegiatan_id,
+           jk.nama AS jenis_kegiatan,
+           k.status_kegiatan_id,
+           sk.nama AS status_kegiatan
+    FROM kegiatan k
+    JOIN jenis_kegiatan jk ON jk.id = k.jenis_kegiatan_id
+    JOIN status_kegiatan sk ON sk.id = k.status_kegiatan_id
+    CROSS JOIN bounds
+    WHERE k.lokasi && bounds.area
+)
+SELECT ST_AsMVT(features, 'kegiatan', %(extent)s, 'geom', 'id') FROM features
+"""
+
+
+def max_zoom():
+    return getattr(settings, 'KEGIATAN_TILE_MAX_ZOOM', 22)
+
+
+def is_valid_tile(z, x, y):
+    if not (0 <= z <= max_zoom()):
+        return False
+    n = 2 ** z
+    return 0 <= x < n and 0 <= y < n
+
+
+def render_tile(z, x, y):
+    """Return the MVT bytes for tile z/x/y (empty bytes if no features)."""
+    with connection.cursor() as cursor:
+        cursor.execute(TILE_SQL, {
+            'z': z, 'x': x, 'y': y,
+            'margin': TILE_BUFFER / TILE_EXTENT,
+            'extent': TILE_EXTENT,
+            'buffer': TILE_BUFFER,
+        })
+        row = cursor.fetchone()
+    return bytes(row[0]) if row and row[0] else b''
+
+
+# -- Cache --------------------------------------------------------------
+
+def _cache():
+    return caches['tiles']
+
+
+VERSION_KEY = 'kegiatan-tile:version'
+
+
+def _version():
+    # Lives next to the tiles so every process sees the same one. A random
+    # token rather than a counter: if it is culled a fresh one is generated
+    # and the old tiles simply become unreachable.
+    return _cache().get_or_set(VERSION_KEY, lambda: uuid.uuid4().hex, timeout=None)
+
+
+def _key(z, x, y, version=None):
+    return f'kegiatan-tile:{version or _version()}:{z}:{x}:{y}'
+
+
+def get_tile(z, x, y):
+    """Cached tile bytes, rendering and storing them on a miss."""
+    key = _key(z, x, y)
+    tile = _cache().get(key)
+    if tile is None:
+        tile = render_tile(z, x, y)
+        _cache().set(key, tile)
+    return tile
+
+
+def tiles_for_point(lng, lat):
+    """
+    Yield every (z, x, y) whose buffered tile area contains the point,
+    i.e. every cached tile in which this point may be drawn.
+    """
+    lat = max(min(lat, MAX_LATITUDE), -MAX_LATITUDE)
+    lat_rad = math.radians(lat)
+    buffer_ratio = TILE_BUFFER / TILE_EXTENT
+
+    for z in range(max_zoom() + 1):
+        n = 2 ** z
+        fx = (lng + 180.0) / 360.0 * n
+        fy = (1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n
+        x = min(max(int(fx), 0), n - 1)
+        y = min(max(int(fy), 0), n - 1)
+
+        xs = {x}
+        ys = {y}
+        if fx - x < buffer_ratio and x > 0:
+            xs.add(x - 1)
+        if x + 1 - fx < buffer_ratio and x < n - 1:
+            xs.add(x + 1)
+        if fy - y < buffer_ratio and y > 0:
+            ys.add(y - 1)
+        if y + 1 - fy < buffer_ratio and y < n - 1:
+            ys.add(y + 1)
+
+        for tx in xs:
+            for ty in ys:
+                yield z, tx, ty
+
+
+def invalidate_point(point):
+    """Drop the cached tiles that can contain ``point`` (a GEOS Point)."""
+    if point is None:
+        return
+    version = _version()
+    keys = [_key(z, x, y, version) for z, x, y in tiles_for_point(point.x, point.y)]
+    _cache().delete_many(keys)
+
+
+def invalidate_all():
+    """Invalidate every cached tile, e.g. after a jenis/status rename."""
+    _cache().set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
@@ -0,0 +1,243 @@
+"""
+Streaming uploads straight into S3.
+
+S3MultipartUploadHandler forwards request body chunks to S3 as they arrive
+(one put_object for small files, a multipart upload otherwise), so an upload
+is never buffered whole in memory or written to a temp file: peak memory per
+upload is one part. The view receives an S3UploadedFile pointing at a
+staging key under <AWS_S3_PREFIX>/incoming/, which it copies server-side to
+the final key. The SHA-256 of the bytes is computed on the way through so
+the final key can be content-addressed (see content_store).
+
+boto3 is imported lazily so upload_views can still report a missing boto3.
+"""
+import hashlib
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.http.multipartparser import MultiPartParser as DjangoMultiPartParser
+from django.http.multipartparser import MultiPartParserError
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_CONTENT_TYPES = ['image/jpeg', 'image/jpg', 'image/png', 'image/webp']
+MAX_UPLOAD_SIZE = 5 * 1024 * 1024  # 5MB
+
+CONTENT_TYPE_EXTENSIONS = {
+    'image/jpeg': 'jpg',
+    'image/jpg': 'jpg',
+    'image/png': 'png',
+    'image/webp': 'webp',
+}
+
+# S3 requires every multipart part except the last to be >= 5MB
+PART_SIZE = max(getattr(settings, 'AWS_S3_UPLOAD_PART_SIZE', 5 * 1024 * 1024), 5 * 1024 * 1024)
+
+STAGING_FOLDER = 'incoming'
+
+
+def looks_like_image(head):
+    """Check the file signature (JPEG, PNG or WEBP) of the first bytes."""
+    return (
+        head.startswith(b'\xff\xd8\xff')
+        or head.startswith(b'\x89PNG\r\n\x1a\n')
+        or (head[:4] == b'RIFF' and head[8:12] == b'WEBP')
+    )
+
+
+class S3UploadedFile(UploadedFile):
+    """
+    An uploaded file whose bytes already live in S3 at ``s3_key``.
+    Reading it streams the object back, so callers that only need to
+    place it (copy_object) never touch the bytes.
+    """
+
+    def __init__(self, s3_key, name, content_type, size, sha256=None, charset=None, content_type_extra=None):
+        super().__init__(None, name, content_type, size, charset, content_type_extra)
+        self.s3_key = s3_key
+        self.sha256 = sha256
+
+    def _body(self):
+        if self.file is None:
+            from .storage_backends import get_s3_client
+            self.file = get_s3_client().get_object(
+                Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=self.s3_key
+            )['Body']
+        return self.file
+
+    def open(self, mode=None):
+        return self
+
+    def read(self, *args, **kwargs):
+        return self._body().read(*args, **kwargs)
+
+    def chunks(self, chunk_size=None):
+        yield from self._body().iter_chunks(chunk_size or self.DEFAULT_CHUNK_SIZE)
+
+    def multiple_chunks(self, chunk_size=None):
+        return self.size > (chunk_size or self.DEFAULT_CHUNK_SIZE)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class S3MultipartUploadHandler(FileUploadHandler):
+    """
+    Pipe each uploaded file into S3 while the request body is read.
+    Files that fail validation (content type, signature, size) are aborted
+    in S3, skipped, and reported in ``self.errors``.
+    """
+
+    def __init__(self, request=None, max_size=MAX_UPLOAD_SIZE):
+        super().__init__(request)
+        self.max_size = max_size
+        self.errors = []
+        self._reset()
+
+    def _reset(self):
+        self.s3_key = None
+        self.upload_id = None
+        self.parts = []
+        self.buffer = bytearray()
+        self.received = 0
+        self.checked_signature = False
+        self.sha256 = hashlib.sha256()
+
+    @property
+    def s3_client(self):
+        from .storage_backends import get_s3_client
+        return get_s3_client()
+
+    @property
+    def bucket_name(self):
+        return settings.AWS_STORAGE_BUCKET_NAME
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self._reset()
+        if self.content_type not in ALLOWED_CONTENT_TYPES:
+            self._fail('Invalid file type. Only JPEG, PNG, and WEBP allowed.')
+        self.s3_key = f"{settings.AWS_S3_PREFIX}/{STAGING_FOLDER}/{uuid.uuid4().hex}"
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.checked_signature:
+            self.checked_signature = True
+            if not looks_like_image(raw_data[:12]):
+                self._fail('Invalid file type. Only JPEG, PNG, and WEBP allowed.')
+
+        self.received += len(raw_data)
+        if self.received > self.max_size:
+            self._fail(f'File too large. Maximum size is {self.max_size // (1024 * 1024)}MB.')
+
+        self.sha256.update(raw_data)
+        self.buffer += raw_data
+        while len(self.buffer) >= PART_SIZE:
+            self._upload_part(bytes(self.buffer[:PART_SIZE]))
+            del self.buffer[:PART_SIZE]
+        return None
+
+    def file_complete(self, file_size):
+        if self.upload_id is None:
+            # Fits in one part: a single PUT, no multipart bookkeeping
+            self.s3_client.put_object(
+                Bucket=self.bucket_name,
+                Key=self.s3_key,
+                Body=bytes(self.buffer),
+                ContentType=self.content_type,
+            )
+        else:
+            if self.buffer:
+                self._upload_part(bytes(self.buffer))
+            self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=self.s3_key,
+                UploadId=self.upload_id,
+                MultipartUpload={'Parts': self.parts},
+            )
+
+        uploaded = S3UploadedFile(
+            s3_key=self.s3_key,
+            name=self.file_name,
+            content_type=self.content_type,
+            size=file_size,
+            sha256=self.sha256.hexdigest(),
+            charset=self.charset,
+            content_type_extra=self.content_type_extra,
+        )
+        self._reset()
+        return uploaded
+
+    def upload_interrupted(self):
+        self._abort()
+
+    def _upload_part(self, data):
+        if self.upload_id is None:
+            self.upload_id = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=self.s3_key,
+                ContentType=self.content_type,
+            )['UploadId']
+        part_number = len(self.parts) + 1
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket_name,
+            Key=self.s3_key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=data,
+        )
+        self.parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+
+    def _abort(self):
+        if self.upload_id is not None:
+            try:
+                self.s3_client.abort_multipart_upload(
+                    Bucket=self.bucket_name, Key=self.s3_key, UploadId=self.upload_id
+                )
+            except Exception:
+                logger.warning("Could not abort S3 multipart upload of %s", self.s3_key, exc_info=True)
+        self._reset()
+
+    def _fail(self, message):
+        self._abort()
+        self.errors.append(message)
+        raise SkipFile(message)
+
+
+def s3_uploads_enabled():
+    return bool(settings.AWS_ACCESS_KEY_ID and settings.AWS_SECRET_ACCESS_KEY)
+
+
+class S3MultiPartParser(MultiPartParser):
+    """
+    multipart/form-data parser that streams files into S3 through
+    S3MultipartUploadHandler. Falls back to Django's default handlers when
+    S3 is not configured (local development).
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if not s3_uploads_enabled():
+            return super().parse(stream, media_type, parser_context)
+
+        parser_context = parser_context or {}
+        request = parser_context['request']
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        meta = request.META.copy()
+        meta['CONTENT_TYPE'] = media_type
+
+        handler = S3MultipartUploadHandler(request._request)
+        try:
+            parser = DjangoMultiPartParser(meta, stream, [handler], encoding)
+            data, files = parser.parse()
+        except MultiPartParserError as exc:
+            raise ParseError('Multipart form parse error - %s' % str(exc))
+
+        if handler.errors:
+            raise ParseError(handler.errors[0])
+        return DataAndFiles(data, files)
@@ -1,42 +1,97 @@
 """               
 API Views for S3 file upload
 """
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, parser_classes
 from rest_framework.response import Response
 from rest_framework import status
 from django.conf import settings
+from django.core import signing
+from django.db import connection, transaction
+import re
 import uuid
 from datetime import datetime
 import traceback
 
 try:
-    import boto3
     from botocore.exceptions import ClientError
+    from .content_store import store_staged
+    from .storage_backends import get_s3_client, key_url
     BOTO3_AVAILABLE = True
 except ImportError:
     BOTO3_AVAILABLE = False
 
+from .upload_handlers import (
+    ALLOWED_CONTENT_TYPES, CONTENT_TYPE_EXTENSIONS, MAX_UPLOAD_SIZE, S3MultiPartParser
+)
 
-@api_view(['POST'])
-def upload_to_s3(request):
-    """
-    Upload file to S3 bucket
-    Expects: multipart/form-data with 'file' field
-    Returns: URL of uploaded file
-    """
-    # Check if boto3 is available
+ALLOWED_FOLDERS = ['kegiatan', 'resep', 'pengurus']
+
+# Presigned POST lifetime, and how long after that a confirm is accepted
+PRESIGN_EXPIRES = 15 * 60
+PRESIGN_TOKEN_MAX_AGE = PRESIGN_EXPIRES + 60 * 60
+PRESIGN_TOKEN_SALT = 'dhaharan.upload.presign'
+
+
+def s3_unavailable_response():
+    """Error response if S3 uploads cannot work in this environment, else None."""
     if not BOTO3_AVAILABLE:
         return Response(
             {'error': 'boto3 library not installed. Please run: pip install boto3'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
-    
-    # Check if AWS credentials are configured
     if not settings.AWS_ACCESS_KEY_ID or not settings.AWS_SECRET_ACCESS_KEY:
         return Response(
             {'error': 'AWS credentials not configured. Please set AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY in .env'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+    return None
+
+
+def build_object_name(folder, file_name, title_prefix='', content_type=None):
+    """
+    Object name relative to AWS_S3_PREFIX, e.g. 'kegiatan/20260101_120000_ab12cd34.jpg'
+    or 'kegiatan/<title>_ab12cd34_<file name>' when a title prefix is given.
+    Always unique, so two uploads with the same title never overwrite each other.
+    """
+    if folder not in ALLOWED_FOLDERS:
+        folder = 'kegiatan'
+    unique_id = str(uuid.uuid4())[:8]
+
+    if title_prefix and file_name:
+        # Sanitize title and original filename
+        safe_title = re.sub(r'[^a-zA-Z0-9]', '_', title_prefix)
+        safe_filename = re.sub(r'[^a-zA-Z0-9.]', '_', file_name)
+        return f"{folder}/{safe_title}_{unique_id}_{safe_filename}"
+
+    # Generate unique filename
+    if file_name and '.' in file_name:
+        ext = file_name.split('.')[-1]
+    else:
+        ext = CONTENT_TYPE_EXTENSIONS.get(content_type, 'jpg')
+    ext = re.sub(r'[^a-zA-Z0-9]', '', ext) or 'jpg'
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return f"{folder}/{timestamp}_{unique_id}.{ext}"
+
+
+def object_url(s3_key):
+    return key_url(s3_key)
+
+
+@api_view(['POST'])
+@parser_classes([S3MultiPartParser])
+def upload_to_s3(request):
+    """
+    Upload file to S3 bucket
+    Expects: multipart/form-data with 'file' field
+    Returns: URL of uploaded file
+    The body is streamed into a staging object while it is parsed (see
+    upload_handlers) and stored under its content hash: re-uploading an
+    identical file returns the existing URL ('duplicate': true) without
+    copying anything. folder/title then no longer shape the key.
+    """
+    unavailable = s3_unavailable_response()
+    if unavailable:
+        return unavailable
     
     if 'file' not in request.FILES:
         return Response(
@@ -47,78 +102,54 @@ def upload_to_s3(request):
     file = request.FILES['file']
     
     # Validate file type
-    allowed_types = ['image/jpeg', 'image/jpg', 'image/png', 'image/webp']
-    if file.content_type not in allowed_types:
+    if file.content_type not in ALLOWED_CONTENT_TYPES:
         return Response(
             {'error': 'Invalid file type. Only JPEG, PNG, and WEBP allowed.'},
             status=status.HTTP_400_BAD_REQUEST
         )
     
     # Validate file size (5MB max)
-    max_size = 5 * 1024 * 1024  # 5MB
-    if file.size > max_size:
+    if file.size > MAX_UPLOAD_SIZE:
         return Response(
             {'error': 'File too large. Maximum size is 5MB.'},
             status=status.HTTP_400_BAD_REQUEST
         )
     
     try:
-        # Get folder from request, default to 'kegiatan'
-        folder = request.POST.get('folder', 'kegiatan')
-        # Validate folder to prevent directory traversal
-        allowed_folders = ['kegiatan', 'resep', 'pengurus']
-        if folder not in allowed_folders:
-            folder = 'kegiatan'
-
-        # Check for title/prefix
-        title_prefix = request.POST.get('title', '')
-        
-        if title_prefix:
-            import re
-            # Sanitize title
-            safe_title = re.sub(r'[^a-zA-Z0-9]', '_', title_prefix)
-            # Use safe_title as prefix to original filename
-            # Also sanitize original filename
-            safe_filename = re.sub(r'[^a-zA-Z0-9.]', '_', file.name)
-            filename = f"{folder}/{safe_title}_{safe_filename}"
+        duplicate = False
+        if getattr(file, 'sha256', None):
+            # Already streamed to a staging key: content-addressed, no re-upload
+            s3_key, created = store_staged(file)
+            duplicate = not created
         else:
-            # Generate unique filename
-            ext = file.name.split('.')[-1]
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            unique_id = str(uuid.uuid4())[:8]
-            filename = f"{folder}/{timestamp}_{unique_id}.{ext}"
-        
-        # S3 configuration
-        bucket_name = settings.AWS_STORAGE_BUCKET_NAME
-        prefix = settings.AWS_S3_PREFIX
-        s3_key = f"{prefix}/{filename}"
-        
-        # Upload to S3
-        s3_client = boto3.client(
-            's3',
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            region_name=settings.AWS_S3_REGION_NAME
-        )
-        
-        s3_client.upload_fileobj(
-            file,
-            bucket_name,
-            s3_key,
-            ExtraArgs={
-                'ContentType': file.content_type,
-                # Removed ACL - bucket uses Bucket Owner Enforced
-            }
-        )
+            # Folder (default 'kegiatan', validated against traversal) and optional title prefix
+            filename = build_object_name(
+                request.POST.get('folder', 'kegiatan'),
+                file.name,
+                request.POST.get('title', ''),
+            )
+            s3_key = f"{settings.AWS_S3_PREFIX}/{filename}"
+            
+            # Upload to S3 (shared, pooled client)
+            get_s3_client().upload_fileobj(
+                file,
+                settings.AWS_STORAGE_BUCKET_NAME,
+                s3_key,
+                ExtraArgs={
+                    'ContentType': file.content_type,
+                    # Removed ACL - bucket uses Bucket Owner Enforced
+                }
+            )
         
         # Generate URL - gunakan format S3 yang benar
-        file_url = f"https://s3.{settings.AWS_S3_REGION_NAME}.amazonaws.com/{bucket_name}/{s3_key}"
+        file_url = object_url(s3_key)
         
         return Response({
             'url': file_url,
             'filename': file.name,
             'size': file.size,
-            'content_type': file.content_type
+            'content_type': file.content_type,
+            'duplicate': duplicate,
         }, status=status.HTTP_201_CREATED)
         
     except ClientError as e:
@@ -148,3 +179,165 @@ def upload_to_s3(request):
             },
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+
+
+@api_view(['POST'])
+def presign_upload(request):
+    """
+    Step 1 of a direct-to-S3 upload: the client POSTs the file to S3 itself.
+    Expects: {"folder": "kegiatan|resep|pengurus", "content_type": "image/jpeg",
+              "file_name": "foto.jpg" (optional), "title": "..." (optional)}
+    Returns: presigned POST (url + fields) and a token for /upload/confirm/.
+    S3 enforces the content type and the 5MB size limit.
+    """
+    unavailable = s3_unavailable_response()
+    if unavailable:
+        return unavailable
+
+    folder = request.data.get('folder', 'kegiatan')
+    if folder not in ALLOWED_FOLDERS:
+        return Response(
+            {'error': f'Invalid folder. Allowed: {", ".join(ALLOWED_FOLDERS)}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    content_type = request.data.get('content_type')
+    if content_type not in ALLOWED_CONTENT_TYPES:
+        return Response(
+            {'error': 'Invalid file type. Only JPEG, PNG, and WEBP allowed.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    file_name = request.data.get('file_name', '')
+    s3_key = f"{settings.AWS_S3_PREFIX}/{build_object_name(folder, file_name, request.data.get('title', ''), content_type)}"
+
+    try:
+        presigned = get_s3_client().generate_presigned_post(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+            Key=s3_key,
+            Fields={'Content-Type': content_type},
+            Conditions=[
+                {'Content-Type': content_type},
+                ['content-length-range', 1, MAX_UPLOAD_SIZE],
+            ],
+            ExpiresIn=PRESIGN_EXPIRES,
+        )
+    except ClientError as e:
+        print(f"S3 presign error: {str(e)}")
+        return Response(
+            {'error': 'Could not create upload URL', 'details': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+    token = signing.dumps(
+        {'key': s3_key, 'folder': folder, 'file_name': file_name},
+        salt=PRESIGN_TOKEN_SALT,
+    )
+    return Response({
+        'url': presigned['url'],
+        'fields': presigned['fields'],
+        'key': s3_key,
+        'token': token,
+        'expires_in': PRESIGN_EXPIRES,
+    }, status=status.HTTP_201_CREATED)
+
+
+def attached_row(folder, s3_key):
+    """The row an uploaded key is already attached to, or None."""
+    from .models import FotoKegiatan, FotoResep, Pengurus
+
+    if folder == 'kegiatan':
+        return FotoKegiatan.objects.filter(file_path=s3_key[len(settings.AWS_S3_PREFIX) + 1:]).first()
+    if folder == 'resep':
+        return FotoResep.objects.filter(file_path=object_url(s3_key)).first()
+    return Pengurus.objects.filter(photo=object_url(s3_key)).first()
+
+
+@api_view(['POST'])
+def confirm_upload(request):
+    """
+    Step 2 of a direct-to-S3 upload: verify the object and attach it.
+    Expects: {"token": "<from presign>", "target_id": <kegiatan/resep/pengurus id>}
+    Creates a FotoKegiatan / FotoResep, or sets Pengurus.photo, depending on
+    the folder the upload was presigned for.
+
+    Idempotent: a key is attached once. Replaying the token for the same
+    target returns the existing row (200); for another target it is
+    rejected, since rows sharing a key would delete each other's file.
+    """
+    from .models import Kegiatan, FotoKegiatan, Resep, FotoResep, Pengurus
+    from .serializers import FotoKegiatanSerializer, FotoResepSerializer, PengurusSerializer
+
+    unavailable = s3_unavailable_response()
+    if unavailable:
+        return unavailable
+
+    try:
+        payload = signing.loads(request.data.get('token', ''), salt=PRESIGN_TOKEN_SALT, max_age=PRESIGN_TOKEN_MAX_AGE)
+    except signing.SignatureExpired:
+        return Response({'error': 'Upload token expired'}, status=status.HTTP_400_BAD_REQUEST)
+    except signing.BadSignature:
+        return Response({'error': 'Invalid upload token'}, status=status.HTTP_400_BAD_REQUEST)
+
+    s3_key = payload['key']
+    folder = payload['folder']
+    target_id = request.data.get('target_id')
+
+    target_models = {'kegiatan': Kegiatan, 'resep': Resep, 'pengurus': Pengurus}
+    try:
+        target = target_models[folder].objects.get(pk=target_id)
+    except (target_models[folder].DoesNotExist, ValueError, TypeError):
+        return Response(
+            {'error': f'{folder} with id {target_id} not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    try:
+        head = get_s3_client().head_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=s3_key)
+    except ClientError as e:
+        error_code = e.response.get('Error', {}).get('Code', 'Unknown')
+        if error_code in ('404', 'NoSuchKey', 'NotFound'):
+            return Response({'error': 'File has not been uploaded yet'}, status=status.HTTP_400_BAD_REQUEST)
+        print(f"S3 head_object error: {str(e)}")
+        return Response(
+            {'error': f'S3 check failed: {error_code}'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+    # S3 already enforced these through the POST policy; double-check anyway
+    if head.get('ContentType') not in ALLOWED_CONTENT_TYPES or head.get('ContentLength', 0) > MAX_UPLOAD_SIZE:
+        return Response({'error': 'Uploaded file is not an allowed image'}, status=status.HTTP_400_BAD_REQUEST)
+
+    file_name = request.data.get('file_name') or payload.get('file_name') or s3_key.rsplit('/', 1)[-1]
+    context = {'request': request}
+    serializer_classes = {
+        'kegiatan': FotoKegiatanSerializer, 'resep': FotoResepSerializer, 'pengurus': PengurusSerializer,
+    }
+
+    with transaction.atomic():
+        # Concurrent confirms of one key run one after the other
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [s3_key])
+
+        existing = attached_row(folder, s3_key)
+        if existing is not None:
+            owner_id = existing.pk if folder == 'pengurus' else getattr(existing, f'{folder}_id')
+            if owner_id != target.pk:
+                return Response(
+                    {'error': 'Upload already attached to another ' + folder},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            return Response(serializer_classes[folder](existing, context=context).data, status=status.HTTP_200_OK)
+
+        if folder == 'kegiatan':
+            # ImageField stores the name relative to S3Storage's prefix
+            name = s3_key[len(settings.AWS_S3_PREFIX) + 1:]
+            row = FotoKegiatan.objects.create(kegiatan=target, file_path=name, file_name=file_name)
+        elif folder == 'resep':
+            row = FotoResep.objects.create(resep=target, file_path=object_url(s3_key), file_name=file_name)
+        else:
+            target.photo = object_url(s3_key)
+            target.save()
+            row = target
+
+    return Response(serializer_classes[folder](row, context=context).data, status=status.HTTP_201_CREATED)
@@ -7,7 +7,8 @@ from .views import (
     NutrisiResepViewSet, FotoResepViewSet, TipeTransaksiViewSet,
     TransaksiViewSet, PengurusViewSet
 )
-from .upload_views import upload_to_s3
+from .upload_views import upload_to_s3, presign_upload, confirm_upload
+from .tile_views import kegiatan_tile
 from rest_framework.authtoken.views import obtain_auth_token
 
 router = DefaultRouter()
@@ -28,6 +29,9 @@ router.register(r'pengurus', PengurusViewSet, basename='pengurus')
 
 urlpatterns = [
     path('login/', obtain_auth_token, name='api_token_auth'),
+    path('kegiatan/tiles/<int:z>/<int:x>/<int:y>.mvt', kegiatan_tile, name='kegiatan-tile'),
     path('', include(router.urls)),
     path('upload/s3/', upload_to_s3, name='upload-s3'),
+    path('upload/presign/', presign_upload, name='upload-presign'),
+    path('upload/confirm/', confirm_upload, name='upload-confirm'),
 ]
@@ -1,74 +1,358 @@
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.parsers import FormParser, JSONParser
+from django.contrib.gis.db.models.functions import Distance
+from django.contrib.gis.measure import D
 from .models import (
     JenisKegiatan, StatusKegiatan, Kegiatan, FotoKegiatan, Volunteer,
     Resep, BahanResep, StepsResep, TipsResep, NutrisiResep, FotoResep,
     TipeTransaksi, Transaksi, Pengurus
 )
+import hashlib
+import json
 import openpyxl
-from django.http import HttpResponse
+from django.db.models import (
+    Count, ExpressionWrapper, F, FloatField, JSONField, Max, OuterRef, Q, Subquery
+)
+from django.db.models.functions import Cast, Coalesce, JSONObject
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date, quote_etag
 from .serializers import (
     JenisKegiatanSerializer, StatusKegiatanSerializer,
     KegiatanSerializer, KegiatanListSerializer, FotoKegiatanSerializer,
-    VolunteerSerializer, ResepSerializer, ResepListSerializer,
+    VolunteerSerializer, ResepSerializer, ResepListSerializer, ResepSummarySerializer,
+    ResepMatchSerializer,
     BahanResepSerializer, StepsResepSerializer, TipsResepSerializer,
     NutrisiResepSerializer, FotoResepSerializer,
     TipeTransaksiSerializer, TransaksiSerializer,
     PengurusSerializer
 )
+from . import documents, response_cache
+from .pagination import KeysetPagination
+from .ingredients import parse_terms
+from .nutrition import filter_resep, parse_range_params
+from .geo import (
+    cluster_cell_size, cluster_kegiatan, parse_bbox, parse_point,
+    parse_radius_km, parse_zoom, radius_envelope
+)
+from .tasks import auto_complete_past_kegiatan
+from .upload_handlers import S3MultiPartParser
+
+
+GEOJSON_CHUNK_SIZE = 2000
+
+
+def stream_feature_collection(rows):
+    """
+    Yield a GeoJSON FeatureCollection piece by piece from kegiatan rows
+    (as produced by the values_list in KegiatanViewSet.geojson).
+    """
+    yield '{"type":"FeatureCollection","features":['
+    buffer = []
+    first = True
+    for (pk, nama, tanggal, jumlah_peserta, lokasi,
+         jenis_id, jenis_nama, status_id, status_nama) in rows:
+        feature = json.dumps({
+            'type': 'Feature',
+            'id': pk,
+            'geometry': {'type': 'Point', 'coordinates': [lokasi.x, lokasi.y]},
+            'properties': {
+                'nama': nama,
+                'tanggal': tanggal.isoformat(),
+                'jumlah_peserta': jumlah_peserta,
+                'jenis_kegiatan': jenis_id,
+                'jenis_kegiatan_nama': jenis_nama,
+                'status_kegiatan': status_id,
+                'status_kegiatan_nama': status_nama,
+            },
+        }, separators=(',', ':'))
+        buffer.append(feature if first else ',' + feature)
+        first = False
+        if len(buffer) >= 500:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+    yield ']}'
+
+
+class ExpandableQuerysetMixin:
+    """
+    Only join/prefetch the nested relations the serializer will render for
+    this request (see DynamicFieldsMixin.requested_expansions).
+
+    expand_select_related / expand_prefetch_related map an expandable
+    serializer field to the ORM lookup that loads it.
+    """
+    expand_select_related = {}
+    expand_prefetch_related = {}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+        if not hasattr(serializer_class, 'requested_expansions'):
+            return queryset
+
+        expansions = serializer_class.requested_expansions(self.request)
+        select = [lookup for field, lookup in self.expand_select_related.items() if field in expansions]
+        prefetch = [lookup for field, lookup in self.expand_prefetch_related.items() if field in expansions]
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified on list and retrieve, answered before anything is
+    serialized:
+
+    - list: Max(updated_at) and the row count of the filtered queryset
+    - retrieve: the row's updated_at
+
+    plus Max(updated_at) of conditional_dependencies (lookup tables whose
+    names are rendered inline). Child rows (foto, bahan, ...) touch their
+    parent's updated_at, see signals.touch_parent.
+    """
+    conditional_dependencies = ()
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+        stats = queryset.aggregate(last_modified=Max('updated_at'), count=Count('pk'))
+        return self._conditional_response(
+            request, [stats['count']], [stats['last_modified']],
+            lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        updated_at = self.filter_queryset(self.get_queryset()).prefetch_related(None).filter(
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        ).values_list('updated_at', flat=True).first()
+        if updated_at is None:
+            # Let the normal path produce the 404
+            return super().retrieve(request, *args, **kwargs)
+        return self._conditional_response(
+            request, [], [updated_at],
+            lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs),
+        )
 
+    def _conditional_response(self, request, parts, timestamps, build_response):
+        for model in self.conditional_dependencies:
+            timestamps.append(model.objects.aggregate(last_modified=Max('updated_at'))['last_modified'])
+
+        known = [ts for ts in timestamps if ts is not None]
+        last_modified = int(max(known).timestamp()) if known else None
+        etag = quote_etag(hashlib.md5('|'.join(
+            [request.get_full_path()] + [str(p) for p in parts] + [str(ts) for ts in timestamps]
+        ).encode('utf-8')).hexdigest())
+
+        not_modified = get_conditional_response(request._request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        response = build_response()
+        if response.status_code == 200:
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class ResponseCacheMixin:
+    """
+    Cache successful list/retrieve responses (already serialized data) in
+    the 'responses' cache; see response_cache for keys and invalidation.
+    Custom read actions opt in through cached_response().
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(ResponseCacheMixin, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        return self.cached_response(
+            request, lambda: super(ResponseCacheMixin, self).retrieve(request, *args, **kwargs), pk=pk
+        )
 
-class JenisKegiatanViewSet(viewsets.ModelViewSet):
+    def cached_response(self, request, build_response, pk=None):
+        key = response_cache.cache_key(request, self.basename, pk)
+        cached = response_cache.get(key)
+        if cached is not None:
+            return Response(cached)
+
+        response = build_response()
+        if isinstance(response, Response) and response.status_code == 200:
+            response_cache.store(key, response.data)
+        return response
+
+
+class KeysetPaginationMixin:
+    """
+    Opt-in keyset pagination for the list action: requests that carry
+    ?cursor= (empty for the first page) or ?pagination=cursor are paged on
+    keyset_ordering, everything else keeps the default page-number paging.
+    """
+    keyset_ordering = None
+
+    def wants_keyset_pagination(self):
+        params = self.request.query_params
+        return (
+            self.keyset_ordering is not None
+            and self.action == 'list'
+            and ('cursor' in params or params.get('pagination') == 'cursor')
+        )
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator') and self.wants_keyset_pagination():
+            self._paginator = KeysetPagination()
+        return super().paginator
+
+
+class JenisKegiatanViewSet(ConditionalGetMixin, ResponseCacheMixin, viewsets.ModelViewSet):
     queryset = JenisKegiatan.objects.all()
     serializer_class = JenisKegiatanSerializer
 
 
-class StatusKegiatanViewSet(viewsets.ModelViewSet):
+class StatusKegiatanViewSet(ConditionalGetMixin, ResponseCacheMixin, viewsets.ModelViewSet):
     queryset = StatusKegiatan.objects.all()
     serializer_class = StatusKegiatanSerializer
 
 
-class KegiatanViewSet(viewsets.ModelViewSet):
+class KegiatanViewSet(
+    ConditionalGetMixin,
+    ResponseCacheMixin,
+    KeysetPaginationMixin,
+    ExpandableQuerysetMixin,
+    viewsets.ModelViewSet,
+):
     queryset = Kegiatan.objects.all()
+    keyset_ordering = ('-tanggal', '-id')
+    conditional_dependencies = (JenisKegiatan, StatusKegiatan)
+    # When rendered, jenis/status detail come from one JOINed query for the
+    # page and foto from a single prefetch query.
+    expand_select_related = {
+        'jenis_kegiatan_detail': 'jenis_kegiatan',
+        'status_kegiatan_detail': 'status_kegiatan',
+    }
+    expand_prefetch_related = {'foto': 'foto'}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        bbox = getattr(self, 'bbox', None)
+        if bbox is not None:
+            # ST_Intersects against the viewport -> GiST index scan on lokasi
+            queryset = queryset.filter(lokasi__intersects=bbox)
+        return queryset
 
-    def _auto_complete_past_kegiatan(self):
+    def list(self, request, *args, **kwargs):
         """
-        Helper: update status kegiatan menjadi 'Selesai' (id=3)
-        untuk kegiatan yang tanggalnya sudah lewat (timezone Jakarta UTC+7).
+        Optional ?bbox=minx,miny,maxx,maxy (lng/lat) to return only the
+        kegiatan inside the map viewport.
         """
-        from django.utils import timezone
-        from datetime import timedelta, timezone as dt_timezone
+        bbox_param = request.query_params.get('bbox')
+        if bbox_param:
+            try:
+                self.bbox = parse_bbox(bbox_param)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return super().list(request, *args, **kwargs)
 
-        tz_jakarta = dt_timezone(timedelta(hours=7))
-        current_date = timezone.now().astimezone(tz_jakarta).date()
+    @action(detail=False, methods=['get'])
+    def nearby(self, request):
+        """
+        Kegiatan within radius_km of a point, nearest first.
+        Expects: ?lat=-7.79&lng=110.37&radius_km=10
+        """
+        try:
+            point = parse_point(request.query_params.get('lat'), request.query_params.get('lng'))
+            radius_km = parse_radius_km(request.query_params.get('radius_km'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = self.get_queryset().filter(
+            # Index-backed bounding box first, then the exact spherical distance
+            lokasi__intersects=radius_envelope(point, radius_km),
+            lokasi__distance_lte=(point, D(km=radius_km)),
+        ).annotate(
+            distance=Distance('lokasi', point)
+        ).order_by('distance', 'id')
+
+        page = self.paginate_queryset(queryset)
+        items = page if page is not None else list(queryset)
+        data = self.get_serializer(items, many=True).data
+        for item, row in zip(items, data):
+            row['distance_km'] = round(item.distance.km, 3)
+
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
 
-        updated_count = Kegiatan.objects.filter(
-            tanggal__lt=current_date
-        ).exclude(
-            status_kegiatan_id=3
-        ).update(status_kegiatan_id=3)
+    @action(detail=False, methods=['get'])
+    def clusters(self, request):
+        """
+        Grid clusters for the map at a given zoom level.
+        Expects: ?bbox=minx,miny,maxx,maxy&zoom=8
+        Single-kegiatan clusters carry its kegiatan_id.
+        """
+        bbox_param = request.query_params.get('bbox')
+        if not bbox_param:
+            return Response({'error': 'Parameter bbox diperlukan'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            bbox = parse_bbox(bbox_param)
+            zoom = parse_zoom(request.query_params.get('zoom'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        return updated_count, current_date
+        return Response({
+            'zoom': zoom,
+            'cell_size_m': cluster_cell_size(zoom),
+            'clusters': cluster_kegiatan(bbox, zoom),
+        })
 
-    def list(self, request, *args, **kwargs):
+    @action(detail=False, methods=['get'])
+    def geojson(self, request):
         """
-        Override list untuk otomatis update status kegiatan yang sudah lewat
-        setiap kali data kegiatan di-fetch.
+        All kegiatan as one GeoJSON FeatureCollection, streamed from a
+        server-side cursor so memory stays flat regardless of row count.
+        Optional ?bbox=minx,miny,maxx,maxy.
         """
-        try:
-            self._auto_complete_past_kegiatan()
-        except Exception as e:
-            print(f"Error auto-completing kegiatan: {e}")
-        return super().list(request, *args, **kwargs)
+        queryset = Kegiatan.objects.order_by('id')
+        bbox_param = request.query_params.get('bbox')
+        if bbox_param:
+            try:
+                queryset = queryset.filter(lokasi__intersects=parse_bbox(bbox_param))
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = queryset.values_list(
+            'id', 'nama', 'tanggal', 'jumlah_peserta', 'lokasi',
+            'jenis_kegiatan_id', 'jenis_kegiatan__nama',
+            'status_kegiatan_id', 'status_kegiatan__nama',
+        ).iterator(chunk_size=GEOJSON_CHUNK_SIZE)
+
+        response = StreamingHttpResponse(
+            stream_feature_collection(rows),
+            content_type='application/geo+json',
+        )
+        response['Content-Disposition'] = 'inline; filename=kegiatan.geojson'
+        return response
 
     @action(detail=False, methods=['post'])
     def auto_complete(self, request):
         """
         Endpoint manual untuk auto-update status kegiatan.
+        The scheduled run is `manage.py auto_complete_kegiatan --loop`.
         """
         try:
-            updated_count, current_date = self._auto_complete_past_kegiatan()
+            updated_count, current_date = auto_complete_past_kegiatan()
             return Response({
                 'message': f'{updated_count} kegiatan berhasil diupdate ke status Selesai',
                 'updated_count': updated_count,
@@ -81,7 +365,7 @@ class KegiatanViewSet(viewsets.ModelViewSet):
             )
 
     def get_serializer_class(self):
-        if self.action == 'list':
+        if self.action in ('list', 'nearby'):
             return KegiatanListSerializer
         return KegiatanSerializer
     
@@ -121,28 +405,24 @@ class KegiatanViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        deleted_count = 0
         errors = []
-        
+        wanted_ids = []
         for photo_id in photo_ids:
             try:
-                photo = FotoKegiatan.objects.get(id=photo_id, kegiatan=kegiatan)
-                
-                # Delete file from S3
-                if photo.file_path:
-                    try:
-                        storage = photo.file_path.storage
-                        if storage.exists(photo.file_path.name):
-                            storage.delete(photo.file_path.name)
-                    except Exception as e:
-                        errors.append(f"Error deleting file for photo {photo_id}: {str(e)}")
-                
-                # Delete from database
-                photo.delete()
-                deleted_count += 1
-                
-            except FotoKegiatan.DoesNotExist:
+                wanted_ids.append(int(photo_id))
+            except (TypeError, ValueError):
                 errors.append(f"Photo with id {photo_id} not found or doesn't belong to this kegiatan")
+
+        # One query for all photos, one DELETE for the rows
+        photos = list(FotoKegiatan.objects.filter(id__in=wanted_ids, kegiatan=kegiatan))
+        found_ids = {photo.id for photo in photos}
+        for photo_id in wanted_ids:
+            if photo_id not in found_ids:
+                errors.append(f"Photo with id {photo_id} not found or doesn't belong to this kegiatan")
+
+        # Files are queued in the storage outbox by the post_delete signal
+        deleted_count = len(found_ids)
+        FotoKegiatan.objects.filter(id__in=found_ids).delete()
         
         response_data = {
             'deleted_count': deleted_count,
@@ -162,88 +442,35 @@ class KegiatanViewSet(viewsets.ModelViewSet):
         """
         kegiatan = self.get_object()
         
-        # Get all photos for this kegiatan
-        photos = FotoKegiatan.objects.filter(kegiatan=kegiatan)
-        deleted_count = 0
-        errors = []
-        
-        for photo in photos:
-            try:
-                # Delete file from S3
-                if photo.file_path:
-                    try:
-                        storage = photo.file_path.storage
-                        if storage.exists(photo.file_path.name):
-                            storage.delete(photo.file_path.name)
-                    except Exception as e:
-                        errors.append(f"Error deleting file {photo.file_name}: {str(e)}")
-                
-                # Delete from database
-                photo.delete()
-                deleted_count += 1
-                
-            except Exception as e:
-                errors.append(f"Error deleting photo {photo.id}: {str(e)}")
+        # Files are queued in the storage outbox by the post_delete signal
+        deleted_count, _ = FotoKegiatan.objects.filter(kegiatan=kegiatan).delete()
         
         response_data = {
             'message': f'Deleted {deleted_count} photos',
             'deleted_count': deleted_count
         }
         
-        if errors:
-            response_data['errors'] = errors
-        
         return Response(response_data, status=status.HTTP_200_OK)
 
 
-class FotoKegiatanViewSet(viewsets.ModelViewSet):
+class FotoKegiatanViewSet(ConditionalGetMixin, ResponseCacheMixin, viewsets.ModelViewSet):
     queryset = FotoKegiatan.objects.all()
     serializer_class = FotoKegiatanSerializer
-    
-    def perform_create(self, serializer):
-        kegiatan = serializer.validated_data.get('kegiatan')
-        if kegiatan:
-            import re
-            # Sanitize kegiatan nama
-            # Replace spaces with underscore and remove non-alphanumeric chars
-            safe_nama = re.sub(r'[^a-zA-Z0-9]', '_', kegiatan.nama)
-            
-            # Get file from validated data
-            file_obj = serializer.validated_data.get('file_path')
-            if file_obj:
-                # Sanitize original filename
-                safe_filename = re.sub(r'[^a-zA-Z0-9.]', '_', file_obj.name)
-                # Set new name
-                file_obj.name = f"{safe_nama}_{safe_filename}"
-        
-        serializer.save()
-
-    
-    def destroy(self, request, *args, **kwargs):
-        """
-        Override destroy to delete file from S3 before deleting from database
-        """
-        instance = self.get_object()
-        
-        # Delete file from S3 if exists
-        if instance.file_path:
-            try:
-                # Get storage instance and delete from S3
-                storage = instance.file_path.storage
-                if storage.exists(instance.file_path.name):
-                    storage.delete(instance.file_path.name)
-            except Exception as e:
-                # Log error but continue with database deletion
-                print(f"Error deleting file from S3: {str(e)}")
-        
-        # Delete from database
-        self.perform_destroy(instance)
-        return Response(status=status.HTTP_204_NO_CONTENT)
+    # Multipart photo uploads stream straight into S3 (upload_handlers) and
+    # are stored under their content hash, so the upload name is not used
+    parser_classes = [JSONParser, FormParser, S3MultiPartParser]
 
 
-class VolunteerViewSet(viewsets.ModelViewSet):
+class VolunteerViewSet(
+    ConditionalGetMixin,
+    ResponseCacheMixin,
+    ExpandableQuerysetMixin,
+    viewsets.ModelViewSet,
+):
     queryset = Volunteer.objects.all()
     serializer_class = VolunteerSerializer
+    expand_select_related = {'kegiatan_detail': 'kegiatan'}
+    conditional_dependencies = (Kegiatan,)
     
     @action(detail=True, methods=['post'])
     def approve(self, request, pk=None):
@@ -255,115 +482,227 @@ class VolunteerViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def pending(self, request):
-        pending_volunteers = Volunteer.objects.filter(is_approved=False)
+        pending_volunteers = self.get_queryset().filter(is_approved=False)
         serializer = self.get_serializer(pending_volunteers, many=True)
         return Response(serializer.data)
 
 
-class ResepViewSet(viewsets.ModelViewSet):
+class ResepViewSet(
+    ConditionalGetMixin,
+    ResponseCacheMixin,
+    KeysetPaginationMixin,
+    ExpandableQuerysetMixin,
+    viewsets.ModelViewSet,
+):
     queryset = Resep.objects.all()
+    keyset_ordering = ('-created_at', '-id')
+    expand_prefetch_related = {
+        'bahan': 'bahan',
+        'steps': 'steps',
+        'tips': 'tips',
+        'nutrisi': 'nutrisi',
+        'foto': 'foto',
+    }
+    
+    # Columns rendered by ResepSummarySerializer (deskripsi is left out)
+    summary_columns = (
+        'id', 'judul', 'kategori', 'tingkat_kesulitan', 'waktu_memasak',
+        'waktu_persiapan', 'porsi', 'kalori', 'jumlah_bahan', 'created_at', 'updated_at',
+    )
     
     def get_serializer_class(self):
-        if self.action == 'list':
-            return ResepListSerializer
+        if self.action == 'by_bahan':
+            return ResepMatchSerializer
+        if self.action in ('list', 'by_kategori'):
+            # ?fields / ?expand ask for the full shape: nested list serializer
+            params = self.request.query_params if self.request else {}
+            if 'fields' in params or 'expand' in params:
+                return ResepListSerializer
+            return ResepSummarySerializer
         # For retrieve, create, update, partial_update use full serializer
         return ResepSerializer
     
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        nutrisi_ranges = getattr(self, 'nutrisi_ranges', None)
+        if nutrisi_ranges:
+            queryset = filter_resep(queryset, nutrisi_ranges)
+        if issubclass(self.get_serializer_class(), ResepSummarySerializer):
+            queryset = self.summary_queryset(queryset)
+        return queryset
+    
+    def parse_nutrisi_filters(self, request):
+        """
+        Optional ?<kunci>_min= / ?<kunci>_max= range filters, e.g.
+        ?protein_min=10&kalori_max=500 (protein in g, natrium in mg, kalori
+        in kkal; see nutrition.KEY_UNITS). Returns an error response or None.
+        """
+        try:
+            self.nutrisi_ranges = parse_range_params(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return None
+    
+    def list(self, request, *args, **kwargs):
+        error = self.parse_nutrisi_filters(request)
+        if error:
+            return error
+        return super().list(request, *args, **kwargs)
+    
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Served from the materialized ResepDokumen: one primary-key lookup,
+        ETag from the document's updated_at. ?fields / ?expand projections
+        take the regular serializer path.
+        """
+        pk = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        if 'fields' in request.query_params or 'expand' in request.query_params or not str(pk).isdigit():
+            return super().retrieve(request, *args, **kwargs)
+        data = documents.get(int(pk))
+        if data is None:
+            # Let the normal path produce the 404
+            return super().retrieve(request, *args, **kwargs)
+        return self._conditional_response(
+            request, [], [parse_datetime(data['updated_at'])], lambda: Response(data)
+        )
+    
+    def summary_queryset(self, queryset):
+        """Step count and the cover photo as subqueries: one query per page."""
+        jumlah_steps = Coalesce(Subquery(
+            StepsResep.objects.filter(resep=OuterRef('pk')).order_by()
+            .values('resep').annotate(n=Count('id')).values('n')
+        ), 0)
+        cover = FotoResep.objects.filter(resep=OuterRef('pk')).order_by('id').values(data=JSONObject(
+            id='id', file_path='file_path', file_name='file_name', variants='variants',
+            width='width', height='height', placeholder='placeholder',
+        ))[:1]
+        return queryset.only(*self.summary_columns).annotate(
+            jumlah_steps=jumlah_steps,
+            cover=Subquery(cover, output_field=JSONField()),
+        )
+    
     @action(detail=False, methods=['get'])
     def by_kategori(self, request):
+        error = self.parse_nutrisi_filters(request)
+        if error:
+            return error
         kategori = request.query_params.get('kategori', None)
         if kategori:
-            resep = Resep.objects.filter(kategori=kategori)
-            serializer = self.get_serializer(resep, many=True)
-            return Response(serializer.data)
+            resep = self.get_queryset().filter(kategori=kategori)
+            return self.cached_response(
+                request, lambda: Response(self.get_serializer(resep, many=True).data)
+            )
         return Response(
             {'error': 'Parameter kategori diperlukan'},
             status=status.HTTP_400_BAD_REQUEST
         )
+    
+    @action(detail=False, methods=['get'])
+    def by_bahan(self, request):
+        """
+        "Masak apa?": /resep/by_bahan/?bahan=cabe,bawang merah,telur[&min_cocok=2]
+        Recipes ranked by coverage = matched bahan / jumlah_bahan. Names are
+        normalized (ingredients.normalize) and matched with pg_trgm word
+        similarity, so spelling variants still count.
+        """
+        error = self.parse_nutrisi_filters(request)
+        if error:
+            return error
+        terms = parse_terms(request.query_params.get('bahan', ''))
+        if not terms:
+            return Response(
+                {'error': 'Parameter bahan diperlukan (pisahkan dengan koma)'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            min_cocok = max(int(request.query_params.get('min_cocok', 1)), 1)
+        except ValueError:
+            return Response(
+                {'error': 'min_cocok harus berupa angka'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        matches = Q()
+        for term in terms:
+            matches |= Q(nama_normal__trigram_word_similar=term)
+        matched = BahanResep.objects.filter(matches)
+
+        # Candidates come from the trigram index; counts are per recipe
+        cocok = Subquery(
+            matched.filter(resep=OuterRef('pk')).order_by()
+            .values('resep').annotate(n=Count('id')).values('n')
+        )
+        resep = (
+            self.get_queryset()
+            .filter(pk__in=matched.values('resep'), jumlah_bahan__gt=0)
+            .annotate(cocok=cocok)
+            .filter(cocok__gte=min_cocok)
+            .annotate(coverage=ExpressionWrapper(
+                Cast('cocok', FloatField()) / F('jumlah_bahan'), output_field=FloatField()
+            ))
+            .order_by('-coverage', '-cocok', '-id')
+        )
 
+        def build_response():
+            page = self.paginate_queryset(resep)
+            if page is not None:
+                return self.get_paginated_response(self.get_serializer(page, many=True).data)
+            return Response(self.get_serializer(resep, many=True).data)
 
-class BahanResepViewSet(viewsets.ModelViewSet):
+        return self.cached_response(request, build_response)
+
+
+class BahanResepViewSet(ConditionalGetMixin, ResponseCacheMixin, viewsets.ModelViewSet):
     queryset = BahanResep.objects.all()
     serializer_class = BahanResepSerializer
 
 
-class StepsResepViewSet(viewsets.ModelViewSet):
+class StepsResepViewSet(ConditionalGetMixin, ResponseCacheMixin, viewsets.ModelViewSet):
     queryset = StepsResep.objects.all()
     serializer_class = StepsResepSerializer
 
 
-class TipsResepViewSet(viewsets.ModelViewSet):
+class TipsResepViewSet(ConditionalGetMixin, ResponseCacheMixin, viewsets.ModelViewSet):
     queryset = TipsResep.objects.all()
     serializer_class = TipsResepSerializer
 
 
-class NutrisiResepViewSet(viewsets.ModelViewSet):
+class NutrisiResepViewSet(ConditionalGetMixin, ResponseCacheMixin, viewsets.ModelViewSet):
     queryset = NutrisiResep.objects.all()
     serializer_class = NutrisiResepSerializer
 
 
-class FotoResepViewSet(viewsets.ModelViewSet):
+class FotoResepViewSet(ConditionalGetMixin, ResponseCacheMixin, viewsets.ModelViewSet):
     queryset = FotoResep.objects.all()
     serializer_class = FotoResepSerializer
-    
-    def destroy(self, request, *args, **kwargs):
-        """
-        Override destroy to delete file from S3 before deleting from database
-        """
-        instance = self.get_object()
-        
-        # Delete file from S3 if exists
-        if instance.file_path:
-            try:
-                # file_path is now a URL string, extract the S3 key
-                # URL format: https://s3.region.amazonaws.com/bucket/prefix/folder/file.jpg
-                # We need to delete using boto3
-                import boto3
-                from django.conf import settings
-                
-                s3_client = boto3.client(
-                    's3',
-                    aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                    region_name=settings.AWS_S3_REGION_NAME
-                )
-                
-                # Extract key from URL
-                # Example URL: https://s3.ap-southeast-1.amazonaws.com/bucket/dhaharan/resep/file.jpg
-                # Extract: dhaharan/resep/file.jpg
-                url_parts = instance.file_path.split('/')
-                # Find index of bucket name and get everything after it
-                bucket_name = settings.AWS_STORAGE_BUCKET_NAME
-                bucket_index = url_parts.index(bucket_name)
-                s3_key = '/'.join(url_parts[bucket_index + 1:])
-                
-                s3_client.delete_object(Bucket=bucket_name, Key=s3_key)
-                print(f"Deleted file from S3: {s3_key}")
-            except Exception as e:
-                # Log error but continue with database deletion
-                print(f"Error deleting file from S3: {str(e)}")
-        
-        # Delete from database
-        self.perform_destroy(instance)
-        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class TipeTransaksiViewSet(viewsets.ModelViewSet):
+class TipeTransaksiViewSet(ConditionalGetMixin, ResponseCacheMixin, viewsets.ModelViewSet):
     queryset = TipeTransaksi.objects.all()
     serializer_class = TipeTransaksiSerializer
 
 
-class TransaksiViewSet(viewsets.ModelViewSet):
+class TransaksiViewSet(
+    ConditionalGetMixin,
+    ResponseCacheMixin,
+    KeysetPaginationMixin,
+    ExpandableQuerysetMixin,
+    viewsets.ModelViewSet,
+):
     queryset = Transaksi.objects.all()
+    keyset_ordering = ('-tanggal', '-id')
     serializer_class = TransaksiSerializer
+    expand_select_related = {'tipe_transaksi_detail': 'tipe_transaksi'}
+    conditional_dependencies = (TipeTransaksi,)
     
     @action(detail=False, methods=['get'])
     def by_tipe(self, request):
         tipe = request.query_params.get('tipe', None)
         if tipe:
-            transaksi = Transaksi.objects.filter(tipe_transaksi_id=tipe)
-            serializer = self.get_serializer(transaksi, many=True)
-            return Response(serializer.data)
+            transaksi = self.get_queryset().filter(tipe_transaksi_id=tipe)
+            return self.cached_response(
+                request, lambda: Response(self.get_serializer(transaksi, many=True).data)
+            )
         return Response(
             {'error': 'Parameter tipe diperlukan'},
             status=status.HTTP_400_BAD_REQUEST
@@ -371,6 +710,9 @@ class TransaksiViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def summary(self, request):
+        return self.cached_response(request, self._summary)
+
+    def _summary(self):
         from django.db.models import Sum
         total_pemasukan = Transaksi.objects.filter(
             tipe_transaksi__nama='Pemasukan'
@@ -400,7 +742,7 @@ class TransaksiViewSet(viewsets.ModelViewSet):
         default_sheet = workbook.active
         workbook.remove(default_sheet)
         
-        queryset = self.filter_queryset(self.get_queryset()).order_by('-tanggal')
+        queryset = self.filter_queryset(self.get_queryset()).select_related('tipe_transaksi').order_by('-tanggal')
         
         # Group data
         grouped_data = {}
@@ -488,7 +830,7 @@ def parse_group_key(key, group_by):
              return 0
 
 
-class PengurusViewSet(viewsets.ModelViewSet):
+class PengurusViewSet(ConditionalGetMixin, ResponseCacheMixin, viewsets.ModelViewSet):
     queryset = Pengurus.objects.all().order_by('id')
     serializer_class = PengurusSerializer
 
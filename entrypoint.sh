@@ -13,6 +13,9 @@ done
 
 echo "PostgreSQL started"
 
+# Catch up kegiatan statuses that rolled over while we were down (idempotent)
+python manage.py auto_complete_kegiatan || echo "auto_complete_kegiatan failed, continuing"
+
 # Start server langsung tanpa migration dan collectstatic
 echo "Starting server..."
 exec "$@"
\ No newline at end of file